@@ -0,0 +1,29 @@
+import os
+import sys
+import json
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.config import client, embedding_model
+from utils.embedding_builder import embed_in_batches
+from benchmarks.run_benchmark import QUESTIONS_FILE, RECORDED_FILE
+
+# Embeds the benchmark questions once with the configured embedding model and saves them,
+# so the benchmarks can run offline afterwards. Needs the embedding server to be running.
+# Usage: python benchmarks/record_embeddings.py
+
+
+def record_question_embeddings():
+    with open(QUESTIONS_FILE, 'r', encoding='utf-8') as infile:
+        question_sets = json.load(infile)
+    questions = sorted({item['question'] for items in question_sets.values() for item in items})
+
+    vectors = np.asarray(embed_in_batches(questions, client, embedding_model), dtype=np.float32)
+    with open(RECORDED_FILE, 'wb') as outfile:
+        np.savez(outfile, questions=np.asarray(questions, dtype=str), vectors=vectors,
+                 model=np.asarray(embedding_model))
+    print(f"Recorded {len(questions)} question embeddings ({embedding_model}) to {RECORDED_FILE}")
+
+
+if __name__ == "__main__":
+    record_question_embeddings()
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import vector_store
+from utils.vector_store import store_paths, quantized_paths, convert_json_to_store, load_store, save_store
+from utils.vector_search import top_k, top_k_quantized
+from utils.ann_index import ANN_MIN_CHUNKS, DEFAULT_N_PROBE, index_path, build_ivf_index, save_ivf_index, load_ivf_index, search_ivf
+from utils.bm25 import bm25_path, hybrid_search
+from benchmarks.scale_corpus import DEFAULT_NOISE, load_corpus, corpus_file, add_noise
+from server.mock_llm import SETTINGS as MOCK_SETTINGS, embed_text
+
+# Retrieval benchmarks: latency (p50/p99), memory and recall@k of each search backend.
+# Runs offline: the knowledge files and synthetic corpora use their stored vectors, and the
+# labelled questions use embeddings recorded once with benchmarks/record_embeddings.py
+# (without a recording, questions and chunks are embedded with the mock's hashed bag of words).
+#   exact     - float32 matrix product over every chunk (get_vectors_batch)
+#   quantized - int8/float16 scores with float32 rescoring (get_vectors / search_store)
+#   ivf       - approximate IVF search (search_store on large files with an IVF index)
+#   hybrid    - vector + BM25 rank fusion (search_vectors / sql_rag_call with the question text)
+# Usage: python benchmarks/run_benchmark.py --sizes 10000 100000 1000000 --output results.json
+
+BACKENDS = ("exact", "quantized", "ivf", "hybrid")
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "questions.json")
+RECORDED_FILE = os.path.join(os.path.dirname(__file__), "recorded_embeddings.npz")
+TABLE_DESCRIPTIONS_FILE = "knowledge/table_descriptions.json"
+# The quantized backend is off by default in the app (QUANTIZATION), the benchmark measures int8
+vector_store.QUANTIZATION = vector_store.QUANTIZATION or "int8"
+# Queries run before timing, so lazily built indexes are not counted as query latency
+WARMUP_QUERIES = 3
+# Queries run under tracemalloc to measure the peak memory of one search
+MEMORY_QUERIES = 5
+
+
+def _file_mb(*paths):
+    return sum(os.path.getsize(path) for path in paths if path and os.path.exists(path)) / 2**20
+
+
+def index_size_mb(backend, embedding_file):
+    """Size on disk of what a backend reads for its search."""
+    matrix_path, _ = store_paths(embedding_file)
+    codes_path, scales_path = quantized_paths(embedding_file)
+    if backend == "exact":
+        return _file_mb(matrix_path)
+    if backend == "quantized":
+        return _file_mb(codes_path, scales_path)
+    if backend == "ivf":
+        return _file_mb(index_path(embedding_file))
+    return _file_mb(codes_path, scales_path, bm25_path(embedding_file))
+
+
+def search(backend, index_lib, embedding_file, query_vector, query_text, k, ann_index=None, n_probe=DEFAULT_N_PROBE):
+    """Returns the chunk indices found by a backend, best first."""
+    vectors = index_lib['vectors']
+    if backend == "exact":
+        indices, _ = top_k(vectors, query_vector, k)
+    elif backend == "quantized":
+        indices, _ = top_k_quantized(index_lib['quantized'], vectors, query_vector, k)
+    elif backend == "ivf":
+        indices, _ = search_ivf(ann_index, vectors, query_vector, k, n_probe)
+    else:
+        indices, _ = hybrid_search(index_lib, embedding_file, query_vector, query_text, k)
+    return [int(i) for i in indices]
+
+
+def measure(run_query, queries):
+    """
+    Runs every query once and times it.
+
+    Returns:
+        tuple: (results, latencies in ms, peak traced memory of one query in MB)
+    """
+    for query in queries[:WARMUP_QUERIES]:
+        run_query(query)
+
+    tracemalloc.start()
+    peak = 0
+    for query in queries[:MEMORY_QUERIES]:
+        tracemalloc.reset_peak()
+        run_query(query)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(run_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies, peak / 2**20
+
+
+def summarize(corpus, backend, n_chunks, k, latencies, recall, peak_mb, index_mb):
+    return {
+        "corpus": corpus,
+        "backend": backend,
+        "chunks": n_chunks,
+        "k": k,
+        "queries": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall": float(recall),
+        "peak_mb": float(peak_mb),
+        "index_mb": float(index_mb),
+    }
+
+
+def print_row(row):
+    print(f"{row['corpus']:<45} {row['backend']:<10} {row['chunks']:>8} "
+          f"p50 {row['p50_ms']:8.3f} ms  p99 {row['p99_ms']:8.3f} ms  "
+          f"recall@{row['k']} {row['recall']:.3f}  peak {row['peak_mb']:7.1f} MB  index {row['index_mb']:7.1f} MB")
+
+
+def ivf_index_for(embedding_file, vectors):
+    """Loads the IVF index of a store, building it first if needed. Returns (index, build seconds)."""
+    ann_index = load_ivf_index(embedding_file)
+    if ann_index is not None:
+        return ann_index, 0.0
+    start = time.perf_counter()
+    save_ivf_index(build_ivf_index(vectors), embedding_file)
+    return load_ivf_index(embedding_file), time.perf_counter() - start
+
+
+def benchmark_loading(files):
+    """
+    Time to convert a knowledge JSON file into a store, then to open it cold and warm (load_embeddings).
+    Converts a copy in a temporary folder, so the stores and indexes in knowledge/ are left as they are.
+    """
+    rows = []
+    for embedding_file in files:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            copy = shutil.copy(embedding_file, tmp_dir)
+            start = time.perf_counter()
+            convert_json_to_store(copy)
+            convert_ms = (time.perf_counter() - start) * 1000
+
+            vector_store._loaded_stores.clear()
+            start = time.perf_counter()
+            load_store(copy)
+            cold_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            load_store(copy)
+            warm_ms = (time.perf_counter() - start) * 1000
+            vector_store._loaded_stores.clear()
+
+        rows.append({"corpus": embedding_file, "convert_ms": convert_ms, "cold_load_ms": cold_ms, "warm_load_ms": warm_ms})
+        print(f"{embedding_file:<45} convert {convert_ms:9.1f} ms  cold load {cold_ms:8.1f} ms  warm load {warm_ms:6.3f} ms")
+    return rows
+
+
+def _is_relevant(item, index_lib, i):
+    if "expected_name" in item:
+        return index_lib['names'][i].split()[0] == item['expected_name']
+    return item['expected_text'] in index_lib['contents'][i]
+
+
+def mock_embedded_stores(question_sets, tmp_dir):
+    """
+    Embeds the labelled questions and the chunks of their knowledge files with the mock's hashed
+    bag-of-words embedding, for runs without recorded embeddings.
+
+    Returns:
+        tuple: ({question: vector}, {knowledge file: copy in tmp_dir with mock vectors})
+    """
+    dim = MOCK_SETTINGS["embedding_dim"]
+    recorded_vectors, files = {}, {}
+    for embedding_file, items in question_sets.items():
+        with open(embedding_file, 'r', encoding='utf-8') as infile:
+            chunks = json.load(infile)
+        for chunk in chunks:
+            chunk['vector'] = embed_text(chunk['content'], dim)
+        files[embedding_file] = os.path.join(tmp_dir, os.path.basename(embedding_file))
+        save_store(chunks, files[embedding_file])
+        for item in items:
+            recorded_vectors[item['question']] = np.asarray(embed_text(item['question'], dim), dtype=np.float32)
+    return recorded_vectors, files
+
+
+def benchmark_labelled(backends, k):
+    """
+    Recall@k (share of questions with a relevant chunk in the top k) on the labelled question set.
+    The stores are built from copies in a temporary folder, so knowledge/store is left as it is.
+    """
+    with open(QUESTIONS_FILE, 'r', encoding='utf-8') as infile:
+        question_sets = json.load(infile)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if os.path.exists(RECORDED_FILE):
+            with np.load(RECORDED_FILE) as recorded:
+                recorded_vectors = dict(zip(recorded['questions'].tolist(), recorded['vectors']))
+            files = {embedding_file: shutil.copy(embedding_file, tmp_dir) for embedding_file in question_sets}
+            for copy in files.values():
+                convert_json_to_store(copy)
+            label = ""
+        else:
+            print(f"No recorded question embeddings ({RECORDED_FILE}), using mock embeddings: this compares the\n"
+                  f"backends, not the embedding model. Record them once with: python benchmarks/record_embeddings.py")
+            recorded_vectors, files = mock_embedded_stores(question_sets, tmp_dir)
+            label = " (mock)"
+        rows = labelled_rows(question_sets, recorded_vectors, files, label, backends, k)
+        vector_store._loaded_stores.clear()
+    return rows
+
+
+def labelled_rows(question_sets, recorded_vectors, files, label, backends, k):
+    rows = []
+    for corpus, items in question_sets.items():
+        embedding_file = files[corpus]
+        index_lib = load_store(embedding_file)
+        items = [item for item in items if item['question'] in recorded_vectors]
+        # sql_rag_call only uses the best table description
+        set_k = 1 if corpus == TABLE_DESCRIPTIONS_FILE else k
+        queries = [(recorded_vectors[item['question']], item['question']) for item in items]
+        for backend in backends:
+            if backend == "ivf" or (backend == "quantized" and index_lib['quantized'] is None):
+                continue
+            results, latencies, peak_mb = measure(
+                lambda query: search(backend, index_lib, embedding_file, query[0], query[1], set_k), queries)
+            hits = [any(_is_relevant(item, index_lib, i) for i in found) for item, found in zip(items, results)]
+            row = summarize(corpus + label, backend, len(index_lib['contents']), set_k, latencies,
+                            np.mean(hits), peak_mb, index_size_mb(backend, embedding_file))
+            print_row(row)
+            rows.append(row)
+    return rows
+
+
+def benchmark_scale(n_chunks, backends, k, n_queries, noise, n_probe, seed=0):
+    """
+    Latency and recall@k against the exact top k on a synthetic corpus of n_chunks chunks.
+    For hybrid, this recall is only the overlap with the vector ranking (synthetic chunks share
+    the texts of their source chunk); its quality is measured on the labelled questions.
+    """
+    embedding_file = corpus_file(n_chunks)
+    index_lib = load_corpus(n_chunks, noise, seed)
+    vectors = index_lib['vectors']
+
+    rng = np.random.default_rng(seed + 1)
+    sources = rng.integers(0, vectors.shape[0], size=n_queries)
+    query_vectors = add_noise(np.asarray(vectors[np.sort(sources)], dtype=np.float32), noise, rng)
+    queries = [(vector, index_lib['contents'][i]) for vector, i in zip(query_vectors, np.sort(sources))]
+    expected, _ = top_k(vectors, query_vectors, k)
+
+    ann_index = None
+    if "ivf" in backends and n_chunks >= ANN_MIN_CHUNKS:
+        ann_index, build_seconds = ivf_index_for(embedding_file, vectors)
+        if build_seconds:
+            print(f"Built the IVF index of {embedding_file} in {build_seconds:.1f} s")
+
+    rows = []
+    for backend in backends:
+        if backend == "ivf" and ann_index is None:
+            continue
+        results, latencies, peak_mb = measure(
+            lambda query: search(backend, index_lib, embedding_file, query[0], query[1], k, ann_index, n_probe), queries)
+        recall = np.mean([len(set(found) & set(row.tolist())) / k for found, row in zip(results, expected)])
+        row = summarize(embedding_file, backend, n_chunks, k, latencies, recall, peak_mb,
+                        index_size_mb(backend, embedding_file))
+        print_row(row)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval backends (offline).")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[10000, 100000],
+                        help="Synthetic corpus sizes (e.g. 10000 100000 1000000). None to skip.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--k", type=int, default=3, help="Number of results per query (answer_from_knowledge uses 3).")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per synthetic corpus.")
+    parser.add_argument("--noise", type=float, default=DEFAULT_NOISE)
+    parser.add_argument("--n-probe", type=int, default=DEFAULT_N_PROBE)
+    parser.add_argument("--output", help="Write the results as JSON, to compare runs.")
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE, 'r', encoding='utf-8') as infile:
+        knowledge_files = list(json.load(infile))
+
+    print("\n--- Loading (load_embeddings) ---")
+    results = {"loading": benchmark_loading(knowledge_files)}
+    print("\n--- Labelled questions ---")
+    results["labelled"] = benchmark_labelled(args.backends, args.k)
+    print("\n--- Synthetic corpora ---")
+    results["scale"] = []
+    for n_chunks in args.sizes:
+        results["scale"].extend(benchmark_scale(n_chunks, args.backends, args.k, args.queries, args.noise, args.n_probe))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as outfile:
+            json.dump(results, outfile, indent=2)
+        print(f"\nResults written to {args.output}")
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.vector_store import store_paths, load_store
+from utils.knowledge_index import knowledge_topics
+from utils.ingest import StoreWriter
+
+# Synthetic corpus scaler for the retrieval benchmarks.
+# Grows the real knowledge chunks (with their recorded embeddings) to any size: every synthetic
+# chunk is a real chunk's vector plus gaussian noise, so the corpus keeps the clustered shape
+# of real embeddings. Nothing is embedded, so it runs offline.
+# Usage: python benchmarks/scale_corpus.py 10000 100000 1000000
+
+# Standard deviation of the noise added to each vector dimension (before re-normalizing)
+DEFAULT_NOISE = 0.03
+# Contents are shortened to keep the metadata sidecar small for large corpora
+CONTENT_CHARS = 200
+GENERATE_BATCH_SIZE = 8192
+
+
+def corpus_file(n_chunks):
+    """Virtual knowledge file name of a synthetic corpus (its store lives in benchmarks/store/)."""
+    return f"benchmarks/corpus_{n_chunks}.json"
+
+
+def base_corpus():
+    """
+    The real chunks the synthetic corpora are made from (all knowledge topics, in the order of the
+    unified index). Read from the knowledge files as they are, without building any store in knowledge/.
+    """
+    vectors, contents = [], []
+    for topic_file in knowledge_topics().values():
+        if os.path.exists(topic_file):
+            with open(topic_file, 'r', encoding='utf-8') as infile:
+                chunks = json.load(infile)
+            vectors.extend(chunk['vector'] for chunk in chunks)
+            contents.extend(chunk['content'] for chunk in chunks)
+        else:
+            # Ingested documents only have a store
+            matrix_path, meta_path = store_paths(topic_file)
+            vectors.extend(np.load(matrix_path))
+            with open(meta_path, 'r', encoding='utf-8') as infile:
+                contents.extend(json.load(infile)["contents"])
+    return np.asarray(vectors, dtype=np.float32), contents
+
+
+def add_noise(vectors, noise, rng):
+    noisy = vectors + rng.normal(0.0, noise, size=vectors.shape).astype(np.float32)
+    return noisy / np.maximum(np.linalg.norm(noisy, axis=1, keepdims=True), 1e-12)
+
+
+def synthetic_batches(base_vectors, base_contents, n_chunks, noise=DEFAULT_NOISE, seed=0, start=0):
+    """
+    Yields batches of ({'name', 'content', 'tag'}, vector) pairs for chunks start..n_chunks.
+    Each batch is generated from its own seed, so a resumed run produces the same corpus.
+    """
+    first_batch = start // GENERATE_BATCH_SIZE
+    for batch in range(first_batch, (n_chunks + GENERATE_BATCH_SIZE - 1) // GENERATE_BATCH_SIZE):
+        rng = np.random.default_rng([seed, batch])
+        batch_start = batch * GENERATE_BATCH_SIZE
+        size = min(GENERATE_BATCH_SIZE, n_chunks - batch_start)
+        sources = rng.integers(0, len(base_vectors), size=size)
+        vectors = add_noise(base_vectors[sources], noise, rng)
+
+        skip = max(start - batch_start, 0)
+        yield [({
+            "name": f"synthetic_{batch_start + i}",
+            "content": base_contents[source][:CONTENT_CHARS],
+            "tag": str(source),
+        }, vector) for i, (source, vector) in enumerate(zip(sources, vectors)) if i >= skip]
+
+
+def build_corpus(n_chunks, noise=DEFAULT_NOISE, seed=0):
+    """Builds (or resumes building) the synthetic store of n_chunks chunks. Returns its file name."""
+    embedding_file = corpus_file(n_chunks)
+    matrix_path, _ = store_paths(embedding_file)
+    if os.path.exists(matrix_path):
+        return embedding_file
+
+    base_vectors, base_contents = base_corpus()
+    settings = {"n_chunks": n_chunks, "noise": noise, "seed": seed, "base_chunks": len(base_vectors)}
+    writer = StoreWriter(embedding_file, settings)
+    if writer.count:
+        print(f"Resuming {embedding_file} after {writer.count} chunks.")
+    for pairs in synthetic_batches(base_vectors, base_contents, n_chunks, noise, seed, writer.count):
+        writer.append(pairs)
+        print(f"{writer.count} / {n_chunks}")
+    writer.finish()
+    return embedding_file
+
+
+def load_corpus(n_chunks, noise=DEFAULT_NOISE, seed=0):
+    return load_store(build_corpus(n_chunks, noise, seed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build synthetic benchmark corpora from the knowledge files.")
+    parser.add_argument("sizes", nargs="+", type=int, help="Number of chunks of each corpus.")
+    parser.add_argument("--noise", type=float, default=DEFAULT_NOISE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n_chunks in args.sizes:
+        print(f"Built {build_corpus(n_chunks, args.noise, args.seed)}")
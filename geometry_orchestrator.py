@@ -1,11 +1,7 @@
 # d:\01_IAAC\03_aia studio\studioG7copilot\geometry_orchestrator.py
 from sql_calls import get_space_details_as_string, get_dB_schema, format_dB_context, fetch_sql, execute_sql_query
 from llm_calls import suggest_geometric_variations, generate_sql_query, build_answer
-# Ensure the RAG utility is correctly imported based on your project structure.
-# If 'utils' is a direct subdirectory of 'studioG7copilot', this should be:
-# from .utils.rag_utils import sql_rag_call
-# If 'utils' is at the same level as 'studioG7copilot' and your execution path handles it:
-from utils.rag_utils import sql_rag_call
+from utils.table_index import retrieve_tables, select_schema
 import re
 import json 
 import os
@@ -199,7 +195,6 @@ def get_intelligent_geometric_suggestions(space_id: str, resident_key: str) -> s
 
     return suggestions_json_str
 
-TABLE_DESCRIPTIONS_PATH = os.path.join(os.path.dirname(__file__), "knowledge", "table_descriptions.json")
 DB_PATH = os.path.join(os.path.dirname(__file__), "sql", "example.db") # Define DB_PATH consistently
 
 #region
@@ -211,59 +206,14 @@ def process_natural_language_to_sql_answer(user_question: str) -> dict:
     """
     try:
         db_schema = get_dB_schema(DB_PATH)
-        table_names = list(db_schema.keys())
-        explicit_table = None
-        table_description = ""  # Initialize table_description
-
-        # Sort table names by length (longest first) to avoid partial matches
-        table_names_sorted = sorted(table_names, key=len, reverse=True)
-        # Clean question for safer regex matching
-        clean_question = re.sub(r"[\"']", "", user_question.lower())
-
-        for tname in table_names_sorted:
-            if re.search(rf"\b{re.escape(tname.lower())}\b", clean_question):
-                explicit_table = tname
-                break
-
-        if explicit_table:
-            relevant_table = explicit_table
-            print(f"Explicit table found in question: {relevant_table}")
-            # Try to load its description from TABLE_DESCRIPTIONS_PATH
-            if os.path.exists(TABLE_DESCRIPTIONS_PATH):
-                try:
-                    with open(TABLE_DESCRIPTIONS_PATH, 'r', encoding='utf-8') as f:
-                        all_descriptions = json.load(f) # Assumes JSON is a dict {table_name: description}
-                    table_description = all_descriptions.get(relevant_table, "")
-                    if not table_description:
-                        print(f"No specific description found for explicit table '{relevant_table}' in {TABLE_DESCRIPTIONS_PATH}.")
-                    else:
-                        print(f"Loaded description for explicit table '{relevant_table}'.")
-                except Exception as e:
-                    print(f"Error loading or parsing {TABLE_DESCRIPTIONS_PATH}: {e}. Proceeding without explicit table description.")
-                    # table_description remains ""
-            else:
-                print(f"Table descriptions file not found at {TABLE_DESCRIPTIONS_PATH}, cannot load description for explicit table.")
-        else:
-            if not os.path.exists(TABLE_DESCRIPTIONS_PATH):
-                return {"error": f"Table descriptions file not found at {TABLE_DESCRIPTIONS_PATH}"}
-            
-            # sql_rag_call is expected to return a tuple (relevant_table_name_str, table_description_str)
-            # or (None, None) if no good match.
-            rag_result = sql_rag_call(user_question, TABLE_DESCRIPTIONS_PATH, n_results=1)
-            if not rag_result or not rag_result[0]: # Check if rag_result itself or its first element is None/empty
-                 return {"error": "Could not determine a relevant table for the question using RAG."}
-            relevant_table, table_description = rag_result # table_description is set by RAG
-            relevant_table = relevant_table.split()[0].strip() # Assuming format "table_name description..."
-            print(f"Most relevant table via RAG: {relevant_table}")
-
-        if not relevant_table: # Should be caught by RAG check, but as a safeguard
+        # Tables are ranked on their description, their best matching columns and table names
+        # written in the question (utils/table_index.py). Wide tables only keep their most relevant columns.
+        ranked_tables = retrieve_tables(user_question, DB_PATH)
+        filtered_schema, table_description = select_schema(ranked_tables, db_schema)
+        if not filtered_schema:
             return {"error": "No relevant table could be identified for the question."}
+        print(f"Relevant tables: {list(filtered_schema)}")
 
-        table_schema = db_schema.get(relevant_table)
-        if table_schema is None:
-            return {"error": f"Table '{relevant_table}' not found in database schema."}
-        
-        filtered_schema = {relevant_table: table_schema}
         db_context = format_dB_context(DB_PATH, filtered_schema)
 
         current_question_for_llm = user_question # Keep original question for LLM context
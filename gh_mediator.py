@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify
 from server.config import *
 from llm_calls import *
+from utils.llm_transport import chat_completion, stream_chat_completion
+from utils.streaming import wants_stream, sse_response
+from utils.metrics import metrics_response
 #import calls for REASONING ENGINE TESTING
 from llm_reasoning_test import *
 import re
@@ -12,7 +15,6 @@ from llm_negotiation import *
 app = Flask(__name__)
 from PyQt5.QtWidgets import QApplication
 import json
-import requests
 import pandas as pd
 from llm_reasoning_test import load_csvs, explain_activity_for_space
 
@@ -112,10 +114,12 @@ User message: "{message}"
         action = "other"
 
     # 2. Route based on LLM's suggestion
+    # With {"stream": true}, the answer is sent as server-sent events (utils/streaming.py)
+    stream = wants_stream(data)
     if action == "llm_nearby_space_qna":
         # Call your QnA logic
-        result = llm_nearby_space_qna(house_key, message)
-        return jsonify({'result': result, 'params': ''})
+        result = llm_nearby_space_qna(house_key, message, stream=stream)
+        return _chat_reply(result, '', stream)
     elif action == "llm_negotiate":
         # Call your negotiation logic
         llm_input = f"House key: {house_key}\n{message}" if house_key else message
@@ -127,12 +131,24 @@ User message: "{message}"
         result = route_action(action_json)
         response_text = result.get('result', '')
         params_text = result.get('params', '')
-        return jsonify({'result': response_text, 'params': params_text})
+        return _chat_reply(response_text, params_text, stream)
     elif action == "sql_query":
-        answer = answer_user_question(message, db_path="sql/gh_data.db")
-        return jsonify({'result': answer, 'params': ''})
+        answer = answer_user_question(message, db_path="sql/gh_data.db", stream=stream)
+        return _chat_reply(answer, '', stream)
     else:
-        return jsonify({'result': "Sorry, I didn't understand your request.", 'params': ''})
+        return _chat_reply("Sorry, I didn't understand your request.", '', stream)
+
+def _chat_reply(result, params, stream):
+    if not stream:
+        return jsonify({'result': result, 'params': params})
+    if not isinstance(result, str) and not hasattr(result, '__next__'):
+        result = json.dumps(result)
+    return sse_response(result, lambda answer: {'result': answer, 'params': params})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Latency, token and error counts of the LLM calls, per call site (Prometheus text format)
+    return metrics_response()
 
 def run_flask():
     app.run(debug=False, use_reloader=False)  # Run Flask server in a separate thread
@@ -158,7 +174,7 @@ if __name__ == '__main__':
 #Functions
 # Update llm_nearby_space_qna to accept house_key and question as arguments
 
-def llm_nearby_space_qna(house_key, question):
+def llm_nearby_space_qna(house_key, question, stream=False):
     if not house_key or not question:
         return "Missing 'house_key' or 'question' in request."
     try:
@@ -259,16 +275,19 @@ You are a community advisor helping a resident understand the outdoor spaces nea
 - If the question is something else, use your best judgment to answer using all the context above.
 Be concise and use plain language.
 """
-        response = requests.post(
-            "http://localhost:1234/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json={
-                "model": "local-model",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7
-            }
+        # With stream=True the reply is returned as a generator of text pieces
+        if stream:
+            return stream_chat_completion(
+                "llm_nearby_space_qna",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7
+            )
+        response = chat_completion(
+            "llm_nearby_space_qna",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7
         )
-        reply = response.json()["choices"][0]["message"]["content"]
+        reply = response.choices[0].message.content
         return reply
     except Exception as e:
         return f"Error: {str(e)}"
\ No newline at end of file
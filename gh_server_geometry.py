@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify
 from server.config import *
 from llm_calls import *
+from utils.llm_transport import chat_completion
+from utils.structured_output import StructuredOutputError
+from utils.metrics import metrics_response
 import json
 from llm_reasoning_test import *
 import re # Import the regular expression module
@@ -68,17 +71,13 @@ Be concise and use plain language.
 """
 
         # Send to local LLM (LM Studio)
-        response = requests.post(
-            "http://localhost:1234/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json={
-                "model": "local-model",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7
-            }
+        response = chat_completion(
+            "llm_nearby_space_qna",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7
         )
 
-        reply = response.json()["choices"][0]["message"]["content"]
+        reply = response.choices[0].message.content
         return jsonify({"response": reply})
 
     except Exception as e:
@@ -142,49 +141,16 @@ def suggest_geometric_variations_route():
         
         # This functionality comes from get_intelligent_geometric_suggestions in geometry_orchestrator.py
         try:
+            # The suggestions are generated as structured output (utils/structured_output.py):
+            # a JSON object already checked against its schema, so it's only parsed here
             suggestions_json_str = get_intelligent_geometric_suggestions(space_id, resident_key)
-                
-            # Attempt to extract JSON if wrapped in markdown or has leading/trailing text
-            cleaned_json_str = suggestions_json_str # Default to original string
-            # First, try to find JSON wrapped in ```json ... ```
-            match_markdown = re.search(r'```json\s*(\{[\s\S]*?\})\s*```', suggestions_json_str, re.DOTALL)
-            if match_markdown:
-                cleaned_json_str = match_markdown.group(1)
-            else:
-                # If not in markdown, try to find the first occurrence of a JSON object structure
-                # This looks for the first '{' and the last '}' assuming it's a single JSON object
-                match_object = re.search(r'(\{[\s\S]*\})', suggestions_json_str, re.DOTALL)
-                if match_object:
-                    cleaned_json_str = match_object.group(1)
-            
-            # Clean up common LLM-introduced errors in string values:
-            # 1. '\ n' -> '\n' (handles extra space after newline escape)
-            # 2. '\ ' -> ' ' (removes invalid backslash-space escape if it's not part of a valid sequence like \n, \t, \\, \", etc.)
-            #    This is a bit broad, but targets the observed '\ edge_count' issue.
-            #    A more precise regex might be needed if this causes issues with legitimate escaped backslashes.
-            cleaned_json_str = cleaned_json_str.replace('\\ n', '\\n')
-            cleaned_json_str = re.sub(r'\\ (?=[a-zA-Z_])', ' ', cleaned_json_str) # Replace '\ ' with ' ' if followed by a letter or underscore
-
-            # New, more general cleaning for invalid escapes:
-            # This regex looks for a backslash followed by any character that is NOT
-            # one of the valid JSON escape sequence characters (b, f, n, r, t, u, ", \, /).
-            # It replaces "\x" (where x is invalid) with "x".
-            # This aims to fix issues like an erroneous "\=" or "\." etc.
-            cleaned_json_str = re.sub(r'\\([^bfnrtu"\\\/])', r'\1', cleaned_json_str)
-
-            
-            
-            suggestions_data = json.loads(cleaned_json_str) # Parse the cleaned or original string
+            suggestions_data = json.loads(suggestions_json_str)
             return jsonify(suggestions_data), 200
-        except json.JSONDecodeError as e:
-            # Log the raw string and the cleaned attempt
-            app.logger.error(f"JSONDecodeError for space_id {space_id}: {e}. Raw LLM response: >>>{suggestions_json_str}<<< Cleaned attempt: >>>{cleaned_json_str}<<<")
+        except StructuredOutputError as e:
+            app.logger.error(f"Invalid JSON for geometric variations of space_id {space_id}: {e}. Raw LLM response: >>>{e.raw}<<<")
             return jsonify({"error": "Failed to parse LLM response for geometric variations. Output was not valid JSON."}), 500
         except Exception as e:
-            # Log generic errors, including the raw and cleaned strings if available
-            raw_response_for_log = suggestions_json_str if 'suggestions_json_str' in locals() else "Not available"
-            cleaned_response_for_log = cleaned_json_str if 'cleaned_json_str' in locals() else "Not available"
-            app.logger.error(f"Error in geometric suggestions for space_id {space_id}: {str(e)}. Raw LLM response: >>>{raw_response_for_log}<<< Cleaned attempt: >>>{cleaned_response_for_log}<<<")
+            app.logger.error(f"Error in geometric suggestions for space_id {space_id}: {str(e)}")
             return jsonify({"error": f"Failed to suggest geometric variations: {str(e)}"}), 500
     else:
         # Neither 'question' nor 'space_id' was provided
@@ -195,5 +161,10 @@ def suggest_geometric_variations_route():
 
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Latency, token and error counts of the LLM calls, per call site (Prometheus text format)
+    return metrics_response()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify
 from server.config import *
 from llm_calls import *
+from utils.llm_transport import chat_completion, stream_chat_completion
+from utils.streaming import wants_stream, sse_response
+from utils.metrics import metrics_response
 #import calls for REASONING ENGINE TESTING
 from llm_reasoning_test import *
 import re
@@ -235,22 +238,32 @@ Be concise and use plain language.
 """
         })
 
-        response = requests.post(
-            "http://localhost:1234/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json={
-                "model": "local-model",
-                "messages": messages,
-                "temperature": 0.7
-            }
+        # With {"stream": true}, the reply is sent as server-sent events (utils/streaming.py)
+        if wants_stream(data):
+            def remember(reply):
+                history.append({"role": "assistant", "content": reply})
+            return sse_response(
+                stream_chat_completion("llm_nearby_space_qna", messages=messages, temperature=0.7),
+                remember
+            )
+
+        response = chat_completion(
+            "llm_nearby_space_qna",
+            messages=messages,
+            temperature=0.7
         )
 
-        reply = response.json()["choices"][0]["message"]["content"]
+        reply = response.choices[0].message.content
         history.append({"role": "assistant", "content": reply})
         return jsonify({"response": reply})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Latency, token and error counts of the LLM calls, per call site (Prometheus text format)
+    return metrics_response()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,4 +1,7 @@
 from server.config import *
+from utils.llm_transport import chat_completion, stream_chat_completion
+from utils.structured_output import json_completion
+from typing import Iterator
 import re
 import json # Added for json.dumps
 import pandas as pd
@@ -6,8 +9,8 @@ import pandas as pd
 
 # Create a SQL query from user question
 def generate_sql_query(dB_context: str, retrieved_descriptions: str, user_question: str) -> str:
-    response = client.chat.completions.create(
-        model=completion_model,
+    response = chat_completion(
+        "generate_sql_query",
         messages=[
             {
                 "role": "system",
@@ -44,10 +47,8 @@ def generate_sql_query(dB_context: str, retrieved_descriptions: str, user_questi
     return response.choices[0].message.content
 
 # Create a natural language response out of the SQL query and result
-def build_answer(sql_query: str, sql_result: str, user_question: str) -> str:
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
+def build_answer(sql_query: str, sql_result: str, user_question: str, stream: bool = False) -> str | Iterator[str]:
+    messages=[
             {
                 "role": "system",
                 "content":
@@ -70,17 +71,18 @@ def build_answer(sql_query: str, sql_result: str, user_question: str) -> str:
                 Answer:
                 """,
             },
-        ],
-    )
+    ]
+    # With stream=True, a generator of the answer's text pieces is returned instead
+    if stream:
+        return stream_chat_completion("build_answer", messages=messages)
+    response = chat_completion("build_answer", messages=messages)
     return response.choices[0].message.content
 
-def classify_input(message):
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {
-                "role": "system",
-                "content": """
+def _classify_input_messages(message):
+    return [
+        {
+            "role": "system",
+            "content": """
                         Your task is to classify if the user message is related to buildings and architecture or not.
                         Output only the classification string.
                         If it is related, output "True", if not, output "False".
@@ -92,15 +94,26 @@ def classify_input(message):
                         User message: "What is the tallest skyscrapper in the world?"
                         Output: "True"
                         """,
-            },
-            {
-                "role": "user",
-                "content": f"""
+        },
+        {
+            "role": "user",
+            "content": f"""
                         {message}
                         """,
-            },
-        ],
-    )
+        },
+    ]
+
+
+def _is_label(response):
+    # Only "True" or "False" answers are kept in the response cache
+    return (response.choices[0].message.content or "").strip().strip('"') in ("True", "False")
+
+
+# A fixed label per message: answered at temperature 0, and repeated messages from the response cache.
+# Hedged: the chat waits for the label, so a slow backend is raced by a second one
+def classify_input(message):
+    response = chat_completion("classify_input", messages=_classify_input_messages(message),
+                               temperature=0.0, cache=True, cache_if=_is_label, hedge=True)
     return response.choices[0].message.content
 
 
@@ -114,8 +127,8 @@ def fix_sql_query(dB_context: str, user_question: str, atempted_queries: str, ex
 
     queries_exceptions_content = "\n".join(attemptted_entries)
 
-    response = client.chat.completions.create(
-        model=completion_model,
+    response = chat_completion(
+        "fix_sql_query",
         messages=[
             {
                 "role": "system",
@@ -167,6 +180,34 @@ def fix_sql_query(dB_context: str, user_question: str, atempted_queries: str, ex
 
 
 
+# Answer format of suggest_geometric_variations
+GEOMETRIC_VARIATION_TYPES = ["Extend Slab", "Artificial Terrain", "Outdoor Cooking Feature",
+                             "Small Open Pavilion", "Significant Planting", "Water Feature"]
+GEOMETRIC_VARIATIONS_SCHEMA = {
+    "type": "object",
+    "required": ["space_id", "suggestions", "summary_reasoning"],
+    "properties": {
+        "space_id": {"type": "string"},
+        "suggestions": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["variation_type", "variation_name", "description", "reason_for_profile", "estimated_impact"],
+                "properties": {
+                    "variation_type": {"type": "string", "enum": GEOMETRIC_VARIATION_TYPES},
+                    "variation_name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "reason_for_profile": {"type": "string"},
+                    "estimated_impact": {"type": "string"},
+                },
+            },
+        },
+        "summary_reasoning": {"type": "string"},
+    },
+}
+
+
 def suggest_geometric_variations( # type: ignore
     space_id: str, 
     resident_persona: str, 
@@ -187,9 +228,12 @@ def suggest_geometric_variations( # type: ignore
     else:
         processed_space_context_for_prompt = ""
 
-    response = client.chat.completions.create(
-        model=completion_model,
+    # Structured output (utils/structured_output.py): generation stops once the JSON object is complete,
+    # and the object must match GEOMETRIC_VARIATIONS_SCHEMA (raises StructuredOutputError otherwise)
+    variations = json_completion(
+        "suggest_geometric_variations",
         temperature=0.2, # Lowered temperature for more deterministic and rule-adherent JSON output
+        schema=GEOMETRIC_VARIATIONS_SCHEMA,
         messages=[
                 {
                 "role": "system",
@@ -289,4 +333,4 @@ Usability Prediction for this space: {usability_prediction}
             }
         ]
     )
-    return response.choices[0].message.content
\ No newline at end of file
+    return json.dumps(variations, ensure_ascii=False)
\ No newline at end of file
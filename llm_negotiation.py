@@ -1,4 +1,5 @@
 from server.config import *
+from utils.structured_output import json_completion, StructuredOutputError
 import json
 import pandas as pd
 import logging
@@ -217,13 +218,11 @@ if __name__ == "__main__":
     result_multi = route_action(llm_json_multi)
     print(result_multi)
     
-def suggest_actions_from_request(message):
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {
-                "role": "system",
-                "content": """
+def _action_messages(message):
+    return [
+        {
+            "role": "system",
+            "content": """
 You are an assistant that interprets user requests and suggests high-level actions for a smart architecture system.
 
 Given the user's request, output a JSON object with an "action" field (or "actions" if multiple) and any other necessary parameters.
@@ -324,14 +323,36 @@ Response:
 
 Important: Return only a valid JSON object. No extra text.
 """,
-            },
-            {
-                "role": "user",
-                "content": message,
-            },
-        ],
-    )
-    return response.choices[0].message.content
+        },
+        {
+            "role": "user",
+            "content": message,
+        },
+    ]
+
+
+# One action or a list of actions. The action names aren't restricted to ACTION_DISPATCHER:
+# gh_mediator also uses this call to classify the intent of chat messages.
+ACTION_SCHEMA = {
+    "type": "object",
+    "anyOf": [{"required": ["action"]}, {"required": ["actions"]}],
+    "properties": {
+        "action": {"type": "string"},
+        "actions": {"type": "array", "items": {"type": "string"}},
+        "parameters": {"type": "object"},
+    },
+}
+
+
+# Returns the JSON string of the suggested action(s). The answer is read as structured output
+# (utils/structured_output.py): generation stops once the JSON object is complete, and it's checked
+# against ACTION_SCHEMA. If the model gives no valid JSON, its raw answer is returned.
+def suggest_actions_from_request(message):
+    try:
+        return json.dumps(json_completion("suggest_actions_from_request", _action_messages(message), ACTION_SCHEMA))
+    except StructuredOutputError as e:
+        return e.raw
+
 
 def handle_user_request(message):
     try:
@@ -6,7 +6,9 @@ import pandas as pd
 import logging
 import re
 import os
-import requests
+from openai import APITimeoutError
+from utils.llm_transport import chat_completion
+from utils.structured_output import json_completion, StructuredOutputError
 import sqlite3
 
 
@@ -101,23 +103,46 @@ Only return JSON like below. No explanation:
 }}
 """
 
-def call_local_llm(prompt):
+# Answer format of make_prompt (one activity assignment)
+ASSIGNMENT_SCHEMA = {
+    "type": "object",
+    "required": ["parameters"],
+    "properties": {
+        "parameters": {
+            "type": "object",
+            "required": ["id", "activity"],
+            "properties": {"id": {"type": "string"}, "activity": {"type": ["string", "null"]}},
+        },
+        "reasoning": {"type": "string"},
+    },
+}
+
+# With a schema, the answer is read as structured output (utils/structured_output.py): generation
+# stops once the JSON object is complete, the object is checked against the schema, and its JSON
+# string is returned.
+def call_local_llm(prompt, schema=None):
     try:
-        response = requests.post(
-            "http://localhost:1234/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json={
-                "model": "local-model",
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7
-            },
-            timeout=30  # <-- Add timeout here
+        if schema is not None:
+            return json.dumps(json_completion(
+                "call_local_llm",
+                [{"role": "user", "content": prompt}],
+                schema,
+                temperature=0.7,
+                timeout=30
+            ))
+        response = chat_completion(
+            "call_local_llm",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            timeout=30
         )
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.Timeout:
+        return response.choices[0].message.content
+    except APITimeoutError:
         return '{"parameters": {"activity": null}, "reasoning": "LLM request timed out"}'
+    except StructuredOutputError as e:
+        return json.dumps({"parameters": {"activity": None}, "reasoning": f"Invalid LLM output: {e.raw}"})
     except Exception as e:
         return f'{{"parameters": {{"activity": null}}, "reasoning": "LLM error: {str(e)}"}}'
 
@@ -196,7 +221,7 @@ def generate_llm_assignments(output_path="llm_reasoning\llm_assignments.json"):
                     activity_scores[act] = activity_scores.get(act, 0) + score
 
             prompt = make_prompt(row, space_id, activity_scores, residents_summary)
-            llm_response = call_local_llm(prompt)
+            llm_response = call_local_llm(prompt, ASSIGNMENT_SCHEMA)
             print(f"[DEBUG] Response for {space_id}:\n{llm_response}\n")
 
             try:
@@ -3,8 +3,11 @@ from llm_calls import *
 from utils.rag_utils import answer_from_knowledge
 from sql_main import answer_sql_question  
 from question_router import route_question         
+from utils.streaming import wants_stream, sse_response
+from utils.metrics import metrics_response
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import Flask, request, jsonify
 
@@ -18,26 +21,54 @@ def print_answer(label, answer):
     print(answer)
     print("-" * 50)
 
-def answer_general_question(user_message, conversation_history=None):
+def answer_general_question(user_message, conversation_history=None, stream=False):
     if conversation_history is None:
         conversation_history = []
+    # Routing embeds the question and decides on the embedding, only unclear questions go to the LLM router.
+    # The SQL and knowledge pipelines then find the embedding in the embedding cache.
     routed_parts = route_question(user_message)
-    combined_answer = ""
-    for part in routed_parts:
-        destination = part["destination"]
-        part_text = part["text"]
-
-        if destination == "sql":
-            answer = answer_sql_question(part_text)
-            combined_answer += f"\n(SQL Answer for: \"{part_text}\")\n{answer}"
-        elif destination == "knowledge":
-            embedding_file = part.get("embedding_file")
-            answer = answer_from_knowledge(part_text, embedding_file, conversation_history)
-            combined_answer += f"\n(Knowledge Answer for: \"{part_text}\")\n{answer}"
-        else:
-            fallback = "Sorry, I couldn't understand that part."
-            combined_answer += f"\n(Error for: \"{part_text}\")\n{fallback}"
-    return combined_answer.strip()
+    pieces = _general_answer_pieces(routed_parts, conversation_history, stream)
+    # With stream=True the answer is returned as a generator of text pieces, as they are generated
+    if stream:
+        return pieces
+    return "".join(pieces).strip()
+
+def _answer_part(part, conversation_history, stream):
+    destination = part["destination"]
+    if destination == "sql":
+        return answer_sql_question(part["text"], stream=stream)
+    elif destination == "knowledge":
+        embedding_file = part.get("embedding_file")
+        return answer_from_knowledge(part["text"], embedding_file, conversation_history, stream=stream)
+    return "Sorry, I couldn't understand that part."
+
+def _general_answer_pieces(routed_parts, conversation_history, stream):
+    # The parts of a compound question (e.g. a SQL and a knowledge part) don't depend on each other:
+    # the later parts are answered in background threads while the first one is answered (or streamed)
+    # here, so the whole answer takes about as long as its slowest part.
+    pool = ThreadPoolExecutor(max_workers=len(routed_parts) - 1) if len(routed_parts) > 1 else None
+    later_answers = [pool.submit(_answer_part, part, conversation_history, False) for part in routed_parts[1:]]
+    try:
+        for i, part in enumerate(routed_parts):
+            destination = part["destination"]
+            part_text = part["text"]
+            separator = "\n" if i else ""
+
+            if destination == "sql":
+                yield f"{separator}(SQL Answer for: \"{part_text}\")\n"
+            elif destination == "knowledge":
+                yield f"{separator}(Knowledge Answer for: \"{part_text}\")\n"
+            else:
+                yield f"{separator}(Error for: \"{part_text}\")\n"
+            answer = later_answers[i - 1].result() if i else _answer_part(part, conversation_history, stream)
+
+            if isinstance(answer, str):
+                yield answer
+            else:
+                yield from answer
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
 
 # ---- Flask API ----
 app = Flask(__name__)
@@ -51,6 +82,13 @@ def handle_general_question():
         print("Data received:", data)
         user_message = data.get('question', '')
         conv_hist = data.get('conversation_history', [])
+        if wants_stream(data):
+            def complete(answer):
+                conv_hist.append({"role": "user", "content": user_message})
+                conv_hist.append({"role": "assistant", "content": answer})
+                print("Streamed response, elapsed:", time.time() - start, "seconds")
+                return {'conversation_history': conv_hist}
+            return sse_response(answer_general_question(user_message, conv_hist, stream=True), complete)
         answer = answer_general_question(user_message, conv_hist)
         conv_hist.append({"role": "user", "content": user_message})
         conv_hist.append({"role": "assistant", "content": answer})
@@ -85,6 +123,11 @@ def set_geometry():
 def get_geometry():
     return jsonify(geometry_command)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Latency, token and error counts of the LLM calls, per call site (Prometheus text format)
+    return metrics_response()
+
 if __name__ == '__main__':
     # CLI loop (optional, keep if you want both CLI and API)
     # while True:
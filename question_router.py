@@ -1,36 +1,74 @@
+import os
+import re
 import json
-from server.config import client, completion_model
-
-
-def classify_knowledge_topic(user_message):
-    prompt = (
-        "You are a topic classifier for architectural knowledge. "
-        "Given the user question, return ONLY the most relevant topic from this list:\n"
-        "- outdoor comfort research issues\n"
-        "- the rise of co-living\n"
-        "- thermal comfort in semi-outdoor spaces\n"
-        "If none fit, return 'outdoor comfort research issues'.\n"
-        f"User question: {user_message}\n"
-        "Topic:"
-    )
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
-        temperature=0.0,
-        max_tokens=20,
-    )
-    topic = response.choices[0].message.content.strip().lower()
-    topic_to_file = {
-        "outdoor comfort research issues": "knowledge/outdoor comfort research issues.json",
-        "the rise of co-living": "knowledge/the rise of co-living.json",
-        "thermal comfort in semi-outdoor spaces": "knowledge/thermal comfort in semi-outdoor spaces.json"
-    }
-    return topic_to_file.get(topic, "knowledge/outdoor comfort research issues.json")
+import time
+import asyncio
+import sqlite3
+import threading
+import numpy as np
+from server.config import embedding_model, mode
+from utils.llm_transport import chat_completion, async_chat_completion, gather_llm_calls
+from utils.rag_utils import get_embedding, get_embedding_async
+from utils.structured_output import check_json_answer
 
+# Questions are routed in two steps:
+# 1. The embedding router compares the question embedding (which the SQL and knowledge pipelines need
+#    anyway, and is usually cached) with the centroid of the "sql" and of the "knowledge" questions.
+#    This takes well under a millisecond.
+# 2. Only if the question is about as close to both centroids (margin below MIN_ROUTER_MARGIN), the LLM
+#    router decides. Its answer is logged with the question vector (cache/routing_examples.db, per
+#    embedding model) and becomes one more example, so the embedding router learns the questions of
+#    the actual traffic. Answers from the response cache and from the mock server are not learned,
+#    and correct_routing() fixes a wrong label (manual labels are never replaced by the LLM's).
+# Compound questions ("How many apartments have a balcony, and what are the best design strategies?")
+# are first split into their questions, which are routed at the same time. Consecutive questions
+# with the same destination are joined again, so only questions that mix SQL and knowledge get split.
 
-def route_question(user_message):
+# Labelled examples: shown to the LLM router, and the first examples of the embedding router
+ROUTING_EXAMPLES = [
+    ("How many residents are in the building?", "sql"),
+    ("List all apartments with balconies.", "sql"),
+    ("What is the average temperature in outdoor spaces?", "sql"),
+    ("Explain the benefits of co-living.", "knowledge"),
+    ("Describe the design trends for shared kitchens.", "knowledge"),
+    ("How many activity spaces are there in level 1?", "sql"),
+    ("What are the most popular activities in outdoor spaces?", "sql"),
+    ("Why is thermal comfort important?", "knowledge"),
+    ("What are resident persona types?", "sql"),
+    ("List all resident persona types.", "sql"),
+    ("Explain resident persona types.", "knowledge"),
+    ("Describe resident persona types.", "knowledge"),
+]
+DESTINATIONS = ("sql", "knowledge")
+ROUTING_SCHEMA = {
+    "type": "object",
+    "required": ["destination"],
+    "properties": {"destination": {"enum": list(DESTINATIONS)}, "text": {"type": "string"}},
+}
+
+QUESTION_WORDS = r"(?:what|which|how|why|where|who|when|list|explain|describe)\b"
+# Separators of the questions of a compound question: "?" or ";" between sentences, or "." before
+# a new question word, and, within a sentence, "and" or "also" before a new question word
+SENTENCE_SEPARATOR = re.compile(rf"(?<=\?)\s+|\s*;\s*|(?<=\.)\s+(?={QUESTION_WORDS})", re.IGNORECASE)
+QUESTION_JOINER = re.compile(rf",?\s+(?:and|also)\s+(?={QUESTION_WORDS})", re.IGNORECASE)
+# Words both sides of an "and"/"also" need at least to be split, so e.g. "Explain X and how" isn't
+MIN_QUESTION_WORDS = 3
+
+ROUTER_DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "routing_examples.db")
+# Cosine similarity difference between the two centroids below which the LLM router decides
+# (raise it to send more questions to the LLM router)
+MIN_ROUTER_MARGIN = 0.05
+# Logged questions used as examples (the most recent ones)
+MAX_LOGGED_EXAMPLES = 5000
+
+_router_lock = threading.Lock()
+# Embedding router, built on first use: destination -> [sum of the normalized example vectors, count]
+_centroids = None
+_db_ready = False
+
+
+def _routing_messages(user_message):
+    examples = "\n".join(f'Q: "{question}"\nA: "{destination}"' for question, destination in ROUTING_EXAMPLES)
     routing_prompt = f"""
 You are a smart question router for an architectural assistant.
 
@@ -46,72 +84,279 @@ Return only a JSON object like this:
 }}
 
 Examples:
-Q: "How many residents are in the building?"
-A: "sql"
-Q: "List all apartments with balconies."
-A: "sql"
-Q: "What is the average temperature in outdoor spaces?"
-A: "sql"
-Q: "Explain the benefits of co-living."
-A: "knowledge"
-Q: "Describe the design trends for shared kitchens."
-A: "knowledge"
-Q: "How many activity spaces are there in level 1?"
-A: "sql"
-Q: "What are the most popular activities in outdoor spaces?"
-A: "sql"
-Q: "Why is thermal comfort important?"
-A: "knowledge"
-Q: "What are resident persona types?"
-A: "sql"
-Q: "List all resident persona types."
-A: "sql"
-Q: "Explain resident persona types."
-A: "knowledge"
-Q: "Describe resident persona types."
-A: "knowledge"
+{examples}
 
 User question: \"{user_message}\"
 """
 
+    return [{"role": "system", "content": routing_prompt}]
+
+
+def _parse_routing(content):
+    """The destination and text of the LLM router's answer, or None if it isn't valid."""
+    print("LLM routing output:", content.strip())  # For debugging
+    routing_data, error = check_json_answer(content, ROUTING_SCHEMA)
+    if error is not None:
+        print("Routing error:", error)
+        return None
+    # Knowledge questions search the unified index over all topics,
+    # so there's no need to classify the topic first
+    return routing_data["destination"], routing_data.get("text", "").strip()
+
+
+def _valid_routing(response):
+    # Only valid routing answers are kept in the response cache
+    return check_json_answer(response.choices[0].message.content or "", ROUTING_SCHEMA)[1] is None
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(ROUTER_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(ROUTER_DB_PATH, timeout=10)
+    if not _db_ready:
+        # source: "llm" (answer of the LLM router) or "manual" (correct_routing)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS routing_examples ("
+            "question TEXT, embedding_model TEXT, destination TEXT, source TEXT, vector BLOB, created REAL, "
+            "PRIMARY KEY (question, embedding_model))"
+        )
+        conn.commit()
+        _db_ready = True
+    return conn
+
+
+def _logged_examples():
+    """(destination, vector) of the logged questions of the current embedding model, no embedding calls needed."""
+    conn = _connect()
     try:
-        response = client.chat.completions.create(
-            model=completion_model,
-            messages=[
-                {"role": "system", "content": routing_prompt}
-            ],
+        rows = conn.execute(
+            "SELECT destination, vector FROM routing_examples WHERE embedding_model = ? ORDER BY created DESC LIMIT ?",
+            (embedding_model, MAX_LOGGED_EXAMPLES)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(destination, np.frombuffer(vector, dtype=np.float32)) for destination, vector in rows]
+
+
+def _add_example(centroids, vector, destination):
+    centroids[destination][0] = centroids[destination][0] + _unit(vector)
+    centroids[destination][1] += 1
+
+
+def _router():
+    """
+    The centroids of the embedding router, built on first use from ROUTING_EXAMPLES (embedded once,
+    then from the embedding cache) and the stored vectors of the logged questions.
+    """
+    global _centroids
+    with _router_lock:
+        if _centroids is None:
+            start = time.perf_counter()
+            centroids = {destination: [0.0, 0] for destination in DESTINATIONS}
+            examples = [(destination, get_embedding(question)) for question, destination in ROUTING_EXAMPLES]
+            examples += [example for example in _logged_examples() if example[0] in centroids]
+            for destination, vector in examples:
+                _add_example(centroids, vector, destination)
+            _centroids = centroids
+            print(f"Embedding router trained on {len(examples)} questions in {time.perf_counter() - start:.1f}s.")
+        return _centroids
+
+
+def _embedding_route(user_message, vector):
+    """Routes a question on its embedding. Returns the routed parts, or None if the LLM router should decide."""
+    if vector is None:
+        return None
+    try:
+        centroids = _router()
+    except Exception as e:
+        print("Embedding router error:", e)
+        return None
+    start = time.perf_counter()
+    question = _unit(vector)
+    scores = sorted(((float(question @ _unit(total)), destination) for destination, (total, count) in centroids.items()
+                     if count), reverse=True)
+    margin = scores[0][0] - scores[1][0] if len(scores) > 1 else 0.0
+    destination = scores[0][1] if scores else None
+    if margin < MIN_ROUTER_MARGIN:
+        print(f"Embedding router unsure ({destination}, margin {margin:.3f}), asking the LLM router.")
+        return None
+    print(f"Embedding router: {destination} (margin {margin:.3f}) in {(time.perf_counter() - start) * 1000:.2f} ms.")
+    return [{"destination": destination, "text": user_message}]
+
+
+def _log_example(question, vector, destination, source):
+    """Saves a labelled question with its vector. Returns True if it is new (or its label changed)."""
+    vector = np.asarray(vector, dtype=np.float32).tobytes()
+    conn = _connect()
+    try:
+        if source == "manual":
+            changed = conn.execute(
+                "INSERT OR REPLACE INTO routing_examples (question, embedding_model, destination, source, vector, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (question, embedding_model, destination, source, vector, time.time())
+            ).rowcount
+        else:
+            changed = conn.execute(
+                "INSERT OR IGNORE INTO routing_examples (question, embedding_model, destination, source, vector, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (question, embedding_model, destination, source, vector, time.time())
+            ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return bool(changed)
+
+
+def _learn(question, vector, destination, response):
+    """Logs a question routed by the LLM router, and adds it to the embedding router's examples."""
+    # Stored answers were learned when they were new; mock answers would teach mock routing
+    if vector is None or getattr(response, "from_cache", False) or mode == "mock":
+        return
+    try:
+        added = _log_example(question, vector, destination, "llm")
+    except sqlite3.Error as e:
+        print("Routing log error:", e)
+        return
+    with _router_lock:
+        if added and _centroids is not None:
+            _add_example(_centroids, vector, destination)
+
+
+def correct_routing(question, destination):
+    """
+    Labels a question by hand (e.g. one the LLM router got wrong): the label replaces the logged one,
+    is never overwritten by the LLM router, and the embedding router is rebuilt with it.
+    """
+    global _centroids
+    if destination not in DESTINATIONS:
+        raise ValueError(f"destination should be one of {DESTINATIONS}")
+    _log_example(question, get_embedding(question), destination, "manual")
+    with _router_lock:
+        _centroids = None
+
+
+def _llm_routed(response, user_message, vector):
+    routing = _parse_routing(response.choices[0].message.content or "")
+    if routing is None:
+        # fallback: treat whole question as knowledge
+        return [{"destination": "knowledge", "text": user_message}]
+    destination, text = routing
+    _learn(user_message, vector, destination, response)
+    return [{"destination": destination, "text": text or user_message}]
+
+
+def _route_part(user_message):
+    try:
+        vector = get_embedding(user_message)
+    except Exception as e:
+        print("Embedding error:", e)
+        vector = None
+    routed = _embedding_route(user_message, vector)
+    if routed is not None:
+        return routed
+    try:
+        response = chat_completion(
+            "route_question",
+            messages=_routing_messages(user_message),
             temperature=0.0,
-            max_tokens=100
+            max_tokens=100,
+            cache=True,
+            cache_if=_valid_routing,
+            hedge=True
         )
+    except Exception as e:
+        print("Routing error:", e)
+        return [{"destination": "knowledge", "text": user_message}]
+    return _llm_routed(response, user_message, vector)
 
-        content = response.choices[0].message.content.strip()
-        print("LLM routing output:", content)  # For debugging
-        routing_data = json.loads(content)
-
-        destination = routing_data.get("destination", "").strip().lower()
-        text = routing_data.get("text", "").strip()
-
-        if destination == "sql":
-            return [{"destination": "sql", "text": text}]
-        elif destination == "knowledge":
-            embedding_file = classify_knowledge_topic(text)
-            return [{
-                "destination": "knowledge",
-                "text": text,
-                "embedding_file": embedding_file
-            }]
-        else:
-            raise ValueError("Invalid destination in LLM response")
 
-    except (json.JSONDecodeError, ValueError, Exception) as e:
+async def _route_part_async(user_message):
+    try:
+        vector = await get_embedding_async(user_message)
+    except Exception as e:
+        print("Embedding error:", e)
+        vector = None
+    # The embedding router (built on first use) and the routing log use blocking calls and SQLite:
+    # they run in a worker thread, not on the event loop of the other LLM calls
+    loop = asyncio.get_running_loop()
+    routed = await loop.run_in_executor(None, _embedding_route, user_message, vector)
+    if routed is not None:
+        return routed
+    try:
+        response = await async_chat_completion(
+            "route_question",
+            messages=_routing_messages(user_message),
+            temperature=0.0,
+            max_tokens=100,
+            cache=True,
+            cache_if=_valid_routing,
+            hedge=True
+        )
+    except Exception as e:
         print("Routing error:", e)
-        # fallback: treat whole question as knowledge
-        fallback_file = classify_knowledge_topic(user_message)
-        return [{
-            "destination": "knowledge",
-            "text": user_message,
-            "embedding_file": fallback_file
-        }]
+        return [{"destination": "knowledge", "text": user_message}]
+    return await loop.run_in_executor(None, _llm_routed, response, user_message, vector)
+
+
+def _split(text, start, end, separator):
+    # Spans of the non-empty pieces of text[start:end] between the separators
+    spans = []
+    for match in separator.finditer(text, start, end):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, end))
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+
+def question_spans(user_message):
+    """
+    Splits a compound question into its questions.
+
+    Returns:
+        list: (start, end) of each question in user_message, one span for a single question.
+    """
+    spans = []
+    for start, end in _split(user_message, 0, len(user_message), SENTENCE_SEPARATOR):
+        parts = _split(user_message, start, end, QUESTION_JOINER)
+        if any(len(user_message[part_start:part_end].split()) < MIN_QUESTION_WORDS for part_start, part_end in parts):
+            parts = [(start, end)]
+        spans.extend(parts)
+    return spans or [(0, len(user_message))]
+
+
+def _merge_parts(user_message, spans, routed):
+    """Joins consecutive questions with the same destination again, in the user's words."""
+    merged = []
+    for (start, end), parts in zip(spans, routed):
+        destination = parts[0]["destination"]
+        if merged and merged[-1][0] == destination:
+            merged[-1][2] = end
+        else:
+            merged.append([destination, start, end])
+    if len(merged) == 1:
+        return [{"destination": merged[0][0], "text": user_message}]
+    print(f"Compound question split into {len(merged)} parts: {[destination for destination, _, _ in merged]}")
+    return [{"destination": destination, "text": user_message[start:end].strip()} for destination, start, end in merged]
+
+
+def route_question(user_message):
+    """
+    Routes a question to the "sql" or "knowledge" pipeline.
+
+    Returns:
+        list: The parts of the question, [{"destination", "text"}], several for a compound question
+              that mixes both destinations.
+    """
+    spans = question_spans(user_message)
+    if len(spans) == 1:
+        return _route_part(user_message)
+    # The questions are routed at the same time
+    routed = gather_llm_calls(*(_route_part_async(user_message[start:end]) for start, end in spans))
+    return _merge_parts(user_message, spans, routed)
 
 
 # Example usage for testing
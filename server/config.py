@@ -1,12 +1,17 @@
 import random
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from server.keys import *
 
 # Mode
-mode = "local" # "local" or "openai" or "cloudflare"
+mode = "local" # "local" or "openai" or "cloudflare" or "mock" (offline tests with server/mock_llm.py)
 
 # API
 local_client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+# The mock server has its own port and model names, so its answers and vectors never end up in
+# the caches (embeddings, responses, answers, routing) under the names of the real models
+mock_client = OpenAI(base_url="http://localhost:1236/v1", api_key="mock")
+mock_completion_model = "mock-llm"
+mock_embedding_model = "mock-embedding"
 # openai_client = OpenAI(api_key=OPENAI_API_KEY)
 # cloudflare_client = OpenAI(base_url = f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/v1", api_key = CLOUDFLARE_API_KEY)
 
@@ -70,7 +75,49 @@ def api_mode (mode):
     #     embedding_model = openai_embedding_model
 
         return client, completion_model, embedding_model
+    elif mode == "mock":
+        return mock_client, mock_completion_model, mock_embedding_model
     else:
         raise ValueError("Please specify if you want to run local or openai models")
 
-client, completion_model, embedding_model = api_mode(mode)
\ No newline at end of file
+client, completion_model, embedding_model = api_mode(mode)
+
+# Async client on the same server, for the concurrent LLM calls of utils/llm_transport.py
+async_client = AsyncOpenAI(base_url=str(client.base_url), api_key=client.api_key)
+
+# LLM backends: OpenAI-compatible servers serving the same models (chat and embeddings), e.g. two
+# LM Studio instances side by side. Calls go to the least busy healthy one and fail over to another
+# when one stalls or fails; latency-sensitive calls are hedged across them (see utils/llm_transport.py).
+# For a second local server, start one more LM Studio (or llama.cpp, vLLM, ...) and add it here, e.g.
+#   llm_backends = ["http://localhost:1234/v1", "http://localhost:1235/v1"]
+llm_backends = [str(client.base_url)]
+
+# Model tiers: which model, on which servers, answers each LLM call (see utils/llm_transport.py).
+# The short, latency-critical classification calls can go to a small fast model, the long
+# generations stay on the large one. A tier without "base_url" (one server) or "base_urls" (a pool)
+# uses llm_backends.
+# To use a small model, load it in LM Studio (or run a second server) and set its name here, e.g.
+#   "small": {"model": "lmstudio-community/Qwen2.5-1.5B-Instruct-GGUF"},
+#   "small": {"model": "lmstudio-community/Qwen2.5-1.5B-Instruct-GGUF", "base_url": "http://localhost:1235/v1"},
+model_tiers = {
+    "small": {"model": completion_model},
+    "large": {"model": completion_model},
+}
+
+# Tier of each call site (the name the calls pass to the transport). Others use default_tier.
+call_site_tiers = {
+    # Classifiers and routers: a label or a short JSON object
+    "route_question": "small",
+    "classify_input": "small",
+    "suggest_actions_from_request": "small",
+    # Generation
+    "generate_sql_query": "large",
+    "fix_sql_query": "large",
+    "build_answer": "large",
+    "answer_from_knowledge": "large",
+    "rag_answer": "large",
+    "suggest_geometric_variations": "large",
+    "call_local_llm": "large",
+    "llm_nearby_space_qna": "large",
+}
+default_tier = "large"
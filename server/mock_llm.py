@@ -0,0 +1,351 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+import numpy as np
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.context_packer import count_tokens, count_message_tokens
+
+# Offline stand-in for the LM Studio server: speaks the OpenAI chat completions (also streamed)
+# and embeddings API, so the Flask servers and UIs can be run and load tested
+# without a model. Answers are generated by rules from the prompts of this repo:
+#   - route_question / the /chat intent classifier: routing and action JSON from keywords
+#   - generate_sql_query / fix_sql_query: valid SQLite on the tables of the prompt's schema
+#   - suggest_actions_from_request: action JSON with the parameters route_action expects
+#   - make_prompt (llm_reasoning_test.py): assignment JSON for the space, from its predictions
+#   - suggest_geometric_variations: variation JSON with 2 suggestions
+#   - classify_input: "True"; anything else: a fixed text answer
+# Embeddings are hashed bag-of-words vectors: deterministic, and similar texts get similar vectors.
+# Latency and token rate are fixed (no randomness), so throughput tests are reproducible.
+# Usage: set mode = "mock" in server/config.py, then
+#   python -m server.mock_llm --latency 0.3 --tokens-per-second 30 --max-concurrent 1
+# The mock only serves its own model names (MODELS, the ones of the "mock" mode) and runs on its own
+# port, so its answers are never cached under the names of the real models.
+
+MODELS = ("mock-llm", "mock-embedding")
+MOCK_PORT = 1236
+
+SETTINGS = {
+    "latency": 0.2,             # Seconds before the first token
+    "tokens_per_second": 40.0,  # Generation speed once the first token is out
+    "embedding_latency": 0.02,  # Seconds per embeddings request
+    "embedding_dim": 768,       # Same size as nomic-embed-text-v1.5
+    "answer_words": 60,         # Length of the generic text answers
+}
+# Requests generated at the same time (LM Studio runs one at a time, the others wait)
+_slots = threading.BoundedSemaphore(1)
+
+SQL_WORDS = ("how many", "list", "count", "number of", "average", "mean", "total", "which", "show",
+             "what are the", "what is the", "query")
+KNOWLEDGE_WORDS = ("explain", "describe", "why", "strategies", "benefits", "trends", "importance", "how do", "how can")
+ACTION_WORDS = (
+    ("book", "process_booking"),
+    ("swap", "find_profile_swap"),
+    ("summar", "summarize_preferences"),
+    ("assign", "assign_activity"),
+    ("bigger", "change_geometry"),
+    ("enlarge", "change_geometry"),
+    ("geometry", "change_geometry"),
+    ("change", "propose_activity_change"),
+    ("nearby", "get_nearby_activities"),
+    ("around", "get_nearby_activities"),
+    ("suggest", "get_nearby_activities"),
+)
+INTENT_WORDS = (
+    (("hello", "hi ", "how are you", "thanks"), "other"),
+    (("book", "swap", "assign", "bigger", "suggest", "summar", "prefer", "change"), "llm_negotiate"),
+    (("list", "how many", "show", "query", "database", "count"), "sql_query"),
+)
+GENERIC_ANSWER = ("This is an offline test answer from the mock LLM server. It stands in for the real model "
+                  "so the servers can be load tested, and its length and speed are fixed so runs are comparable. ")
+
+app = Flask(__name__)
+
+
+# ---- Prompt parsing ----
+
+def _search(pattern, text, default=""):
+    match = re.search(pattern, text, re.S)
+    return match.group(1).strip() if match else default
+
+
+def _has_any(text, words):
+    text = text.lower()
+    return any(word in text for word in words)
+
+
+def _schema_tables(text):
+    """[(table, [columns])] of the CREATE TABLE statements in a prompt (sql_calls.format_dB_context)."""
+    return [(table, re.findall(r'"([^"]+)"', columns))
+            for table, columns in re.findall(r'CREATE TABLE "([^"]+)" \((.*?)\)\s*\n', text)]
+
+
+def _house_key(text):
+    return _search(r"\b(H\d+)\b", text, "H1")
+
+
+def _activity_list(text):
+    try:
+        value = ast.literal_eval(text)
+        return [str(item) for item in value] if isinstance(value, (list, tuple)) else [str(value)]
+    except (ValueError, SyntaxError):
+        return [item.strip(" '\"") for item in text.strip("[]").split(",") if item.strip(" '\"")]
+
+
+# ---- Responders, one per prompt of the repo ----
+
+def answer_route(system, user):
+    question = _search(r'User question: "(.*?)"\s*$', system, user)
+    destination = "sql" if _has_any(question, SQL_WORDS) and not _has_any(question, KNOWLEDGE_WORDS) else "knowledge"
+    return json.dumps({"destination": destination, "text": question})
+
+
+def answer_intent(system, user):
+    message = _search(r'User message: "(.*?)"\s*$', system, user)
+    action = next((action for words, action in INTENT_WORDS if _has_any(message, words)), "llm_nearby_space_qna")
+    return json.dumps({"action": action, "reasoning": f"Mock classification of: {message[:80]}"})
+
+
+def answer_actions(system, user):
+    action = next((action for word, action in ACTION_WORDS if word in user.lower()), "summarize_preferences")
+    user_id = _house_key(user)
+    space_id = _search(r"\b(O\d+)\b", user, "O1")
+    parameters = {
+        "change_geometry": {"user_id": user_id, "outdoor_id": space_id},
+        "get_nearby_activities": {"user_id": user_id, "distances": ["20m", "50m"]},
+        "propose_activity_change": {"user_id": user_id, "current_activity": "Sunbath", "desired_activity": "Viewpoint"},
+        "find_profile_swap": {"user_id": user_id, "desired_features": ["more green"]},
+        "process_booking": {"user_id": user_id, "desired_activity": "Sports", "current_activity": "Sunbath"},
+        "assign_activity": {"user_id": user_id, "space_id": space_id, "activity": "Sunbath"},
+        "summarize_preferences": {"user_id": user_id},
+    }[action]
+    return json.dumps({"action": action, "parameters": parameters, "reasoning": f"Mock action for: {user[:80]}"})
+
+
+def _sql_for(question, tables):
+    if not tables:
+        return "No information"
+    table, columns = tables[0]
+    mentioned = [column for column in columns if column.lower() in question.lower()]
+    if _has_any(question, ("how many", "count", "number of")):
+        return f'SELECT COUNT(*) FROM "{table}"'
+    if mentioned and _has_any(question, ("average", "mean")):
+        return f'SELECT AVG("{mentioned[0]}") FROM "{table}"'
+    if mentioned:
+        return f'SELECT {", ".join(f"{chr(34)}{column}{chr(34)}" for column in mentioned)} FROM "{table}" LIMIT 20'
+    return f'SELECT * FROM "{table}" LIMIT 10'
+
+
+def answer_sql(system, user):
+    return _sql_for(_search(r"# User question #(.*)", user, user), _schema_tables(system))
+
+
+def answer_fix_sql(system, user):
+    tables = _schema_tables(system)
+    query = f'SELECT * FROM "{tables[0][0]}" LIMIT 10' if tables else "SELECT name FROM sqlite_master LIMIT 10"
+    return f"#Reasoning#: The previous query used names that are not in the schema. #NEW QUERY#: {query}"
+
+
+def answer_sql_result(system, user):
+    question = _search(r"User question:(.*?)\n", user, "your question")
+    result = _search(r"SQL Result:(.*?)\n\s*Answer:", user, "")
+    return f"For \"{question}\", the database returned: {result[:300]}"
+
+
+def answer_assignment(system, user):
+    text = system + user
+    space_id = _search(r"- ID: (\S+)", text) or _search(r'"id": "([^"]+)"', text, "O1")
+    predicted = _activity_list(_search(r"### Threshold-based prediction[^\n]*\n(.*?)\n", text, ""))
+    voted = re.findall(r"^- ([^:\n]+): -?[\d.]+\s*$", text, re.M)
+    activity = next((a for a in voted if a in predicted), None) or (predicted or voted or ["Sitting"])[0]
+    return json.dumps({
+        "parameters": {"id": space_id, "activity": activity},
+        "reasoning": f"{activity} is in the predicted activities of {space_id} and has the highest resident vote among them."
+    }, indent=2)
+
+
+def answer_geometry(system, user):
+    persona = _search(r"Resident Persona \(User Profile\): (.*?)\n", user)
+    return json.dumps({
+        "space_id": _search(r"Space ID: (.*?)\n", user),
+        "space_details": _search(r"Space Details:\n(.*?)\nThreshold Prediction", user),
+        "user_profile": persona,
+        "resident_distance_to_space": _search(r"Resident's Distance to this Space: (.*?)\n", user),
+        "current_activity_in_space": _search(r"Current Activity in this Space: (.*?)\n", user),
+        "suggestions": [
+            {
+                "variation_type": "Significant Planting",
+                "variation_name": "Shade Tree Grove",
+                "description": "Plant three deciduous shade trees along the south edge of the space.",
+                "reason_for_profile": f"Shade and greenery suit {persona or 'the resident'}.",
+                "estimated_impact": "Cooler, greener space"
+            },
+            {
+                "variation_type": "Small Open Pavilion",
+                "variation_name": "Shaded Lounge Pavilion",
+                "description": "Add a timber pavilion covering 30% of the area, used as a shaded lounge.",
+                "reason_for_profile": "Gives a sheltered place to sit close to home.",
+                "estimated_impact": "Creates a new social spot"
+            }
+        ],
+        "summary_reasoning": "Both variations add comfort without reducing the usable area much."
+    })
+
+
+def answer_text(system, user):
+    words = (GENERIC_ANSWER * (SETTINGS["answer_words"] // len(GENERIC_ANSWER.split()) + 1)).split()
+    return " ".join(words[:SETTINGS["answer_words"]])
+
+
+# (text that identifies the prompt, responder): the first match answers
+RESPONDERS = (
+    ("smart question router", answer_route),
+    ("classify the user's message into one of these actions", answer_intent),
+    ("suggests high-level actions", answer_actions),
+    ("You are a SQLite expert", answer_sql),
+    ("#NEW QUERY#", answer_fix_sql),
+    ("answer a user question according to the SQL query", answer_sql_result),
+    ("assigning the best outdoor activity", answer_assignment),
+    ("Only return JSON like below", answer_assignment),
+    ("suggest 2 relevant geometric variations", answer_geometry),
+    ("related to buildings and architecture", lambda system, user: "True"),
+)
+
+
+def generate_answer(messages):
+    system = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    user = "\n".join(m.get("content") or "" for m in messages if m.get("role") != "system")
+    for marker, responder in RESPONDERS:
+        if marker in system or marker in user:
+            return responder(system, user)
+    return answer_text(system, user)
+
+
+def split_tokens(text):
+    """The answer in pieces of about one token (words with their leading whitespace, punctuation)."""
+    return re.findall(r"\s*(?:\w+|[^\w\s])", text)
+
+
+# ---- OpenAI-compatible API ----
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+
+def _usage(messages, answer):
+    prompt_tokens, completion_tokens = count_message_tokens(messages), count_tokens(answer)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _unknown_model(model):
+    # Answering the real models' names would let the caches store mock output under them
+    error = {"message": f"The mock server only serves {', '.join(MODELS)}, not '{model}'. "
+                        "Set mode = \"mock\" in server/config.py.", "type": "invalid_request_error",
+             "code": "model_not_found"}
+    return jsonify({"error": error}), 404
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    data = request.get_json()
+    messages, model = data.get("messages", []), data.get("model", "mock-llm")
+    if model not in MODELS:
+        return _unknown_model(model)
+    pieces = split_tokens(generate_answer(messages))
+    finish_reason = "stop"
+    if data.get("max_tokens") and len(pieces) > data["max_tokens"]:
+        pieces, finish_reason = pieces[:data["max_tokens"]], "length"
+    answer = "".join(pieces).strip()
+    completion_id = "chatcmpl-" + hashlib.sha1(f"{time.time()}{answer}".encode()).hexdigest()[:12]
+    token_seconds = 1 / SETTINGS["tokens_per_second"]
+
+    if data.get("stream"):
+        include_usage = (data.get("stream_options") or {}).get("include_usage")
+
+        def events():
+            with _slots:
+                time.sleep(SETTINGS["latency"])
+                yield f"data: {json.dumps(_chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+                for piece in pieces:
+                    yield f"data: {json.dumps(_chunk(completion_id, model, {'content': piece}))}\n\n"
+                    time.sleep(token_seconds)
+            yield f"data: {json.dumps(_chunk(completion_id, model, {}, finish_reason))}\n\n"
+            if include_usage:
+                yield f"data: {json.dumps(dict(_chunk(completion_id, model, {}), choices=[], usage=_usage(messages, answer)))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+    with _slots:
+        time.sleep(SETTINGS["latency"] + len(pieces) * token_seconds)
+    return jsonify({
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": finish_reason}],
+        "usage": _usage(messages, answer),
+    })
+
+
+@lru_cache(maxsize=50000)
+def _word_vector(word, dim):
+    seed = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def embed_text(text, dim):
+    """Hashed bag-of-words embedding (unit length)."""
+    words = re.findall(r"\w+", text.lower()) or [""]
+    vector = np.sum([_word_vector(word, dim) for word in words], axis=0)
+    return (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+
+
+@app.route('/v1/embeddings', methods=['POST'])
+def embeddings():
+    data = request.get_json()
+    if data.get("model", "mock-embedding") not in MODELS:
+        return _unknown_model(data["model"])
+    texts = data.get("input", [])
+    texts = [texts] if isinstance(texts, str) else texts
+    dim = data.get("dimensions") or SETTINGS["embedding_dim"]
+    with _slots:
+        time.sleep(SETTINGS["embedding_latency"])
+    tokens = sum(count_tokens(text) for text in texts)
+    return jsonify({
+        "object": "list", "model": data.get("model", "mock-embedding"),
+        "data": [{"object": "embedding", "index": i, "embedding": embed_text(text, dim)} for i, text in enumerate(texts)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    })
+
+
+@app.route('/v1/models', methods=['GET'])
+def models():
+    return jsonify({"object": "list", "data": [{"id": model, "object": "model", "owned_by": "mock"} for model in MODELS]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM and embedding server for offline tests.")
+    parser.add_argument("--port", type=int, default=MOCK_PORT, help="The port of the \"mock\" mode of server/config.py.")
+    parser.add_argument("--latency", type=float, default=SETTINGS["latency"], help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=SETTINGS["tokens_per_second"])
+    parser.add_argument("--embedding-latency", type=float, default=SETTINGS["embedding_latency"])
+    parser.add_argument("--embedding-dim", type=int, default=SETTINGS["embedding_dim"])
+    parser.add_argument("--answer-words", type=int, default=SETTINGS["answer_words"],
+                        help="Length of the generic text answers.")
+    parser.add_argument("--max-concurrent", type=int, default=1,
+                        help="Requests generated at the same time, the others wait (LM Studio: 1).")
+    args = parser.parse_args()
+
+    SETTINGS.update(latency=args.latency, tokens_per_second=args.tokens_per_second, embedding_latency=args.embedding_latency,
+                    embedding_dim=args.embedding_dim, answer_words=args.answer_words)
+    _slots = threading.BoundedSemaphore(args.max_concurrent)
+    print(f"Mock LLM server on port {args.port}: {SETTINGS}, max {args.max_concurrent} concurrent requests")
+    app.run(port=args.port, threaded=True)
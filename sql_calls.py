@@ -31,11 +31,13 @@ def get_dB_schema(dB_path):
 # Format dB schema into LLM prompt format
 def format_dB_context(ifc_sql_dB, filtered_dB_schema: str) -> str:
 
-    def fetch_example_rows(db_path, table_name):
+    def fetch_example_rows(db_path, table_name, properties_names):
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        query = f"SELECT * FROM {table_name} ORDER BY RANDOM() LIMIT 3"
+        # Only the columns kept in the filtered schema (wide tables may be narrowed down)
+        columns = ', '.join(f'"{property}"' for property in properties_names)
+        query = f"SELECT {columns} FROM {table_name} ORDER BY RANDOM() LIMIT 3"
         cursor.execute(query)
         rows = cursor.fetchall()
         
@@ -46,7 +48,7 @@ def format_dB_context(ifc_sql_dB, filtered_dB_schema: str) -> str:
     for table_name in filtered_dB_schema:
         properties_names = filtered_dB_schema[table_name]
         formatted_string = ', '.join(f'"{property}"' for property in properties_names)
-        example_rows = fetch_example_rows(ifc_sql_dB, table_name)
+        example_rows = fetch_example_rows(ifc_sql_dB, table_name, properties_names)
         df = pd.DataFrame(example_rows, columns=properties_names)
 
         chunk = f"""CREATE TABLE "{table_name}" ({formatted_string})
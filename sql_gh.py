@@ -1,49 +1,31 @@
 from server.config import *
 from llm_calls import *
 from sql_calls import *
-from utils.rag_utils import sql_rag_call
+from utils.table_index import retrieve_tables, select_schema
 
-def answer_user_question(user_question: str, db_path: str = "sql/gh_data.db") -> str:
+def answer_user_question(user_question: str, db_path: str = "sql/gh_data.db", stream: bool = False) -> str:
     db_schema = get_dB_schema(db_path)
     print("Tables found in schema:", list(db_schema.keys()))
     for table, columns in db_schema.items():
         print(f"Table '{table}' columns: {columns}")
 
-    table_names = list(db_schema.keys())
-    explicit_table = None
+    # --- Retrieve the most relevant tables and columns ---
+    # Tables are ranked on their description, their best matching columns and table names
+    # written in the question. Wide tables only keep their most relevant columns.
+    ranked_tables = retrieve_tables(user_question, db_path)
+    for entry in ranked_tables:
+        print(f"Relevant table: {entry['table']} ({entry['score']:.3f}), columns: {[c for c, _ in entry['columns']]}")
 
-    table_names_sorted = sorted(table_names, key=len, reverse=True)
-    clean_question = re.sub(r"[\"']", "", user_question.lower())
-
-    for tname in table_names_sorted:
-        if re.search(rf"\b{re.escape(tname.lower())}\b", clean_question):
-            explicit_table = tname
-            break
-
-    if explicit_table:
-        relevant_table = explicit_table
-        table_description = ""
-        print(f"Explicit table found in question: {relevant_table}")
-    else:
-        table_descriptions_path = "knowledge/table_descriptions.json"
-        relevant_table, table_description = sql_rag_call(
-            user_question, table_descriptions_path, n_results=1
-        )
-        relevant_table = relevant_table.split()[0].strip()
-        print(f"Most relevant table: {relevant_table}")
-
-    if not relevant_table:
+    filtered_schema, table_description = select_schema(ranked_tables, db_schema)
+    if not filtered_schema:
         print("No relevant table found.")
         return "No relevant table found."
+    relevant_table = next(iter(filtered_schema))
+    print(f"Most relevant table: {relevant_table}")
 
-    table_schema = db_schema.get(relevant_table)
-    if table_schema is None:
-        print(f"Table '{relevant_table}' not found in database schema.")
-        return f"Table '{relevant_table}' not found in database schema."
-    filtered_schema = {relevant_table: table_schema}
     db_context = format_dB_context(db_path, filtered_schema)
 
-    column_names = db_schema[relevant_table]
+    column_names = filtered_schema[relevant_table]
     explicit_column = None
     for cname in column_names:
         if cname.lower() in user_question.lower():
@@ -67,8 +49,10 @@ def answer_user_question(user_question: str, db_path: str = "sql/gh_data.db") ->
         print("SQL query failed or returned no data.")
         return "I'm sorry but I was not able to find any relevant information to answer your question. Please, try again."
 
-    final_answer = build_answer(sql_query, query_result, user_question)
-    print(f"Final Answer: \n {final_answer}")
+    # With stream=True the answer is returned as a generator of text pieces
+    final_answer = build_answer(sql_query, query_result, user_question, stream=stream)
+    if not stream:
+        print(f"Final Answer: \n {final_answer}")
     return final_answer
 
 # Example usage (remove or comment out when importing in gh_server.py)
@@ -1,10 +1,10 @@
 from server.config import *
 from llm_calls import *
 from sql_calls import *
-from utils.rag_utils import sql_rag_call
+from utils.table_index import retrieve_tables, select_schema
 import re
 
-def answer_sql_question(user_question):
+def answer_sql_question(user_question, stream=False):
 
     # --- Load SQL Database ---
     db_path = "sql/gh_data.db"
@@ -12,50 +12,24 @@ def answer_sql_question(user_question):
     print("Tables found in schema:", list(db_schema.keys()))
     for table, columns in db_schema.items():
         print(f"Table '{table}' columns: {columns}")
-    # --- Try to extract table name directly from question ---
-    table_names = list(db_schema.keys())
-    explicit_table = None
+    # --- Retrieve the most relevant tables and columns ---
+    # Tables are ranked on their description, their best matching columns and table names
+    # written in the question. Wide tables only keep their most relevant columns.
+    ranked_tables = retrieve_tables(user_question, db_path)
+    for entry in ranked_tables:
+        print(f"Relevant table: {entry['table']} ({entry['score']:.3f}), columns: {[c for c, _ in entry['columns']]}")
 
-    # Sort table names by length (longest first) to avoid partial matches like 'level1' in 'level==1'
-    table_names_sorted = sorted(table_names, key=len, reverse=True)
-
-    clean_question = re.sub(r"[\"']", "", user_question.lower())
-
-    for tname in table_names_sorted:
-        # Match as whole word, or inside quotes, or after 'table'
-        if re.search(rf"\b{re.escape(tname.lower())}\b", clean_question):
-            explicit_table = tname
-            break
-
-    if explicit_table:
-        relevant_table = explicit_table
-        table_description = ""  # Optionally, fetch description from your descriptions file
-        print(f"Explicit table found in question: {relevant_table}")
-    else:
-        # --- Retrieve most relevant table ---
-        table_descriptions_path = "knowledge/table_descriptions.json"
-        relevant_table, table_description = sql_rag_call(
-            user_question, table_descriptions_path, n_results=1
-        )
-        relevant_table = relevant_table.split()[0].strip()
-        print(f"Most relevant table: {relevant_table}")
-
-    if relevant_table:
-        print(f"Most relevant table: {relevant_table}")
-    else:
+    filtered_schema, table_description = select_schema(ranked_tables, db_schema)
+    if not filtered_schema:
         print("No relevant table found.")
         exit()
+    relevant_table = next(iter(filtered_schema))
+    print(f"Most relevant table: {relevant_table}")
 
-    # --- Filter Schema to relevant table ---
-    table_schema = db_schema.get(relevant_table)
-    if table_schema is None:
-        print(f"Table '{relevant_table}' not found in database schema.")
-        exit()
-    filtered_schema = {relevant_table: table_schema}
     db_context = format_dB_context(db_path, filtered_schema)
 
     # --- Try to extract column name from the question ---
-    column_names = db_schema[relevant_table]
+    column_names = filtered_schema[relevant_table]
     explicit_column = None
     for cname in column_names:
         if cname.lower() in user_question.lower():
@@ -86,5 +60,6 @@ def answer_sql_question(user_question):
         exit()
 
     # --- Build natural language answer to user ---
-    final_answer = build_answer(sql_query, query_result, user_question)
+    # With stream=True the answer is returned as a generator of text pieces
+    final_answer = build_answer(sql_query, query_result, user_question, stream=stream)
     return final_answer
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from utils import answer_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(answer_cache, "CACHE_DB_PATH", str(tmp_path / "answer_cache.db"))
+    monkeypatch.setattr(answer_cache, "_db_ready", False)
+    monkeypatch.setattr(answer_cache, "_scopes", answer_cache.OrderedDict())
+
+
+def test_model_change_does_not_serve_old_answers():
+    old = answer_cache.answer_scope("all_topics", models={"embedding": "small", "completion": "llm"})
+    new = answer_cache.answer_scope("all_topics", models={"embedding": "large", "completion": "llm"})
+    answer_cache.store_answer("What is co-living?", np.ones(4), "An answer", old, "fingerprint")
+    assert answer_cache.lookup_answer(np.ones(8), new, "fingerprint") is None
+    # Even within one scope, vectors of another size are never compared
+    assert answer_cache.lookup_answer(np.ones(8), old, "fingerprint") is None
+
+
+def test_store_keeps_other_scopes_loaded():
+    first = answer_cache.answer_scope("a")
+    second = answer_cache.answer_scope("b")
+    answer_cache.store_answer("q1", np.array([1.0, 0, 0]), "first", first, "fingerprint")
+    answer_cache.lookup_answer(np.array([1.0, 0, 0]), first, "fingerprint")
+    answer_cache.store_answer("q2", np.array([0, 1.0, 0]), "second", second, "fingerprint")
+    assert (first, "fingerprint") in answer_cache._scopes
+    answer_cache.store_answer("q3", np.array([0, 0, 1.0]), "third", first, "fingerprint")
+    assert answer_cache.lookup_answer(np.array([0, 0, 1.0]), first, "fingerprint") == "third"
+
+
+def test_loaded_scopes_are_bounded(monkeypatch):
+    monkeypatch.setattr(answer_cache, "MAX_MEMORY_SCOPES", 2)
+    for turn in range(5):
+        scope = answer_cache.answer_scope("all_topics", [{"role": "user", "content": f"turn {turn}"}])
+        answer_cache.store_answer(f"q{turn}", np.ones(3), f"a{turn}", scope, "fingerprint")
+        assert answer_cache.lookup_answer(np.ones(3), scope, "fingerprint") == f"a{turn}"
+    assert len(answer_cache._scopes) == 2
+
+
+def test_reingested_store_changes_the_fingerprint(tmp_path):
+    embedding_file = str(tmp_path / "report.json")
+    missing = answer_cache.knowledge_fingerprint([embedding_file])
+    matrix_path, meta_path = answer_cache.store_paths(embedding_file)
+    (tmp_path / "store").mkdir()
+    np.save(matrix_path, np.ones((2, 4), dtype=np.float32))
+    with open(meta_path, "w", encoding="utf-8") as outfile:
+        outfile.write('{"names": [], "contents": [], "tags": []}')
+    ingested = answer_cache.knowledge_fingerprint([embedding_file])
+    assert ingested != missing
+
+    np.save(matrix_path, np.ones((3, 4), dtype=np.float32))
+    assert answer_cache.knowledge_fingerprint([embedding_file]) != ingested
@@ -0,0 +1,198 @@
+import json
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+import utils.llm_transport as transport
+import utils.response_cache as response_cache
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+class FailingServer(ThreadingHTTPServer):
+    """
+    OpenAI-compatible server that answers every chat completion with a 500 (or with `answer`,
+    if set), counting the requests. Its model list always answers.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.answer = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.requests += 1
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if server.answer is not None:
+                    status, body = 200, json.dumps(_completion(server.answer)).encode()
+                else:
+                    status, body = 500, json.dumps({"error": {"message": "overloaded"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # /models, for the health checks
+                body = json.dumps({"object": "list", "data": []}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StalledServer:
+    """Accepts connections but never answers, counting the connections."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = []
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen()
+        self.base_url = f"http://127.0.0.1:{self.socket.getsockname()[1]}/v1"
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            self.requests += 1
+            self.connections.append(connection)
+
+    def shutdown(self):
+        for connection in self.connections:
+            connection.close()
+        self.socket.close()
+
+
+@pytest.fixture
+def failing_server(monkeypatch):
+    server = FailingServer()
+    monkeypatch.setattr(transport, "llm_backends", [server.base_url])
+    monkeypatch.setattr(transport, "BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(transport, "BREAKER_FAILURES", 100)
+    yield server
+    server.shutdown()
+    transport._backends.pop(server.base_url, None)
+
+
+def test_retries_send_one_request_per_attempt(failing_server):
+    with pytest.raises(openai.InternalServerError):
+        transport.chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=2, timeout=5)
+    # No extra retries of the OpenAI SDK on top of the transport's own
+    assert failing_server.requests == 3
+
+
+def test_async_retries_send_one_request_per_attempt(failing_server):
+    with pytest.raises(openai.InternalServerError):
+        transport.gather_llm_calls(
+            transport.async_chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=1, timeout=5)
+        )
+    assert failing_server.requests == 2
+
+
+def test_open_breaker_does_not_empty_a_single_backend_pool(failing_server, monkeypatch):
+    monkeypatch.setattr(transport, "BREAKER_FAILURES", 3)
+    with pytest.raises(openai.InternalServerError):
+        transport.chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=2, timeout=5)
+    assert transport._backends[failing_server.base_url]["open_until"] > time.time()
+    # The server is back: the only backend is tried again instead of NoBackendAvailableError
+    failing_server.answer = "back"
+    response = transport.chat_completion("test_call", [{"role": "user", "content": "hi"}], timeout=5)
+    assert response.choices[0].message.content == "back"
+
+
+def test_successful_health_check_closes_the_breaker(failing_server):
+    backend = transport.model_for("test_call")[1][0]
+    backend["failures"], backend["open_until"] = 3, time.time() + 30
+    transport._check_health(backend)
+    assert backend["open_until"] == 0.0 and backend["failures"] == 0
+
+
+@pytest.fixture
+def stalled_server(monkeypatch):
+    server = StalledServer()
+    monkeypatch.setattr(transport, "llm_backends", [server.base_url])
+    monkeypatch.setattr(transport, "BACKOFF_SECONDS", 0.0)
+    yield server
+    server.shutdown()
+    transport._backends.pop(server.base_url, None)
+
+
+def test_timeout_is_not_retried_on_the_same_backend(stalled_server):
+    start = time.perf_counter()
+    with pytest.raises(openai.APITimeoutError):
+        transport.chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=2, timeout=0.5)
+    assert stalled_server.requests == 1
+    assert time.perf_counter() - start < 2
+
+
+def test_retry_metric_counts_the_retries_made(stalled_server):
+    with pytest.raises(openai.APITimeoutError):
+        transport.chat_completion("test_timeout_metric", [{"role": "user", "content": "hi"}], retries=2, timeout=0.5)
+    assert transport.get_call_metrics()["test_timeout_metric"]["retries"] == 0
+
+
+def test_async_timeout_is_not_retried_on_the_same_backend(stalled_server):
+    with pytest.raises(openai.APITimeoutError):
+        transport.gather_llm_calls(
+            transport.async_chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=2, timeout=0.5)
+        )
+    assert stalled_server.requests == 1
+
+
+def test_timeout_fails_over_to_another_backend(stalled_server, monkeypatch):
+    other = StalledServer()
+    monkeypatch.setattr(transport, "llm_backends", [stalled_server.base_url, other.base_url])
+    try:
+        with pytest.raises(openai.APITimeoutError):
+            transport.chat_completion("test_call", [{"role": "user", "content": "hi"}], retries=2, timeout=0.5)
+        assert stalled_server.requests + other.requests == 2
+    finally:
+        other.shutdown()
+        transport._backends.pop(other.base_url, None)
+
+
+def test_cache_if_keeps_invalid_responses_out_of_the_cache(failing_server, monkeypatch, tmp_path):
+    monkeypatch.setattr(response_cache, "CACHE_DB_PATH", str(tmp_path / "response_cache.db"))
+    monkeypatch.setattr(response_cache, "_db_ready", False)
+    response_cache.clear_response_cache()
+    messages = [{"role": "user", "content": "Is this about buildings?"}]
+    is_label = lambda response: response.choices[0].message.content in ("True", "False")
+
+    failing_server.answer = "Maybe"
+    for _ in range(2):
+        transport.chat_completion("test_call", messages, cache=True, cache_if=is_label)
+    assert failing_server.requests == 2
+
+    failing_server.answer = "True"
+    for _ in range(2):
+        assert transport.chat_completion("test_call", messages, cache=True, cache_if=is_label) \
+                   .choices[0].message.content == "True"
+    assert failing_server.requests == 3
+    response_cache.clear_response_cache()
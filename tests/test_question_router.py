@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import question_router
+
+
+class _Response:
+    from_cache = False
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path):
+    embedded = []
+
+    def get_embedding(text, model=None):
+        embedded.append(text)
+        vector = np.zeros(8)
+        vector[sum(map(ord, text)) % 8] = 1.0
+        return vector
+
+    monkeypatch.setattr(question_router, "get_embedding", get_embedding)
+    monkeypatch.setattr(question_router, "ROUTER_DB_PATH", str(tmp_path / "routing_examples.db"))
+    monkeypatch.setattr(question_router, "_db_ready", False)
+    monkeypatch.setattr(question_router, "_centroids", None)
+    monkeypatch.setattr(question_router, "mode", "lmstudio")
+    return embedded
+
+
+def test_restart_does_not_re_embed_logged_questions(router):
+    question_router._learn("How many bedrooms are there?", np.ones(8), "sql", _Response())
+    router.clear()
+    question_router._centroids = None
+    question_router._router()
+    assert "How many bedrooms are there?" not in router
+    assert len(question_router._logged_examples()) == 1
+
+
+def test_cached_and_mock_answers_are_not_learned(router, monkeypatch):
+    cached = _Response()
+    cached.from_cache = True
+    question_router._learn("cached question", np.ones(8), "sql", cached)
+    monkeypatch.setattr(question_router, "mode", "mock")
+    question_router._learn("mock question", np.ones(8), "sql", _Response())
+    assert question_router._logged_examples() == []
+
+
+def test_manual_label_wins_over_llm(router):
+    question_router._learn("Explain co-living", np.ones(8), "sql", _Response())
+    question_router.correct_routing("Explain co-living", "knowledge")
+    question_router._learn("Explain co-living", np.ones(8), "sql", _Response())
+    assert [destination for destination, _ in question_router._logged_examples()] == ["knowledge"]
@@ -3,13 +3,16 @@ from PyQt5.QtWidgets import (
     QTextEdit, QLineEdit, QPushButton, QLabel, QCheckBox, QComboBox, QSizePolicy
 )
 from PyQt5.QtCore import QThread, pyqtSignal, Qt
-from PyQt5.QtGui import QPalette, QColor
+from PyQt5.QtGui import QPalette, QColor, QTextCursor
 import sys
 import requests
+from utils.streaming import iter_sse_events
 
 class RequestWorker(QThread):
     finished = pyqtSignal(dict)
     error = pyqtSignal(str)
+    # Pieces of the answer, emitted as they arrive when the payload asks for {"stream": True}
+    token = pyqtSignal(str)
 
     def __init__(self, endpoint, payload):
         super().__init__()
@@ -18,18 +21,39 @@ class RequestWorker(QThread):
 
     def run(self):
         try:
-            r = requests.post(self.endpoint, json=self.payload, timeout=20)
-            data = r.json()
-            self.finished.emit(data)
+            if not self.payload.get("stream"):
+                r = requests.post(self.endpoint, json=self.payload, timeout=20)
+                data = r.json()
+                self.finished.emit(data)
+                return
+            # Streamed answers can take longer in total, the timeout is between two pieces
+            with requests.post(self.endpoint, json=self.payload, stream=True, timeout=(5, 120)) as r:
+                if not r.headers.get("Content-Type", "").startswith("text/event-stream"):
+                    self.finished.emit(r.json())
+                    return
+                for event in iter_sse_events(r):
+                    if "token" in event:
+                        self.token.emit(event["token"])
+                    elif "error" in event:
+                        self.error.emit(event["error"])
+                        return
+                    elif event.get("done"):
+                        self.finished.emit(event)
+                        return
+            # e.g. the server stopped mid-answer: without this the send button would stay disabled
+            self.error.emit("The server closed the stream before the answer was complete.")
         except Exception as e:
             self.error.emit(str(e))
 
 class ChatTab(QWidget):
-    def __init__(self, endpoint, extra_fields=None):
+    def __init__(self, endpoint, extra_fields=None, stream=False):
         super().__init__()
         self.endpoint = endpoint
         self.extra_fields = extra_fields or {}
         self.conversation_history = []
+        # Streamed answers are shown piece by piece while the server generates them
+        self.stream = stream
+        self.streamed_answer = False
 
         layout = QVBoxLayout()
         self.chat_display = QTextEdit()
@@ -128,17 +152,33 @@ class ChatTab(QWidget):
             "conversation_history": self.conversation_history
         }
         payload.update(self.extra_fields)
+        if self.stream:
+            payload["stream"] = True
 
         self.send_btn.setEnabled(False)
+        self.streamed_answer = False
         self.worker = RequestWorker(self.endpoint, payload)
         self.worker.finished.connect(self.handle_response)
         self.worker.error.connect(self.handle_error)
+        self.worker.token.connect(self.handle_token)
         self.worker.start()
 
+    def handle_token(self, token):
+        if not self.streamed_answer:
+            self.chat_display.append("<b>Bot:</b> ")
+            self.streamed_answer = True
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(token)
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
     def handle_response(self, data):
         answer = data.get("response", "No response")
         self.conversation_history = data.get("conversation_history", [])
-        self.chat_display.append(f"<b>Bot:</b> {answer}")
+        # A streamed answer is already on screen
+        if not self.streamed_answer:
+            self.chat_display.append(f"<b>Bot:</b> {answer}")
         self.send_btn.setEnabled(True)
         self.input_box.clear()
 
@@ -263,7 +303,7 @@ class MainWindow(QWidget):
         tabs.addTab(WelcomeTab(welcome_text), "Welcome")
 
         # Existing tabs
-        tabs.addTab(ChatTab("http://localhost:5000/general_question"), "General")
+        tabs.addTab(ChatTab("http://localhost:5000/general_question", stream=True), "General")
         tabs.addTab(ChatTab("http://localhost:5001/space_question"), "Space Q&A")
         tabs.addTab(ChatTab("http://localhost:5002/geometry_suggestion"), "Geometry")
 
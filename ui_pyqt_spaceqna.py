@@ -6,6 +6,8 @@ from PyQt5.QtWidgets import (
     QHBoxLayout, QComboBox, QFrame, QTextEdit, QTabWidget
 )
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QTextCursor
+from ui_pyqt1 import RequestWorker
 
 # Global QSS stylesheet
 QSS_STYLE = """
@@ -217,27 +219,43 @@ class SpaceQnAUI(QMainWindow):
             return
 
         self.input_field.clear()
-        try:
-            resp = requests.post(
-                "http://127.0.0.1:5000/llm_nearby_space_qna",
-                json={"house_key": house_key, "question": question},
-                timeout=30
-            )
-            if resp.status_code == 200:
-                answer = resp.json().get("response", "<No response>")
-                html = f'''<div style="border:1.5px solid #bbb; border-radius:32px; margin:12px 0; padding:12px; background:#fcfcfc;">
-                  <b>You ({house_key}):</b> {question}<br>
-                  <b>Assistant:</b> {answer}
-                </div>'''
-                self.qna_display.append(html)
-            else:
-                self.qna_display.append(
-                    f"<span style='color: red;'>Server error: {resp.status_code}</span>"
-                )
-        except Exception as e:
-            self.qna_display.append(
-                f"<span style='color: red;'>Error connecting to server: {e}</span>"
-            )
+        # The answer is streamed: it's shown piece by piece while the LLM generates it
+        html = f'''<div style="border:1.5px solid #bbb; border-radius:32px; margin:12px 0; padding:12px; background:#fcfcfc;">
+          <b>You ({house_key}):</b> {question}<br>
+          <b>Assistant:</b> </div>'''
+        self.qna_display.append(html)
+        self.qna_streamed = False
+        self.ask_button.setEnabled(False)
+        self.qna_worker = RequestWorker(
+            "http://127.0.0.1:5000/llm_nearby_space_qna",
+            {"house_key": house_key, "question": question, "stream": True}
+        )
+        self.qna_worker.token.connect(self.handle_qna_token)
+        self.qna_worker.finished.connect(self.handle_qna_response)
+        self.qna_worker.error.connect(self.handle_qna_error)
+        self.qna_worker.start()
+
+    def handle_qna_token(self, token):
+        self.qna_streamed = True
+        cursor = self.qna_display.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(token)
+        self.qna_display.setTextCursor(cursor)
+        self.qna_display.ensureCursorVisible()
+
+    def handle_qna_response(self, data):
+        self.ask_button.setEnabled(True)
+        if "error" in data:
+            self.handle_qna_error(data["error"])
+        elif not self.qna_streamed:
+            # Answers that don't come from the LLM are sent in one piece
+            self.handle_qna_token(data.get("response", "<No response>"))
+
+    def handle_qna_error(self, error_msg):
+        self.ask_button.setEnabled(True)
+        self.qna_display.append(
+            f"<span style='color: red;'>Error: {error_msg}</span>"
+        )
 
     def send_negotiate(self):
         house_key = self.neg_house_key_input.text().strip()
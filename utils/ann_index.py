@@ -0,0 +1,156 @@
+import os
+import sys
+import glob
+import numpy as np
+from utils.vector_store import store_paths, store_is_fresh, convert_json_to_store, load_store
+from utils.vector_search import top_k, top_k_quantized
+
+# Approximate nearest-neighbour search (IVF) for large knowledge corpora, in pure NumPy.
+# Offline, the chunk vectors are clustered with k-means; each chunk is stored in the list
+# of its closest centroid. At query time only the `n_probe` closest lists are scored exactly.
+# Small corpora are searched exactly, since scoring everything is already fast there.
+
+# Below this many chunks the exact search is used, even if an index exists
+ANN_MIN_CHUNKS = 5000
+# More probed lists = better recall, slower queries
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 20
+# Rows scored at once while assigning chunks to centroids (keeps memory bounded)
+ASSIGN_BATCH_SIZE = 8192
+
+_loaded_indexes = {}
+
+
+def index_path(embedding_file):
+    matrix_path, _ = store_paths(embedding_file)
+    return os.path.splitext(matrix_path)[0] + ".ivf.npz"
+
+
+def _assign(vectors, centroids):
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], ASSIGN_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def build_ivf_index(vectors, n_lists=None, n_iter=KMEANS_ITERATIONS, seed=0):
+    """
+    Clusters the vectors with (spherical) k-means and groups the chunk ids per cluster.
+
+    Args:
+        vectors (np.ndarray): (n_chunks, dim) embedding matrix.
+        n_lists (int): number of clusters. Defaults to about 4 * sqrt(n_chunks).
+        n_iter (int): k-means iterations.
+        seed (int): random seed for the initial centroids.
+
+    Returns:
+        dict: {'centroids': (n_lists, dim), 'offsets': (n_lists + 1,), 'ids': (n_chunks,)}
+              The ids of list i are ids[offsets[i]:offsets[i + 1]].
+    """
+    n_chunks = vectors.shape[0]
+    if n_lists is None:
+        n_lists = int(4 * np.sqrt(n_chunks))
+    n_lists = max(1, min(n_lists, n_chunks))
+
+    rng = np.random.default_rng(seed)
+    centroids = np.asarray(vectors[np.sort(rng.choice(n_chunks, n_lists, replace=False))], dtype=np.float32)
+
+    for _ in range(n_iter):
+        assignments = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        for start in range(0, n_chunks, ASSIGN_BATCH_SIZE):
+            batch = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+            batch_assignments = assignments[start:start + len(batch)]
+            order = np.argsort(batch_assignments, kind='stable')
+            clusters, first = np.unique(batch_assignments[order], return_index=True)
+            sums[clusters] += np.add.reduceat(batch[order], first, axis=0)
+        counts = np.bincount(assignments, minlength=n_lists)
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids = centroids / np.maximum(norms, 1e-12)
+
+    assignments = _assign(vectors, centroids)
+    ids = np.argsort(assignments, kind='stable').astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+    return {"centroids": centroids, "offsets": offsets, "ids": ids}
+
+
+def search_ivf(ann_index, vectors, query_vector, k, n_probe=DEFAULT_N_PROBE):
+    """
+    Approximate top-k search: scores only the chunks in the n_probe closest lists.
+
+    Returns:
+        tuple: (indices, scores) sorted best first, like vector_search.top_k.
+    """
+    centroids, offsets, ids = ann_index["centroids"], ann_index["offsets"], ann_index["ids"]
+    list_indices, _ = top_k(centroids, query_vector, n_probe)
+    candidates = np.concatenate([ids[offsets[i]:offsets[i + 1]] for i in list_indices])
+    candidates.sort()  # sequential reads from the memory-mapped matrix
+
+    local_indices, scores = top_k(vectors[candidates], query_vector, k)
+    return candidates[local_indices], scores
+
+
+def save_ivf_index(ann_index, embedding_file):
+    path = index_path(embedding_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **ann_index)
+    _loaded_indexes.pop(path, None)
+    return path
+
+
+def load_ivf_index(embedding_file):
+    """Returns the IVF index of a knowledge file, or None if it was never built or is outdated."""
+    path = index_path(embedding_file)
+    matrix_path, _ = store_paths(embedding_file)
+    if not os.path.exists(path) or not os.path.exists(matrix_path):
+        return None
+    mtime = os.path.getmtime(path)
+    if mtime < os.path.getmtime(matrix_path):
+        print(f"IVF index {path} is older than its vector store, using exact search.")
+        return None
+
+    cached = _loaded_indexes.get(path)
+    if cached is not None and cached['mtime'] == mtime:
+        return cached['index']
+    with np.load(path) as data:
+        ann_index = {key: data[key] for key in ("centroids", "offsets", "ids")}
+    _loaded_indexes[path] = {"mtime": mtime, "index": ann_index}
+    return ann_index
+
+
+def search_store(index_lib, embedding_file, query_vector, k, n_probe=DEFAULT_N_PROBE):
+    """
+    Uses the IVF index for large corpora when it exists. Otherwise all chunks are scored,
+    on the quantized copy of the store when there is one (with exact rescoring).
+    """
+    vectors = index_lib['vectors']
+    if embedding_file and vectors.shape[0] >= ANN_MIN_CHUNKS:
+        ann_index = load_ivf_index(embedding_file)
+        if ann_index is not None:
+            return search_ivf(ann_index, vectors, query_vector, k, n_probe)
+    if index_lib.get('quantized') is not None:
+        return top_k_quantized(index_lib['quantized'], vectors, query_vector, k)
+    return top_k(vectors, query_vector, k)
+
+
+# Builds the IVF index of every knowledge file (or the files given as arguments).
+# Usage: python -m utils.ann_index [knowledge/file.json ...]
+if __name__ == "__main__":
+    from utils.knowledge_index import load_knowledge_index, UNIFIED_INDEX_FILE
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join("knowledge", "*.json"))) + [UNIFIED_INDEX_FILE]
+    for embedding_file in files:
+        if embedding_file == UNIFIED_INDEX_FILE:
+            vectors = load_knowledge_index()['vectors']
+        else:
+            if not store_is_fresh(embedding_file):
+                convert_json_to_store(embedding_file)
+            vectors = load_store(embedding_file)['vectors']
+        if vectors.shape[0] < ANN_MIN_CHUNKS:
+            print(f"Skipping {embedding_file}: {vectors.shape[0]} chunks, exact search is used below {ANN_MIN_CHUNKS}.")
+            continue
+        path = save_ivf_index(build_ivf_index(vectors), embedding_file)
+        print(f"Built IVF index for {embedding_file} -> {path}")
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from utils.vector_store import store_paths
+
+# Semantic cache for knowledge answers. A new question reuses a stored answer when its
+# embedding is close enough (cosine similarity above the threshold) to a cached question.
+# - Entries record a fingerprint of the knowledge files they were answered from, so they
+#   are no longer returned once one of those files changes.
+# - Entries are scoped by the conversation history, so an answer that was shaped by an
+#   earlier conversation is only reused within that same conversation state.
+# - Entries are scoped by the embedding and completion models, so a model change doesn't
+#   serve old answers (or compare vectors of different sizes).
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "cache", "answer_cache.db")
+SIMILARITY_THRESHOLD = 0.95
+MAX_ENTRIES = 5000
+# Scopes kept in memory (every conversation state is its own scope, most are never seen again)
+MAX_MEMORY_SCOPES = 256
+
+_lock = threading.Lock()
+_db_ready = False
+# Loaded entries per (scope, fingerprint): {'ids', 'vectors', 'answers'}, least recently used first
+_scopes = OrderedDict()
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, fingerprint TEXT, "
+            "question TEXT, vector BLOB, answer TEXT, last_used REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers (scope, fingerprint)")
+        conn.commit()
+        _db_ready = True
+    return conn
+
+
+def knowledge_fingerprint(files):
+    """
+    Fingerprint of the knowledge files an answer depends on (changes when any file changes).
+    Stores without a JSON source (ingested documents) are fingerprinted by their .npy and metadata files.
+    """
+    parts = []
+    for path in sorted(files):
+        sources = [path] if os.path.exists(path) else [p for p in store_paths(path) if os.path.exists(p)]
+        for source in sources:
+            stat = os.stat(source)
+            parts.append(f"{source}:{stat.st_mtime_ns}:{stat.st_size}")
+        if not sources:
+            parts.append(f"{path}:missing")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def answer_scope(source, conversation_history=None, extra=None, models=None):
+    """
+    Scope of a cached answer: the knowledge source, any extra retrieval settings
+    (e.g. topic filters), the conversation history the answer was given in and the
+    models (e.g. {"embedding": ..., "completion": ...}) that produced it.
+    """
+    payload = json.dumps({
+        "source": source,
+        "extra": extra,
+        "history": conversation_history or [],
+        "models": models,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _load_scope(conn, scope, fingerprint):
+    key = (scope, fingerprint)
+    if key not in _scopes:
+        rows = conn.execute(
+            "SELECT id, vector, answer FROM answers WHERE scope = ? AND fingerprint = ?",
+            (scope, fingerprint)
+        ).fetchall()
+        _scopes[key] = {
+            "ids": [row[0] for row in rows],
+            "vectors": np.asarray([np.frombuffer(row[1], dtype=np.float32) for row in rows]),
+            "answers": [row[2] for row in rows],
+        }
+    _scopes.move_to_end(key)
+    while len(_scopes) > MAX_MEMORY_SCOPES:
+        _scopes.popitem(last=False)
+    return _scopes[key]
+
+
+def lookup_answer(question_vector, scope, fingerprint, threshold=SIMILARITY_THRESHOLD):
+    """Returns a cached answer for a similar question in the same scope, or None."""
+    with _lock:
+        conn = _connect()
+        try:
+            entries = _load_scope(conn, scope, fingerprint)
+            question_vector = _normalize(question_vector)
+            if not entries["ids"] or entries["vectors"].shape[1] != question_vector.shape[0]:
+                return None
+            similarities = entries["vectors"] @ question_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                return None
+            conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entries["ids"][best]))
+            conn.commit()
+            print(f"Answer cache hit (similarity {similarities[best]:.3f}).")
+            return entries["answers"][best]
+        finally:
+            conn.close()
+
+
+def store_answer(question, question_vector, answer, scope, fingerprint):
+    """Caches an answer. Entries for outdated knowledge files and the least recently used are removed."""
+    with _lock:
+        conn = _connect()
+        try:
+            # Answers given from an older version of the same knowledge can never be hit again
+            conn.execute(
+                "DELETE FROM answers WHERE scope = ? AND fingerprint != ?", (scope, fingerprint)
+            )
+            question_vector = _normalize(question_vector)
+            new_id = conn.execute(
+                "INSERT INTO answers (scope, fingerprint, question, vector, answer, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, fingerprint, question, question_vector.tobytes(), answer, time.time())
+            ).lastrowid
+            count = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > MAX_ENTRIES:
+                conn.execute(
+                    "DELETE FROM answers WHERE id IN "
+                    "(SELECT id FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (count - MAX_ENTRIES,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        for key in [key for key in _scopes if key[0] == scope and key[1] != fingerprint]:
+            del _scopes[key]
+        if count > MAX_ENTRIES:
+            # Evicted entries can be in any scope, those are reloaded from disk on the next lookup
+            _scopes.clear()
+        elif (scope, fingerprint) in _scopes:
+            entries = _scopes[(scope, fingerprint)]
+            entries["ids"].append(new_id)
+            entries["vectors"] = np.vstack([entries["vectors"].reshape(-1, question_vector.shape[0]), question_vector])
+            entries["answers"].append(answer)
+
+
+def clear_answer_cache():
+    with _lock:
+        _scopes.clear()
+        conn = _connect()
+        try:
+            conn.execute("DELETE FROM answers")
+            conn.commit()
+        finally:
+            conn.close()
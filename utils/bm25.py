@@ -0,0 +1,171 @@
+import os
+import re
+import numpy as np
+from utils.vector_store import store_paths
+from utils.vector_search import top_k
+from utils.ann_index import search_store
+
+# BM25 keyword index over the chunk contents of a vector store, used next to the vector scores
+# so exact terms ("UTCI", table and column names) are not missed by the embedding search.
+# The index is an inverted index in CSR form: for term t, the postings are
+# doc_ids[offsets[t]:offsets[t + 1]] with their term frequencies in the same range of tfs.
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal rank fusion constant (higher = flatter weighting of the ranks)
+RRF_K = 60
+# Candidates taken from each ranking before fusing
+CANDIDATE_FACTOR = 10
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+# Words too common to say anything about a chunk (they would only add noise to the ranking)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "their", "there", "these",
+    "this", "to", "was", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+_loaded_indexes = {}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def bm25_path(embedding_file):
+    matrix_path, _ = store_paths(embedding_file)
+    return os.path.splitext(matrix_path)[0] + ".bm25.npz"
+
+
+def build_bm25_index(contents):
+    """Builds the inverted index of chunk contents (a list, or any iterable read only once)."""
+    postings = {}
+    doc_lengths = []
+    for doc_id, content in enumerate(contents):
+        tokens = tokenize(content)
+        doc_lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((doc_id, count))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in vocab])
+    doc_ids = np.empty(offsets[-1], dtype=np.int32)
+    tfs = np.empty(offsets[-1], dtype=np.float32)
+    for i, term in enumerate(vocab):
+        entries = np.asarray(postings[term])
+        doc_ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+
+    return {
+        "vocab": np.asarray(vocab, dtype=str),
+        "offsets": offsets,
+        "doc_ids": doc_ids,
+        "tfs": tfs,
+        "doc_lengths": np.asarray(doc_lengths, dtype=np.float32),
+    }
+
+
+def save_bm25_index(contents, embedding_file):
+    path = bm25_path(embedding_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'wb') as outfile:
+        np.savez(outfile, **build_bm25_index(contents))
+    os.replace(path + ".tmp", path)
+    _loaded_indexes.pop(path, None)
+    return path
+
+
+def load_bm25_index(embedding_file, contents):
+    """Returns the BM25 index of a store, building it if it's missing or older than the store."""
+    path = bm25_path(embedding_file)
+    matrix_path, _ = store_paths(embedding_file)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(matrix_path):
+        save_bm25_index(contents, embedding_file)
+    mtime = os.path.getmtime(path)
+
+    cached = _loaded_indexes.get(path)
+    if cached is not None and cached['mtime'] == mtime:
+        return cached['index']
+    with np.load(path) as data:
+        index = {key: data[key] for key in data.files}
+    index["term_ids"] = {term: i for i, term in enumerate(index["vocab"].tolist())}
+    index["avg_length"] = float(index["doc_lengths"].mean()) if len(index["doc_lengths"]) else 0.0
+    _loaded_indexes[path] = {"mtime": mtime, "index": index}
+    return index
+
+
+def bm25_scores(index, query):
+    """Returns the BM25 score of every chunk for a query string (zeros if no term matches)."""
+    doc_lengths = index["doc_lengths"]
+    scores = np.zeros(len(doc_lengths), dtype=np.float32)
+    n_docs = len(doc_lengths)
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(index["avg_length"], 1e-9))
+
+    for term in set(tokenize(query)):
+        term_id = index["term_ids"].get(term)
+        if term_id is None:
+            continue
+        start, end = index["offsets"][term_id], index["offsets"][term_id + 1]
+        doc_ids, tfs = index["doc_ids"][start:end], index["tfs"][start:end]
+        idf = np.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+        scores[doc_ids] += idf * tfs * (BM25_K1 + 1) / (tfs + length_norm[doc_ids])
+    return scores
+
+
+def fuse_rankings(rankings, k):
+    """
+    Reciprocal rank fusion of several rankings (arrays of chunk indices, best first).
+
+    Returns:
+        tuple: (indices, fused_scores) of the k best chunks, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, index in enumerate(ranking):
+            fused[int(index)] = fused.get(int(index), 0.0) + 1.0 / (RRF_K + rank + 1)
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return np.asarray([i for i, _ in best], dtype=np.int64), np.asarray([s for _, s in best], dtype=np.float32)
+
+
+def keyword_ranking(index, query, n, rows=None):
+    """Indices of the n best BM25 matches (only chunks with a score above zero), best first."""
+    scores = bm25_scores(index, query)
+    if rows is not None:
+        mask = np.zeros(len(scores), dtype=bool)
+        mask[rows] = True
+        scores[~mask] = 0
+    matched = np.flatnonzero(scores > 0)
+    return matched[np.argsort(-scores[matched], kind='stable')][:n]
+
+
+def hybrid_search(index_lib, embedding_file, question_vector, question_text, k, rows=None):
+    """
+    Fuses the vector ranking and the BM25 ranking of a store.
+
+    Args:
+        index_lib (dict): The store, as returned by vector_store.load_store.
+        embedding_file (str): The file the store belongs to (used to find its indexes).
+        question_vector (list): The embedded question.
+        question_text (str): The question itself, for keyword matching.
+        k (int): Number of results.
+        rows (np.ndarray): Optional chunk indices to restrict the search to.
+
+    Returns:
+        tuple: (indices, fused_scores) best first.
+    """
+    n_candidates = k * CANDIDATE_FACTOR
+    if rows is None:
+        vector_ranking, _ = search_store(index_lib, embedding_file, question_vector, n_candidates)
+    else:
+        local_indices, _ = top_k(index_lib['vectors'][rows], question_vector, n_candidates)
+        vector_ranking = rows[local_indices]
+
+    index = load_bm25_index(embedding_file, index_lib['contents'])
+    keyword_matches = keyword_ranking(index, question_text, n_candidates, rows)
+    if len(keyword_matches) == 0:
+        return fuse_rankings([vector_ranking], k)
+    return fuse_rankings([vector_ranking, keyword_matches], k)
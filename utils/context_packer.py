@@ -0,0 +1,137 @@
+import re
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Token-budgeted prompt packing for the RAG answers.
+# Retrieved chunks are picked with maximal marginal relevance (MMR), so near-duplicate chunks
+# don't use the budget twice, and the conversation history is trimmed to its own budget,
+# newest messages first. Prompt length stays predictable whatever the chunks and history.
+
+# Prompt tokens allowed for the retrieved information and for the conversation history
+CONTEXT_TOKEN_BUDGET = 1200
+HISTORY_TOKEN_BUDGET = 800
+# Extra tokens per chat message (role and separators in the chat template)
+MESSAGE_OVERHEAD = 4
+# Candidates retrieved per chunk that ends up in the prompt (MMR picks among them)
+MMR_CANDIDATE_FACTOR = 3
+# 1.0 = relevance only, lower values penalize chunks similar to the ones already picked
+MMR_LAMBDA = 0.7
+# Chunks at least this similar to a picked chunk are treated as duplicates and skipped
+DUPLICATE_SIMILARITY = 0.95
+
+# Without tiktoken, tokens are estimated from words and punctuation (about 4 characters per token)
+CHARS_PER_TOKEN = 4
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Number of tokens in a text (tiktoken's cl100k_base if installed, otherwise an estimate)."""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(-(-len(piece) // CHARS_PER_TOKEN) for piece in TOKEN_PATTERN.findall(text))
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD for message in messages)
+
+
+def truncate_to_tokens(text, budget):
+    """Cuts a text at a word boundary so it fits in `budget` tokens."""
+    if count_tokens(text) <= budget:
+        return text
+    words = text.split(" ")
+    low, high = 0, len(words)
+    # Binary search on the number of words that fit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def select_chunks(chunks, vectors, question_vector, n_results, token_budget=CONTEXT_TOKEN_BUDGET,
+                  mmr_lambda=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """
+    Picks up to n_results chunks by maximal marginal relevance, within a token budget.
+
+    Args:
+        chunks (list): Candidate chunks [{'content', ...}, ...].
+        vectors (np.ndarray): (n_candidates, dim) embeddings of the candidates.
+        question_vector (list): The embedded question.
+        n_results (int): Maximum number of chunks to pick.
+        token_budget (int): Maximum number of tokens of the picked contents.
+
+    Returns:
+        list: The picked chunks, in the order they were picked (most relevant first).
+    """
+    if not chunks:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    relevance = vectors @ np.asarray(question_vector, dtype=np.float32)
+    similarity = vectors @ vectors.T
+    tokens = [count_tokens(chunk['content']) for chunk in chunks]
+
+    picked, selected, remaining = [], [], token_budget
+    candidates = set(range(len(chunks)))
+    while candidates and len(picked) < n_results:
+        redundancy = {i: max((similarity[i, j] for j in picked), default=0.0) for i in candidates}
+        best = max(candidates, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        candidates.discard(best)
+        if redundancy[best] >= duplicate_similarity:
+            continue
+        chunk = chunks[best]
+        if tokens[best] > remaining:
+            if picked:
+                continue
+            # Even the best chunk alone is over budget: keep what fits of it
+            chunk = dict(chunk, content=truncate_to_tokens(chunk['content'], remaining))
+        picked.append(best)
+        selected.append(chunk)
+        remaining -= min(tokens[best], remaining)
+    return selected
+
+
+def trim_history(history, token_budget=HISTORY_TOKEN_BUDGET):
+    """Keeps the most recent messages of a conversation that fit in the token budget."""
+    kept, used = [], 0
+    for message in reversed(history or []):
+        cost = count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+        if used + cost > token_budget:
+            break
+        kept.append(message)
+        used += cost
+    return list(reversed(kept))
+
+
+def pack_context(question_vector, chunks, vectors, history, n_results,
+                 context_budget=CONTEXT_TOKEN_BUDGET, history_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Packs the retrieved chunks and the conversation history into their token budgets,
+    and logs how many prompt tokens this saved compared to the top n_results chunks
+    and the full history.
+
+    Returns:
+        tuple: (context string, trimmed history list)
+    """
+    picked = select_chunks(chunks, vectors, question_vector, n_results, context_budget)
+    context = "\n\n".join(chunk['content'] for chunk in picked)
+    trimmed_history = trim_history(history, history_budget)
+
+    unpacked = count_tokens("\n\n".join(chunk['content'] for chunk in chunks[:n_results])) + count_message_tokens(history or [])
+    packed = count_tokens(context) + count_message_tokens(trimmed_history)
+    print(f"Context packing: {packed} prompt tokens instead of {unpacked} ({unpacked - packed} saved), "
+          f"{len(picked)} chunks, {len(trimmed_history)}/{len(history or [])} history messages.")
+    return context, trimmed_history
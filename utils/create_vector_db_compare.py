@@ -1,15 +1,20 @@
 import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.insert(0, 'C:\\Users\\Matea\\Documents\\IAAC\\3\\studio\\SQL\\LLM-SQL-Retrieval')
 from server.config import *
-import json
-import os
 import re
+import argparse
+from utils.embedding_builder import build_embeddings, DEFAULT_BATCH_SIZE
 
 document_to_embed = "knowledge\\compare_results.txt"
 
-def get_embedding(text, model=embedding_model):
-    text = text.replace("\n", " ")
-    return local_client.embeddings.create(input=[text], model=model).data[0].embedding
+# Only chunks whose content changed since the last run are sent to the embeddings API.
+# Use --full to re-embed everything (e.g. after switching the embedding model).
+parser = argparse.ArgumentParser()
+parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+parser.add_argument("--full", action="store_true")
+args = parser.parse_args()
 
 # Read the text document
 with open(document_to_embed, 'r', encoding='utf-8', errors='ignore') as infile:
@@ -27,22 +32,12 @@ for level, matching, not_possible in matches:
         "content": content
     })
 
-# Create the embeddings
-embeddings = []
-for i, chunk in enumerate(chunks):
-    print(f'{i + 1} / {len(chunks)}')
-    vector = get_embedding(chunk['content'])
-    embeddings.append({
-        'name': chunk['name'],
-        'content': chunk['content'],
-        'vector': vector
-    })
-
 # Save the embeddings to a json file
 output_filename = os.path.splitext(document_to_embed)[0]
 output_path = f"{output_filename}_compare.json"
 
-with open(output_path, 'w', encoding='utf-8') as outfile:
-    json.dump(embeddings, outfile, indent=2, ensure_ascii=False)
+# Create the embeddings (only for new or edited chunks)
+build_embeddings(chunks, output_path, local_client, embedding_model,
+                 batch_size=args.batch_size, full_rebuild=args.full)
 
 print(f"Finished vectorizing. Created {output_path}")
\ No newline at end of file
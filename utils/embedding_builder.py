@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+from utils.vector_store import save_store
+from utils.bm25 import save_bm25_index
+
+# Shared helpers for the vector DB builder scripts (create_vector_db*.py).
+# Chunks are embedded in batches, and chunks whose content was already embedded
+# in a previous run with the same embedding model reuse their stored vector
+# instead of calling the API again.
+
+DEFAULT_BATCH_SIZE = 32
+
+
+def content_hash(text, model=None):
+    """Hash of a chunk's content and the model that embedded it (None for files written before it was recorded)."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load_existing_chunks(output_path):
+    """Returns the chunks already embedded in output_path, [] if there are none."""
+    if not os.path.exists(output_path):
+        return []
+    with open(output_path, 'r', encoding='utf-8') as infile:
+        try:
+            return json.load(infile)
+        except json.JSONDecodeError:
+            print(f"Could not read {output_path}, re-embedding everything.")
+            return []
+
+
+def embed_in_batches(texts, client, model, batch_size=DEFAULT_BATCH_SIZE):
+    """Embeds a list of texts, sending `batch_size` texts per request."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = [text.replace("\n", " ") for text in texts[start:start + batch_size]]
+        response = client.embeddings.create(input=batch, model=model)
+        # The API returns one item per input, tagged with its position in the batch
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        print(f'{min(start + batch_size, len(texts))} / {len(texts)}')
+    return vectors
+
+
+def build_embeddings(chunks, output_path, client, model, batch_size=DEFAULT_BATCH_SIZE, full_rebuild=False):
+    """
+    Embeds the chunks that have no vector yet and saves the result.
+
+    Args:
+        chunks (list): [{'name': str, 'content': str}, ...] in document order.
+        output_path (str): The knowledge JSON file to update.
+        client: OpenAI-compatible client used for the embeddings API.
+        model (str): Embedding model name.
+        batch_size (int): Number of chunks sent per embeddings request.
+        full_rebuild (bool): Ignore existing vectors and re-embed every chunk.
+
+    Returns:
+        int: The number of chunks that were (re-)embedded.
+    """
+    existing_chunks = [] if full_rebuild else load_existing_chunks(output_path)
+    existing = {content_hash(chunk['content'], chunk.get('model')): chunk['vector'] for chunk in existing_chunks}
+
+    hashes = [content_hash(chunk['content'], model) for chunk in chunks]
+    missing = [i for i, h in enumerate(hashes) if h not in existing]
+    print(f"{len(chunks) - len(missing)} chunks unchanged, {len(missing)} to embed.")
+
+    new_vectors = embed_in_batches([chunks[i]['content'] for i in missing], client, model, batch_size)
+    for i, vector in zip(missing, new_vectors):
+        existing[hashes[i]] = vector
+
+    # Same chunks, names, order and model as the file on disk
+    unchanged_file = not missing and [(chunk['name'], content_hash(chunk['content'], chunk.get('model')))
+                                      for chunk in existing_chunks] == [(chunk['name'], h) for chunk, h in zip(chunks, hashes)]
+    if unchanged_file and os.path.exists(output_path):
+        print(f"Nothing changed, {output_path} left as is.")
+        return 0
+
+    embeddings = [{
+        'name': chunk['name'],
+        'content': chunk['content'],
+        'model': model,
+        'vector': existing[h]
+    } for chunk, h in zip(chunks, hashes)]
+
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        json.dump(embeddings, outfile, ensure_ascii=False, separators=(',', ':'))
+    save_store(embeddings, output_path)
+    save_bm25_index([chunk['content'] for chunk in embeddings], output_path)
+    return len(missing)
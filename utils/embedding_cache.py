@@ -0,0 +1,105 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Cache for question embeddings, so a repeated question doesn't need another round trip
+# to the embeddings endpoint. Entries are keyed by a hash of the embedding model name and
+# the text, so switching models in server/config.py never returns an old vector.
+# Recent entries live in memory (LRU); all entries are also kept in a SQLite file on disk.
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "cache", "embedding_cache.db")
+MAX_MEMORY_ENTRIES = 2048
+MAX_DISK_ENTRIES = 50000
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+_db_ready = False
+
+
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        conn.commit()
+        _db_ready = True
+    return conn
+
+
+def _remember(key, vector):
+    _memory_cache[key] = vector
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > MAX_MEMORY_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+def get_cached_embedding(text, model):
+    """Returns the cached vector (list of floats) for this text and model, or None."""
+    key = cache_key(text, model)
+    with _lock:
+        vector = _memory_cache.get(key)
+        if vector is not None:
+            _memory_cache.move_to_end(key)
+            return vector
+
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        finally:
+            conn.close()
+
+        vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+        _remember(key, vector)
+        return vector
+
+
+def store_embedding(text, model, vector):
+    """Saves a vector in memory and on disk, evicting the least recently used entries."""
+    key = cache_key(text, model)
+    with _lock:
+        _remember(key, vector)
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                (key, model, np.asarray(vector, dtype=np.float32).tobytes(), time.time())
+            )
+            count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > MAX_DISK_ENTRIES:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - MAX_DISK_ENTRIES,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def clear_embedding_cache():
+    with _lock:
+        _memory_cache.clear()
+        conn = _connect()
+        try:
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+        finally:
+            conn.close()
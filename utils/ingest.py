@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.vector_store import store_paths
+from utils.bm25 import save_bm25_index
+from utils.knowledge_index import register_topic
+
+# Streaming ingestion pipeline for large source documents:
+#   read_stream -> chunk_stream (or record_stream) -> embed_stream -> StoreWriter
+# Every step is a generator, so memory stays bounded whatever the document size.
+# The writer appends to part files, so an interrupted run continues where it stopped.
+
+READ_BLOCK_SIZE = 64 * 1024
+DEFAULT_MAX_CHARS = 1500
+DEFAULT_OVERLAP = 200
+DEFAULT_BATCH_SIZE = 32
+# Rows copied at once when the part files are turned into the final store
+COPY_BATCH_SIZE = 16384
+
+
+def read_stream(path, block_size=READ_BLOCK_SIZE):
+    """Yields the text of a file in blocks of `block_size` characters."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as infile:
+        while True:
+            block = infile.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def _split_point(text, max_chars):
+    # Prefer a paragraph break, then a sentence end, then a space, in the second half of the window
+    window = text[:max_chars]
+    for separator in ("\n\n", ". ", "\n", " "):
+        position = window.rfind(separator, max_chars // 2)
+        if position != -1:
+            return position + len(separator)
+    return max_chars
+
+
+def chunk_stream(blocks, max_chars=DEFAULT_MAX_CHARS, overlap=DEFAULT_OVERLAP):
+    """
+    Splits streamed text into chunks of at most `max_chars` characters.
+
+    Chunks end at paragraph or sentence boundaries where possible, and each chunk
+    starts with the last `overlap` characters of the previous one.
+
+    Yields:
+        str: chunk text (stripped, never empty)
+    """
+    if overlap >= max_chars:
+        raise ValueError("overlap must be smaller than max_chars")
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= max_chars:
+            end = _split_point(buffer, max_chars)
+            chunk = buffer[:end].strip()
+            if chunk:
+                yield chunk
+            buffer = buffer[max(end - overlap, 0):] if end > overlap else buffer[end:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def record_stream(blocks, start_pattern):
+    """
+    Splits streamed text into records that each start with `start_pattern` (a regex),
+    e.g. r"Table:" for knowledge/table_descriptions.txt. Text before the first record is skipped.
+    """
+    start_regex = re.compile(start_pattern)
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        starts = [match.start() for match in start_regex.finditer(buffer)]
+        # Everything before the last start is complete; the last record may continue in the next block
+        for begin, end in zip(starts, starts[1:]):
+            yield buffer[begin:end]
+        if starts:
+            buffer = buffer[starts[-1]:]
+        elif len(buffer) > READ_BLOCK_SIZE:
+            # No record has started yet: keep only a tail long enough to hold a split marker
+            buffer = buffer[-256:]
+    if start_regex.match(buffer):
+        yield buffer
+
+
+def embed_stream(chunks, client, model, batch_size=DEFAULT_BATCH_SIZE):
+    """Embeds streamed chunks in batches. Yields lists of (chunk, vector) pairs, one list per batch."""
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield _embed_batch(batch, client, model)
+            batch = []
+    if batch:
+        yield _embed_batch(batch, client, model)
+
+
+def _embed_batch(batch, client, model):
+    texts = [chunk['content'].replace("\n", " ") for chunk in batch]
+    response = client.embeddings.create(input=texts, model=model)
+    vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return list(zip(batch, vectors))
+
+
+class StoreWriter:
+    """
+    Append-only writer for a vector store (see utils/vector_store.py).
+
+    Vectors are appended as raw float32 rows to "<store>.part.bin" and chunk metadata as
+    JSON lines to "<store>.part.jsonl". finish() turns the part files into the final store.
+    If the part files of an earlier run exist with the same settings, writing resumes
+    after the chunks they already hold.
+    """
+
+    def __init__(self, embedding_file, settings=None):
+        self.embedding_file = embedding_file
+        matrix_path, _ = store_paths(embedding_file)
+        base = os.path.splitext(matrix_path)[0]
+        self.bin_path = base + ".part.bin"
+        self.meta_path = base + ".part.jsonl"
+        self.settings_path = base + ".part.json"
+        self.settings = settings or {}
+        self.dim = None
+        self.count = 0
+        os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+        self._resume()
+
+    def _resume(self):
+        if not os.path.exists(self.settings_path):
+            self._reset()
+            return
+        with open(self.settings_path, 'r', encoding='utf-8') as infile:
+            saved = json.load(infile)
+        if saved.get("settings") != self.settings or not os.path.exists(self.meta_path):
+            print("Ingestion settings or document changed, starting over.")
+            self._reset()
+            return
+
+        self.dim = saved.get("dim")
+        with open(self.meta_path, 'rb') as infile:
+            lines = sum(1 for line in infile if line.endswith(b"\n"))
+        rows = os.path.getsize(self.bin_path) // (4 * self.dim) if self.dim and os.path.exists(self.bin_path) else 0
+        # A run can stop between the two appends: keep only the chunks written to both files
+        self.count = min(lines, rows)
+        self._truncate(self.count)
+
+    def _truncate(self, count):
+        with open(self.meta_path, 'rb') as infile:
+            size = sum(len(line) for _, line in zip(range(count), infile))
+        with open(self.meta_path, 'ab') as outfile:
+            outfile.truncate(size)
+        if self.dim:
+            with open(self.bin_path, 'ab') as outfile:
+                outfile.truncate(count * 4 * self.dim)
+
+    def _reset(self):
+        for path in (self.bin_path, self.meta_path):
+            open(path, 'wb').close()
+        self.dim = None
+        self.count = 0
+        self._save_settings()
+
+    def _save_settings(self):
+        with open(self.settings_path, 'w', encoding='utf-8') as outfile:
+            json.dump({"settings": self.settings, "dim": self.dim}, outfile)
+
+    def append(self, pairs):
+        """Appends a batch of (chunk, vector) pairs."""
+        vectors = np.asarray([vector for _, vector in pairs], dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self._save_settings()
+        with open(self.bin_path, 'ab') as outfile:
+            outfile.write(vectors.tobytes())
+        with open(self.meta_path, 'a', encoding='utf-8') as outfile:
+            for chunk, _ in pairs:
+                outfile.write(json.dumps({
+                    "name": chunk.get('name', ''),
+                    "content": chunk['content'],
+                    "tag": chunk.get('tag', '')
+                }, ensure_ascii=False) + "\n")
+        self.count += len(pairs)
+
+    def _iter_meta(self, key):
+        with open(self.meta_path, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                yield json.loads(line)[key]
+
+    def finish(self):
+        """Writes the final .npy matrix and metadata sidecar, then removes the part files."""
+        matrix_path, meta_path = store_paths(self.embedding_file)
+        dim = self.dim or 0
+
+        if self.count:
+            rows = np.memmap(self.bin_path, dtype=np.float32, mode='r', shape=(self.count, dim))
+            matrix = np.lib.format.open_memmap(matrix_path + ".tmp", mode='w+', dtype=np.float32, shape=(self.count, dim))
+            for start in range(0, self.count, COPY_BATCH_SIZE):
+                matrix[start:start + COPY_BATCH_SIZE] = rows[start:start + COPY_BATCH_SIZE]
+            matrix.flush()
+            del matrix, rows
+        else:
+            with open(matrix_path + ".tmp", 'wb') as outfile:
+                np.save(outfile, np.zeros((0, 0), dtype=np.float32))
+
+        # The sidecar is written field by field so the contents never need to be in memory at once
+        with open(meta_path + ".tmp", 'w', encoding='utf-8') as outfile:
+            outfile.write("{")
+            for key, field in (("name", "names"), ("content", "contents"), ("tag", "tags")):
+                outfile.write(f'"{field}":[')
+                for i, value in enumerate(self._iter_meta(key)):
+                    outfile.write(("," if i else "") + json.dumps(value, ensure_ascii=False))
+                outfile.write("],")
+            outfile.write(f'"dim":{dim}}}')
+
+        os.replace(meta_path + ".tmp", meta_path)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        # Streamed from the part file: only the postings are held in memory, not the texts
+        save_bm25_index(self._iter_meta("content"), self.embedding_file)
+        for path in (self.bin_path, self.meta_path, self.settings_path):
+            os.remove(path)
+        return matrix_path
+
+
+def ingest_document(document, embedding_file, client, model, max_chars=DEFAULT_MAX_CHARS,
+                    overlap=DEFAULT_OVERLAP, batch_size=DEFAULT_BATCH_SIZE, tag=""):
+    """
+    Streams a text document into the vector store of `embedding_file`.
+    Resumes an interrupted run with the same settings.
+    """
+    name = os.path.splitext(os.path.basename(document))[0]
+    # An edited document starts over instead of resuming onto chunks of the old version
+    stat = os.stat(document)
+    settings = {"document": os.path.abspath(document), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "model": model, "max_chars": max_chars, "overlap": overlap, "tag": tag}
+    writer = StoreWriter(embedding_file, settings)
+    if writer.count:
+        print(f"Resuming after {writer.count} chunks already embedded.")
+
+    chunks = ({"name": f"{name}_{i}", "content": text, "tag": tag}
+              for i, text in enumerate(chunk_stream(read_stream(document), max_chars, overlap)))
+    # Chunking is deterministic, so the chunks written by an earlier run are simply skipped
+    remaining = (chunk for i, chunk in enumerate(chunks) if i >= writer.count)
+
+    for pairs in embed_stream(remaining, client, model, batch_size):
+        writer.append(pairs)
+        print(f"{writer.count} chunks embedded")
+
+    return writer.finish()
+
+
+# Streams a (large) text document into a vector store in knowledge/store/ and registers it as a
+# knowledge topic (named after the document unless --topic is given).
+# Usage: python utils/ingest.py "knowledge/my report.txt" [--max-chars 1500 --overlap 200 --batch-size 32]
+if __name__ == "__main__":
+    from server.config import local_client, embedding_model
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("document")
+    parser.add_argument("--max-chars", type=int, default=DEFAULT_MAX_CHARS)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--tag", default="")
+    parser.add_argument("--topic", help="Knowledge topic name (default: the document name)")
+    args = parser.parse_args()
+
+    embedding_file = os.path.splitext(args.document)[0] + ".json"
+    matrix_path = ingest_document(args.document, embedding_file, local_client, embedding_model,
+                                  args.max_chars, args.overlap, args.batch_size, args.tag)
+    topic = args.topic or os.path.splitext(os.path.basename(args.document))[0]
+    register_topic(topic, embedding_file)
+    print(f"Finished vectorizing. Created {matrix_path} (knowledge topic \"{topic}\")")
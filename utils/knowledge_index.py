@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+from utils.vector_store import store_paths, store_is_fresh, convert_json_to_store, load_store, save_store_arrays
+from utils.vector_search import top_k
+from utils.ann_index import search_store
+from utils.bm25 import hybrid_search, save_bm25_index
+
+# One merged vector store over all knowledge topics, with the topic kept as a tag on each chunk.
+# Questions are searched across every topic at once (optionally filtered by topic),
+# so no LLM call is needed to pick the right knowledge file first.
+# Topics are the built-in KNOWLEDGE_TOPICS plus the documents registered by utils/ingest.py.
+
+KNOWLEDGE_TOPICS = {
+    "outdoor comfort research issues": "knowledge/outdoor comfort research issues.json",
+    "the rise of co-living": "knowledge/the rise of co-living.json",
+    "thermal comfort in semi-outdoor spaces": "knowledge/thermal comfort in semi-outdoor spaces.json",
+}
+
+# Name used for the merged store in knowledge/store/ (there is no JSON file with this name)
+UNIFIED_INDEX_FILE = "knowledge/knowledge_all.json"
+# {topic: embedding file} of the ingested documents (their stores have no JSON source)
+INGESTED_TOPICS_FILE = "knowledge/store/ingested_topics.json"
+
+
+def _ingested_topics():
+    if not os.path.exists(INGESTED_TOPICS_FILE):
+        return {}
+    with open(INGESTED_TOPICS_FILE, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def register_topic(topic, embedding_file):
+    """Adds an ingested store to the knowledge topics, so it is searched by answer_from_knowledge."""
+    topics = _ingested_topics()
+    if topics.get(topic) == embedding_file:
+        return
+    topics[topic] = embedding_file
+    os.makedirs(os.path.dirname(INGESTED_TOPICS_FILE), exist_ok=True)
+    with open(INGESTED_TOPICS_FILE + ".tmp", 'w', encoding='utf-8') as outfile:
+        json.dump(topics, outfile, ensure_ascii=False, indent=2)
+    os.replace(INGESTED_TOPICS_FILE + ".tmp", INGESTED_TOPICS_FILE)
+
+
+def knowledge_topics():
+    """{topic: embedding file} of every knowledge topic (ingested stores that were deleted are left out)."""
+    topics = dict(KNOWLEDGE_TOPICS)
+    for topic, topic_file in _ingested_topics().items():
+        if os.path.exists(store_paths(topic_file)[0]):
+            topics[topic] = topic_file
+    return topics
+
+
+def _unified_index_is_fresh():
+    matrix_path, meta_path = store_paths(UNIFIED_INDEX_FILE)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        return False
+    built = os.path.getmtime(matrix_path)
+    if os.path.exists(INGESTED_TOPICS_FILE) and os.path.getmtime(INGESTED_TOPICS_FILE) > built:
+        return False
+    topics = knowledge_topics()
+    if set(load_store(UNIFIED_INDEX_FILE)['tags']) - set(topics):
+        # A topic was removed
+        return False
+    for topic_file in topics.values():
+        if not store_is_fresh(topic_file) or os.path.getmtime(store_paths(topic_file)[0]) > built:
+            return False
+    return True
+
+
+def build_knowledge_index():
+    """Merges the vector stores of all topics into one tagged store."""
+    vectors, names, contents, tags = [], [], [], []
+    for topic, topic_file in knowledge_topics().items():
+        if not store_is_fresh(topic_file):
+            convert_json_to_store(topic_file)
+        store = load_store(topic_file)
+        vectors.append(np.asarray(store['vectors'], dtype=np.float32))
+        names.extend(store['names'])
+        contents.extend(store['contents'])
+        tags.extend([topic] * len(store['contents']))
+    matrix_path = save_store_arrays(np.concatenate(vectors), names, contents, tags, UNIFIED_INDEX_FILE)
+    save_bm25_index(contents, UNIFIED_INDEX_FILE)
+    return matrix_path
+
+
+def load_knowledge_index():
+    """Returns the merged store, rebuilding it when any topic file changed."""
+    if not _unified_index_is_fresh():
+        print("Building the unified knowledge index...")
+        build_knowledge_index()
+    return load_store(UNIFIED_INDEX_FILE)
+
+
+def search_knowledge(question_vector, n_results, topics=None, question_text=None):
+    """
+    Searches all knowledge topics at once.
+
+    Args:
+        question_vector (list): The embedded question.
+        n_results (int): Number of chunks to return.
+        topics (list): Optional topic names (keys of knowledge_topics()) to restrict the search to.
+        question_text (str): Optional question text, to fuse BM25 keyword matches with the vector scores.
+
+    Returns:
+        list: [{'content', 'score', 'name', 'topic', 'index'}, ...] best first ('index' is the row in the store).
+    """
+    index_lib = load_knowledge_index()
+
+    rows = None
+    if topics:
+        rows = np.flatnonzero(np.isin(np.asarray(index_lib['tags']), list(topics)))
+
+    if question_text:
+        indices, scores = hybrid_search(index_lib, UNIFIED_INDEX_FILE, question_vector, question_text, n_results, rows)
+    elif rows is not None:
+        local_indices, scores = top_k(index_lib['vectors'][rows], question_vector, n_results)
+        indices = rows[local_indices]
+    else:
+        indices, scores = search_store(index_lib, UNIFIED_INDEX_FILE, question_vector, n_results)
+
+    return [{
+        'content': index_lib['contents'][i],
+        'score': float(score),
+        'name': index_lib['names'][i],
+        'topic': index_lib['tags'][i],
+        'index': int(i)
+    } for i, score in zip(indices, scores)]
@@ -0,0 +1,730 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+import httpx
+import openai
+from server.config import client, async_client, embedding_model, model_tiers, call_site_tiers, default_tier, llm_backends
+from utils.response_cache import response_key, get_cached_response, store_response
+from utils.context_packer import count_tokens, count_message_tokens
+
+# Shared transport for every LLM and embedding call.
+# All calls go through the OpenAI client from server/config.py, whose HTTP connection pool
+# keeps connections to the LLM server alive between calls. On top of it this module adds
+# the same timeouts everywhere, retries with exponential backoff on connection errors and
+# server errors, latency and token metrics per call site (served as /metrics by the
+# Flask apps, see utils/metrics.py), and an opt-in response cache for
+# deterministic calls (utils/response_cache.py).
+# Identical calls (same model, messages and parameters) made at the same time are coalesced:
+# only the first one goes to the LLM server, the others wait for it and get the same response.
+# The model (and server) of each chat call comes from its call site's tier in server/config.py.
+# Each tier is served by a pool of backends (OpenAI-compatible servers, llm_backends in server/config.py):
+# a call goes to the least busy healthy backend and fails over to another one on connection errors,
+# timeouts and server errors. A backend that keeps failing is skipped for BREAKER_COOLDOWN seconds
+# (circuit breaker) while other backends are available, and a background thread checks every backend
+# every HEALTH_CHECK_INTERVAL seconds (a successful check closes its breaker).
+# Latency-sensitive calls can be hedged (hedge=True): if they take longer than the p95 latency of
+# their call site, the same request is also sent to another backend and the first answer wins.
+# Independent calls can also run concurrently: the async_* functions are coroutines, run with
+# gather_llm_calls on one shared event loop, at most MAX_CONCURRENT_CALLS at a time.
+
+# Seconds to wait for a connection, and for a whole response
+CONNECT_TIMEOUT = 5.0
+LLM_TIMEOUT = 60.0
+EMBEDDING_TIMEOUT = 30.0
+# Retries after the first attempt, waiting BACKOFF_SECONDS * 2**attempt (plus jitter) in between
+MAX_RETRIES = 2
+BACKOFF_SECONDS = 0.5
+# Async calls sent to each backend at the same time (LM Studio serves few requests in parallel,
+# the others would only queue there and run into their timeouts)
+MAX_CONCURRENT_CALLS = 4
+# Failed calls in a row after which a backend is skipped, and for how many seconds
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 30.0
+# Seconds between the health checks (GET /models) of the backends, and their timeout
+HEALTH_CHECK_INTERVAL = 10.0
+HEALTH_CHECK_TIMEOUT = 5.0
+# Hedged calls: the p95 latency of the last HEDGE_WINDOW calls of a call site is the hedging delay,
+# HEDGE_DEFAULT_DELAY seconds until HEDGE_MIN_SAMPLES calls were made
+HEDGE_WINDOW = 100
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 2.0
+# Upper bounds (seconds) of the latency and time-to-first-token histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Connection errors include timeouts (openai.APITimeoutError), which are only retried on another backend
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+
+class NoBackendAvailableError(RuntimeError):
+    """Every backend of the pool is down (failed health check)."""
+
+
+_lock = threading.Lock()
+# Per call site: request counts ('calls', 'errors', 'retries', 'cache_hits', 'coalesced', 'hedged',
+# 'failovers'), tokens
+# ('prompt_tokens', 'completion_tokens'), latency ('total_ms', 'max_ms', 'last_ms', 'latency_buckets')
+# and, for streamed calls, time to first token ('streams', 'ttft_total_ms', 'ttft_buckets')
+_call_metrics = {}
+# Latencies (ms) of the last successful calls of each call site, for the hedging delay
+_recent_latencies = {}
+# Calls in flight, by request key: {'done': threading.Event, 'response', 'error'}
+_in_flight = {}
+# Async calls in flight, by request key: asyncio.Task (only used in the event loop thread)
+_async_in_flight = {}
+
+# Backends by base_url: {'base_url', 'client', 'async_client', 'slots', 'in_flight', 'last_used',
+# 'healthy', 'failures', 'open_until', 'calls', 'errors'}
+_backends = {}
+_health_thread = None
+
+# Event loop (in a daemon thread) and semaphore of the async calls, created on first use
+_loop = None
+_loop_thread = None
+_call_slots = None
+
+
+def _timeout(seconds):
+    return httpx.Timeout(seconds, connect=CONNECT_TIMEOUT)
+
+
+def _site_metrics(call_site):
+    if call_site not in _call_metrics:
+        _call_metrics[call_site] = {
+            "calls": 0, "errors": 0, "retries": 0, "cache_hits": 0, "coalesced": 0, "hedged": 0, "failovers": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "latency_buckets": [0] * len(LATENCY_BUCKETS),
+            "streams": 0, "ttft_total_ms": 0.0, "ttft_buckets": [0] * len(LATENCY_BUCKETS),
+        }
+    return _call_metrics[call_site]
+
+
+def _count_in_buckets(buckets, ms):
+    # Buckets are not cumulative here, utils/metrics.py adds them up
+    for i, upper in enumerate(LATENCY_BUCKETS):
+        if ms <= upper * 1000:
+            buckets[i] += 1
+            return
+
+
+def _usage(response):
+    """(prompt tokens, completion tokens) reported by the server for a response."""
+    usage = getattr(response, "usage", None)
+    return (getattr(usage, "prompt_tokens", 0) or 0), (getattr(usage, "completion_tokens", 0) or 0)
+
+
+def _record_call(call_site, latency_ms, retries, failed, tokens=(0, 0), ttft_ms=None):
+    with _lock:
+        metrics = _site_metrics(call_site)
+        metrics["calls"] += 1
+        metrics["errors"] += int(failed)
+        metrics["retries"] += retries
+        metrics["prompt_tokens"] += tokens[0]
+        metrics["completion_tokens"] += tokens[1]
+        metrics["total_ms"] += latency_ms
+        metrics["max_ms"] = max(metrics["max_ms"], latency_ms)
+        metrics["last_ms"] = latency_ms
+        _count_in_buckets(metrics["latency_buckets"], latency_ms)
+        if ttft_ms is not None:
+            metrics["streams"] += 1
+            metrics["ttft_total_ms"] += ttft_ms
+            _count_in_buckets(metrics["ttft_buckets"], ttft_ms)
+        elif not failed:
+            _recent_latencies.setdefault(call_site, deque(maxlen=HEDGE_WINDOW)).append(latency_ms)
+
+
+def _record_cache_hit(call_site):
+    with _lock:
+        _site_metrics(call_site)["cache_hits"] += 1
+
+
+def _record_failover(call_site, backend, error):
+    with _lock:
+        _site_metrics(call_site)["failovers"] += 1
+    print(f"LLM call '{call_site}' failed on {backend['base_url']} ({type(error).__name__}), trying another backend...")
+
+
+def get_call_metrics():
+    """Returns a snapshot of the metrics per call site, with the average latency of the LLM calls."""
+    with _lock:
+        return {
+            call_site: dict(metrics, avg_ms=metrics["total_ms"] / max(metrics["calls"], 1),
+                            latency_buckets=list(metrics["latency_buckets"]), ttft_buckets=list(metrics["ttft_buckets"]))
+            for call_site, metrics in _call_metrics.items()
+        }
+
+
+# ---- Backend pool ----
+
+def _backend(base_url, api_key):
+    # Called with _lock held
+    base_url = base_url.rstrip("/")
+    if base_url not in _backends:
+        if base_url == str(client.base_url).rstrip("/"):
+            clients = client, async_client
+        else:
+            clients = openai.OpenAI(base_url=base_url, api_key=api_key), openai.AsyncOpenAI(base_url=base_url, api_key=api_key)
+        # Retries and failover are done here, the SDK's own retries would multiply the attempts
+        clients = tuple(c.with_options(max_retries=0) for c in clients)
+        _backends[base_url] = {
+            "base_url": base_url, "client": clients[0], "async_client": clients[1], "slots": None,
+            "in_flight": 0, "last_used": 0.0, "healthy": True, "failures": 0, "open_until": 0.0,
+            "calls": 0, "errors": 0,
+        }
+        _start_health_checks()
+    return _backends[base_url]
+
+
+def _client_backend(llm_client):
+    # Backend for a client passed by the caller, outside the pool (no health checks)
+    return {
+        "base_url": str(llm_client.base_url).rstrip("/"), "client": llm_client, "async_client": llm_client,
+        "slots": None, "in_flight": 0, "last_used": 0.0, "healthy": True, "failures": 0, "open_until": 0.0,
+        "calls": 0, "errors": 0,
+    }
+
+
+def model_for(call_site):
+    """
+    The model and backends of the tier that serves a call site (model_tiers and call_site_tiers
+    in server/config.py). A tier without "base_url" or "base_urls" is served by llm_backends.
+
+    Returns:
+        tuple: (model, list of backends)
+    """
+    tier = model_tiers[call_site_tiers.get(call_site, default_tier)]
+    base_urls = tier.get("base_urls") or ([tier["base_url"]] if tier.get("base_url") else llm_backends)
+    api_key = tier.get("api_key", client.api_key)
+    with _lock:
+        return tier["model"], [_backend(base_url, api_key) for base_url in base_urls]
+
+
+def _tier_model(call_site, model, llm_client):
+    tier_model, backends = model_for(call_site)
+    if llm_client is not None:
+        backends = [_client_backend(llm_client.with_options(max_retries=0))]
+    return model or tier_model, backends
+
+
+def _default_backends(llm_client):
+    # Backends of the embedding calls: the whole llm_backends pool
+    if llm_client is not None:
+        return [_client_backend(llm_client.with_options(max_retries=0))]
+    with _lock:
+        return [_backend(base_url, client.api_key) for base_url in llm_backends]
+
+
+def _available(backend, now):
+    return backend["healthy"] and backend["open_until"] <= now
+
+
+def _pick_backend(backends, tried=(), others_only=False):
+    """
+    Takes the least busy available backend, preferring the ones this call hasn't tried yet
+    (with others_only, only those). Returns None if no backend is available.
+    """
+    now = time.time()
+    with _lock:
+        available = [b for b in backends if _available(b, now)]
+        if not available and not others_only:
+            # The breaker never empties the pool: healthy backends with an open circuit are tried again
+            available = [b for b in backends if b["healthy"]]
+        untried = [b for b in available if all(b is not t for t in tried)]
+        candidates = untried if untried or others_only else available
+        if not candidates:
+            return None
+        backend = min(candidates, key=lambda b: (b["in_flight"], b["last_used"]))
+        backend["in_flight"] += 1
+        backend["last_used"] = now
+        return backend
+
+
+def _has_untried(backends, tried):
+    now = time.time()
+    with _lock:
+        return any(_available(b, now) and all(b is not t for t in tried) for b in backends)
+
+
+def _no_backend(backends):
+    return NoBackendAvailableError(
+        f"No LLM backend available ({', '.join(b['base_url'] for b in backends)} down or failing).")
+
+
+def _backend_result(backend, error=None):
+    """Updates the circuit breaker of a backend after a request (error: its exception, or None)."""
+    with _lock:
+        backend["calls"] += 1
+        if error is None:
+            if backend["failures"] >= BREAKER_FAILURES:
+                print(f"LLM backend {backend['base_url']} answered again, circuit closed.")
+            backend["failures"] = 0
+            backend["open_until"] = 0.0
+        elif isinstance(error, RETRYABLE_ERRORS):
+            # Other errors (e.g. a bad request) say nothing about the backend's health
+            backend["errors"] += 1
+            backend["failures"] += 1
+            if backend["failures"] >= BREAKER_FAILURES:
+                backend["open_until"] = time.time() + BREAKER_COOLDOWN
+                print(f"LLM backend {backend['base_url']} failed {backend['failures']} times in a row, "
+                      f"skipped for {BREAKER_COOLDOWN:.0f}s.")
+
+
+def _release(backend):
+    with _lock:
+        backend["in_flight"] -= 1
+
+
+def _start_health_checks():
+    # Called with _lock held
+    global _health_thread
+    if _health_thread is None:
+        _health_thread = threading.Thread(target=_health_check_loop, name="llm-health", daemon=True)
+        _health_thread.start()
+
+
+def _check_health(backend):
+    try:
+        backend["client"].models.list(timeout=_timeout(HEALTH_CHECK_TIMEOUT))
+        healthy = True
+    except RETRYABLE_ERRORS:
+        healthy = False
+    except Exception:
+        # The server answered (e.g. 404 if it has no /models route)
+        healthy = True
+    with _lock:
+        if healthy != backend["healthy"]:
+            print(f"LLM backend {backend['base_url']} is {'up again' if healthy else 'down'}.")
+        backend["healthy"] = healthy
+        if healthy and backend["open_until"]:
+            print(f"LLM backend {backend['base_url']} answers health checks, circuit closed.")
+        if healthy:
+            backend["failures"] = 0
+            backend["open_until"] = 0.0
+
+
+def _health_check_loop():
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL)
+        with _lock:
+            backends = list(_backends.values())
+        for backend in backends:
+            _check_health(backend)
+
+
+def get_backend_status():
+    """Returns the state of every backend of the pool: health, circuit breaker, requests in flight and counts."""
+    now = time.time()
+    with _lock:
+        return [
+            {"base_url": b["base_url"], "healthy": b["healthy"], "circuit_open": b["open_until"] > now,
+             "in_flight": b["in_flight"], "calls": b["calls"], "errors": b["errors"]}
+            for b in _backends.values()
+        ]
+
+
+def _hedge_delay(call_site):
+    """Seconds after which a hedged call is sent again: the p95 latency of the call site's recent calls."""
+    with _lock:
+        latencies = sorted(_recent_latencies.get(call_site, ()))
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return latencies[int(0.95 * (len(latencies) - 1))] / 1000
+
+
+def _cached(call_site, key):
+    start = time.perf_counter()
+    response = get_cached_response(key)
+    if response is not None:
+        # Marked on a copy, so callers can tell a stored answer from a new one
+        response = response.model_copy()
+        response.from_cache = True
+        _record_cache_hit(call_site)
+        print(f"LLM call '{call_site}' answered from the response cache in {(time.perf_counter() - start) * 1e6:.0f} µs.")
+    return response
+
+
+def _record_coalesced(call_site):
+    with _lock:
+        _site_metrics(call_site)["coalesced"] += 1
+    print(f"LLM call '{call_site}' joined an identical call in flight.")
+
+
+def _single_flight(call_site, key, request):
+    """Sends request(), unless an identical call is already in flight: then waits for its response."""
+    with _lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = {"done": threading.Event(), "response": None, "error": None}
+    if not leader:
+        _record_coalesced(call_site)
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["response"]
+    try:
+        flight["response"] = request()
+        return flight["response"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _lock:
+            del _in_flight[key]
+        flight["done"].set()
+
+
+def _retryable(error, untried):
+    """Whether a failed request is tried again (untried: another backend is available)."""
+    if not isinstance(error, RETRYABLE_ERRORS):
+        return False
+    # A server that let a request time out is stalled: asking it again would only wait
+    # for another timeout, so timeouts are only retried on another backend
+    return untried or not isinstance(error, openai.APITimeoutError)
+
+
+def _request_with_retries(call_site, backends, request, timeout, retries, hold=False, used=None):
+    """
+    Sends request(llm_client, timeout) to a backend of the pool, retrying on RETRYABLE_ERRORS:
+    at once on another backend if there is one, else after a backoff (except for timeouts).
+    `used` (a one-item list) gets the number of retries made, also when the call fails.
+
+    Returns:
+        tuple: (response, retries used, backend). With hold, the backend stays counted as busy
+               until the caller releases it (for streams).
+    """
+    attempt, tried, error = 0, [], None
+    used = used if used is not None else [0]
+    while True:
+        backend = _pick_backend(backends, tried)
+        if backend is None:
+            raise error or _no_backend(backends)
+        tried.append(backend)
+        try:
+            response = request(backend["client"], timeout)
+        except Exception as e:
+            _backend_result(backend, e)
+            _release(backend)
+            untried = _has_untried(backends, tried)
+            if not _retryable(e, untried) or attempt >= retries:
+                raise
+            error = e
+            attempt += 1
+            used[0] = attempt
+            if untried:
+                _record_failover(call_site, backend, e)
+                continue
+            delay = BACKOFF_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+            print(f"LLM call '{call_site}' failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+        _backend_result(backend)
+        if not hold:
+            _release(backend)
+        return response, attempt, backend
+
+
+def _call_with_retries(call_site, backends, request, timeout, retries):
+    start = time.perf_counter()
+    used = [0]
+    try:
+        response, attempts, _ = _request_with_retries(call_site, backends, request, timeout, retries, used=used)
+    except Exception:
+        latency_ms = (time.perf_counter() - start) * 1000
+        _record_call(call_site, latency_ms, used[0], failed=True)
+        print(f"LLM call '{call_site}' failed after {latency_ms:.0f} ms.")
+        raise
+    latency_ms = (time.perf_counter() - start) * 1000
+    _record_call(call_site, latency_ms, attempts, failed=False, tokens=_usage(response))
+    print(f"LLM call '{call_site}' took {latency_ms:.0f} ms.")
+    return response
+
+
+def chat_completion(call_site, messages, model=None, timeout=LLM_TIMEOUT, retries=MAX_RETRIES,
+                    llm_client=None, cache=False, cache_if=None, hedge=False, **params):
+    """
+    Chat completion through the shared connection pool.
+
+    Args:
+        call_site (str): Name of the calling function, used for the metrics.
+        messages (list): Chat messages.
+        model (str): Completion model (defaults to the model of the call site's tier, see model_for).
+        timeout (float): Seconds to wait for the whole response.
+        retries (int): Retries on connection or server errors.
+        llm_client: Another OpenAI-compatible client to use instead of the tier's backends.
+        cache (bool): Reuse the stored response of an identical earlier call (same model, messages
+                      and parameters). Only for deterministic calls, e.g. classifiers at temperature 0.
+        cache_if: With cache, a function that tells if a response is valid (response -> bool). Only
+                  valid responses are stored, so a malformed answer isn't repeated for the whole TTL.
+        hedge (bool): Send the request to a second backend if the first one is slower than the p95
+                      latency of this call site, and keep the first answer. Only for short,
+                      latency-sensitive calls; needs a tier with several backends.
+        **params: Other chat completion parameters (temperature, max_tokens, ...).
+
+    Returns:
+        The chat completion response (content in response.choices[0].message.content).
+    """
+    model, backends = _tier_model(call_site, model, llm_client)
+    if hedge and len(backends) > 1 and threading.current_thread() is not _loop_thread:
+        # Hedging races two requests, which the event loop can cancel
+        return asyncio.run_coroutine_threadsafe(
+            async_chat_completion(call_site, messages, model, timeout, retries, cache=cache,
+                                  cache_if=cache_if, hedge=True, **params),
+            _event_loop()
+        ).result()
+    key = response_key(model, messages, params)
+    if cache:
+        response = _cached(call_site, key)
+        if response is not None:
+            return response
+
+    def request():
+        response = _call_with_retries(
+            call_site, backends,
+            lambda llm_client, t: llm_client.chat.completions.create(model=model, messages=messages,
+                                                                     timeout=_timeout(t), **params),
+            timeout, retries
+        )
+        if cache and (cache_if is None or cache_if(response)):
+            store_response(key, model, response)
+        return response
+
+    return _single_flight(call_site, key, request)
+
+
+def stream_chat_completion(call_site, messages, model=None, timeout=LLM_TIMEOUT, retries=MAX_RETRIES,
+                           llm_client=None, **params):
+    """
+    Streamed chat completion: a generator of the text pieces of the answer, as the LLM
+    generates them (same arguments as chat_completion). Retries and failovers only happen
+    before the first piece; the latency is recorded once the stream ends. If the server
+    doesn't report the token usage of a stream, the tokens are counted here.
+    """
+    model, backends = _tier_model(call_site, model, llm_client)
+    start = time.perf_counter()
+    stream, backend, failed, ttft_ms, usage = None, None, True, None, None
+    pieces, used = [], [0]
+    try:
+        stream, _, backend = _request_with_retries(
+            call_site, backends,
+            lambda llm_client, t: llm_client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                                     timeout=_timeout(t), **params),
+            timeout, retries, hold=True, used=used
+        )
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            piece = chunk.choices[0].delta.content if chunk.choices else None
+            if piece:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                    print(f"LLM call '{call_site}': first token after {ttft_ms:.0f} ms.")
+                pieces.append(piece)
+                yield piece
+        failed = False
+    except GeneratorExit:
+        # The caller stopped reading early (e.g. structured output with a complete JSON object)
+        failed = False
+        raise
+    finally:
+        if stream is not None:
+            stream.close()
+        if backend is not None:
+            _release(backend)
+        latency_ms = (time.perf_counter() - start) * 1000
+        if usage is not None:
+            tokens = (usage.prompt_tokens or 0, usage.completion_tokens or 0)
+        else:
+            tokens = (count_message_tokens(messages), count_tokens("".join(pieces)))
+        _record_call(call_site, latency_ms, used[0], failed, tokens, ttft_ms)
+        print(f"LLM call '{call_site}' {'failed after' if failed else 'took'} {latency_ms:.0f} ms (streamed).")
+
+
+def create_embeddings(call_site, texts, model=embedding_model, timeout=EMBEDDING_TIMEOUT, retries=MAX_RETRIES,
+                      llm_client=None, **params):
+    """Embeddings request through the shared connection pool (same arguments as chat_completion)."""
+    backends = _default_backends(llm_client)
+    request = lambda: _call_with_retries(
+        call_site, backends,
+        lambda llm_client, t: llm_client.embeddings.create(input=texts, model=model, timeout=_timeout(t), **params),
+        timeout, retries
+    )
+    return _single_flight(call_site, response_key(model, {"input": texts}, params), request)
+
+
+# ---- Async calls ----
+
+def _event_loop():
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="llm-calls", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def _slots(backend):
+    # Only called from the event loop thread, so no lock is needed
+    if backend["slots"] is None:
+        backend["slots"] = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    return backend["slots"]
+
+
+async def _async_single_flight(call_site, key, request):
+    """Async version of _single_flight. The shared call is shielded, so a cancelled caller doesn't cancel it."""
+    task = _async_in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(request())
+        _async_in_flight[key] = task
+        task.add_done_callback(lambda _: _async_in_flight.pop(key, None))
+    else:
+        _record_coalesced(call_site)
+    return await asyncio.shield(task)
+
+
+async def _async_send(backend, request, timeout):
+    """One request to one backend (picked by _pick_backend), in one of its slots."""
+    try:
+        async with _slots(backend):
+            response = await request(backend["async_client"], timeout)
+    except Exception as e:
+        _backend_result(backend, e)
+        raise
+    finally:
+        # Also when cancelled (the other request of a hedged call won): not the backend's fault
+        _release(backend)
+    _backend_result(backend)
+    return response
+
+
+async def _async_attempt(call_site, backends, request, timeout, hedge, tried, error):
+    """One attempt of an async call (error: the one of the previous attempt). A hedged attempt also
+    sends the request to a second backend after the hedging delay, and returns the first success."""
+    backend = _pick_backend(backends, tried)
+    if backend is None:
+        raise error or _no_backend(backends)
+    tried.append(backend)
+    tasks = [asyncio.ensure_future(_async_send(backend, request, timeout))]
+    try:
+        if not hedge:
+            return await tasks[0]
+        delay = _hedge_delay(call_site)
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        second = None if done else _pick_backend(backends, tried, others_only=True)
+        if second is None:
+            return await tasks[0]
+        tried.append(second)
+        tasks.append(asyncio.ensure_future(_async_send(second, request, timeout)))
+        with _lock:
+            _site_metrics(call_site)["hedged"] += 1
+        print(f"LLM call '{call_site}' slower than {delay * 1000:.0f} ms on {backend['base_url']}, "
+              f"also sent to {second['base_url']}.")
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                return succeeded[0].result()
+            if not pending:
+                raise done.pop().exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _async_call_with_retries(call_site, backends, request, timeout, retries, hedge=False):
+    """Async version of _call_with_retries. Each request waits for a free slot of its backend."""
+    start = time.perf_counter()
+    attempt, tried, error = 0, [], None
+    while True:
+        try:
+            response = await _async_attempt(call_site, backends, request, timeout, hedge, tried, error)
+            break
+        except RETRYABLE_ERRORS as e:
+            untried = _has_untried(backends, tried)
+            if e is error or not _retryable(e, untried) or attempt >= retries:
+                latency_ms = (time.perf_counter() - start) * 1000
+                _record_call(call_site, latency_ms, attempt, failed=True)
+                print(f"LLM call '{call_site}' failed after {latency_ms:.0f} ms.")
+                raise
+            error = e
+            attempt += 1
+            if untried:
+                _record_failover(call_site, tried[-1], e)
+                continue
+            delay = BACKOFF_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+            print(f"LLM call '{call_site}' failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+        except Exception:
+            latency_ms = (time.perf_counter() - start) * 1000
+            _record_call(call_site, latency_ms, attempt, failed=True)
+            print(f"LLM call '{call_site}' failed after {latency_ms:.0f} ms.")
+            raise
+    latency_ms = (time.perf_counter() - start) * 1000
+    _record_call(call_site, latency_ms, attempt, failed=False, tokens=_usage(response))
+    print(f"LLM call '{call_site}' took {latency_ms:.0f} ms (async).")
+    return response
+
+
+async def async_chat_completion(call_site, messages, model=None, timeout=LLM_TIMEOUT, retries=MAX_RETRIES,
+                                llm_client=None, cache=False, cache_if=None, hedge=False, **params):
+    """Coroutine version of chat_completion (llm_client: an AsyncOpenAI-compatible client)."""
+    model, backends = _tier_model(call_site, model, llm_client)
+    key = response_key(model, messages, params)
+    if cache:
+        response = _cached(call_site, key)
+        if response is not None:
+            return response
+
+    async def request():
+        response = await _async_call_with_retries(
+            call_site, backends,
+            lambda llm_client, t: llm_client.chat.completions.create(model=model, messages=messages,
+                                                                     timeout=_timeout(t), **params),
+            timeout, retries, hedge=hedge and len(backends) > 1
+        )
+        if cache and (cache_if is None or cache_if(response)):
+            store_response(key, model, response)
+        return response
+
+    return await _async_single_flight(call_site, key, request)
+
+
+async def async_create_embeddings(call_site, texts, model=embedding_model, timeout=EMBEDDING_TIMEOUT,
+                                  retries=MAX_RETRIES, llm_client=None, **params):
+    """Coroutine version of create_embeddings."""
+    backends = _default_backends(llm_client)
+    request = lambda: _async_call_with_retries(
+        call_site, backends,
+        lambda llm_client, t: llm_client.embeddings.create(input=texts, model=model, timeout=_timeout(t), **params),
+        timeout, retries
+    )
+    return await _async_single_flight(call_site, response_key(model, {"input": texts}, params), request)
+
+
+def gather_llm_calls(*calls, return_exceptions=False):
+    """
+    Runs independent LLM calls concurrently and waits for all of them, from normal (sync) code.
+    The total time is about the one of the slowest call instead of the sum of all of them.
+
+    Args:
+        *calls: Coroutines, e.g. async_chat_completion(...) or an async function built on it.
+        return_exceptions (bool): If True, a failed call gives its exception in the results
+                                  instead of raising it.
+
+    Returns:
+        list: The results, in the order of the calls.
+
+    Example:
+        vector, label = gather_llm_calls(get_embedding_async(q), async_chat_completion("classify", messages))
+    """
+    loop = _event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("gather_llm_calls can't be used inside an async call, use asyncio.gather there.")
+
+    async def gather():
+        return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+    return asyncio.run_coroutine_threadsafe(gather(), loop).result()
@@ -0,0 +1,72 @@
+from flask import Response
+from utils.llm_transport import get_call_metrics, get_backend_status, LATENCY_BUCKETS
+
+# The LLM call metrics of utils/llm_transport.py in the Prometheus text format.
+# Every Flask app serves them on GET /metrics, e.g. http://localhost:5000/metrics for main.py.
+# Each metric has one series per call site (the function that made the call, e.g. generate_sql_query),
+# the backend metrics one per LLM server of the pool.
+# Time to first token is only measured for streamed calls: a normal call gets all its tokens at the end.
+
+COUNTERS = (
+    ("llm_calls_total", "calls", "Requests sent to the LLM or embedding server."),
+    ("llm_call_errors_total", "errors", "Requests that failed after all their retries."),
+    ("llm_call_retries_total", "retries", "Retries after connection or server errors."),
+    ("llm_cache_hits_total", "cache_hits", "Calls answered from the response cache."),
+    ("llm_coalesced_calls_total", "coalesced", "Calls that shared the request of an identical call in flight."),
+    ("llm_hedged_calls_total", "hedged", "Calls also sent to a second backend after the hedging delay."),
+    ("llm_failovers_total", "failovers", "Failed requests retried on another backend."),
+    ("llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent."),
+    ("llm_completion_tokens_total", "completion_tokens", "Completion tokens received."),
+)
+HISTOGRAMS = (
+    ("llm_call_latency_seconds", "latency_buckets", "total_ms", "calls", "Total latency of the requests."),
+    ("llm_time_to_first_token_seconds", "ttft_buckets", "ttft_total_ms", "streams",
+     "Time to the first token of the streamed requests."),
+)
+BACKEND_GAUGES = (
+    ("llm_backend_up", lambda b: int(b["healthy"] and not b["circuit_open"]),
+     "1 if the backend takes calls, 0 if its health check failed or its circuit breaker is open."),
+    ("llm_backend_in_flight", lambda b: b["in_flight"], "Requests in flight on the backend."),
+)
+
+
+def _label(call_site, name="call_site"):
+    escaped = call_site.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return f'{name}="{escaped}"'
+
+
+def prometheus_metrics():
+    """Returns the metrics of every call site as Prometheus text."""
+    metrics = get_call_metrics()
+    lines = []
+    for name, key, description in COUNTERS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for call_site, values in sorted(metrics.items()):
+            lines.append(f"{name}{{{_label(call_site)}}} {values[key]}")
+
+    for name, buckets_key, sum_key, count_key, description in HISTOGRAMS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} histogram")
+        for call_site, values in sorted(metrics.items()):
+            label = _label(call_site)
+            cumulative = 0
+            for upper, count in zip(LATENCY_BUCKETS, values[buckets_key]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{upper}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {values[count_key]}')
+            lines.append(f"{name}_sum{{{label}}} {values[sum_key] / 1000:.6f}")
+            lines.append(f"{name}_count{{{label}}} {values[count_key]}")
+
+    backends = get_backend_status()
+    for name, value, description in BACKEND_GAUGES:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        for backend in backends:
+            lines.append(f"{name}{{{_label(backend['base_url'], 'backend')}}} {value(backend)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_response():
+    """Flask response for a /metrics route."""
+    return Response(prometheus_metrics(), mimetype="text/plain; version=0.0.4")
@@ -2,42 +2,92 @@ import sys
 sys.path.insert(0, 'C:\\Users\\Matea\\Documents\\IAAC\\3\\studio\\SQL\\LLM-SQL-Retrieval')
 import numpy as np
 import json
+import asyncio
 from server.config import *
-from server.config import client, completion_model 
+from server.config import client 
+from utils.llm_transport import chat_completion, stream_chat_completion, create_embeddings, async_create_embeddings, model_for
+from utils.vector_store import store_is_fresh, convert_json_to_store, load_store
+from utils.vector_search import top_k
+from utils.ann_index import search_store
+from utils.knowledge_index import search_knowledge, load_knowledge_index, knowledge_topics
+from utils.answer_cache import answer_scope, knowledge_fingerprint, lookup_answer, store_answer
+from utils.bm25 import hybrid_search
+from utils.embedding_cache import get_cached_embedding, store_embedding
+from utils.context_packer import pack_context, MMR_CANDIDATE_FACTOR
 
 # This script is only used as a RAG tool for other scripts.
 
+def _embedding_params():
+    # OpenAI embeddings are shortened to the 768 dimensions of the stored vectors
+    return {"dimensions": 768} if mode == "openai" else {}
+
 def get_embedding(text, model=embedding_model):
     text = text.replace("\n", " ")
-    if mode == "openai":
-        response = client.embeddings.create(input = [text], dimensions = 768, model=model)
-    else:
-        response = client.embeddings.create(input = [text], model=model)
+    # Repeated questions are answered from the embedding cache (memory, then disk)
+    vector = get_cached_embedding(text, model)
+    if vector is not None:
+        return vector
+    response = create_embeddings("get_embedding", [text], model=model, **_embedding_params())
     vector = response.data[0].embedding
+    store_embedding(text, model, vector)
+    return vector
+
+# Same as get_embedding, as a coroutine to run next to other LLM calls (utils/llm_transport.gather_llm_calls).
+# The embedding cache reads and writes (SQLite) run in a worker thread, so they don't block the event loop.
+async def get_embedding_async(text, model=embedding_model):
+    loop = asyncio.get_running_loop()
+    text = text.replace("\n", " ")
+    vector = await loop.run_in_executor(None, get_cached_embedding, text, model)
+    if vector is not None:
+        return vector
+    response = await async_create_embeddings("get_embedding", [text], model=model, **_embedding_params())
+    vector = response.data[0].embedding
+    await loop.run_in_executor(None, store_embedding, text, model, vector)
     return vector
 
 def similarity(v1, v2):
     return np.dot(v1, v2)
 
+# Loads a knowledge file as a binary vector store (see utils/vector_store.py).
+# The store is (re)built from the JSON file the first time, or whenever the JSON is newer.
 def load_embeddings(embeddings):
-    with open(embeddings, 'r', encoding='utf8') as infile:
-        return json.load(infile)
+    if not store_is_fresh(embeddings):
+        print(f"Converting {embeddings} to a binary vector store...")
+        convert_json_to_store(embeddings)
+    return load_store(embeddings)
     
+def _scored_chunks(index_lib, indices, scores):
+    return [{
+        'content': index_lib['contents'][i],
+        'score': float(score),
+        "name": index_lib['names'][i],
+        "index": int(i)
+    } for i, score in zip(indices, scores)]
+
 def get_vectors(question_vector, index_lib, n_results):
-    scores = []
-    for vector in index_lib:
-        score = similarity(question_vector, vector['vector'])
-        scores.append({
-            'content': vector['content'],
-            'score': score,
-            "name": vector.get('name', '')  # Use empty string if 'name' is missing
-        })
-    scores.sort(key=lambda x: x['score'], reverse=True)
-    best_vectors = scores[0:n_results]
-    return best_vectors
-
-def rag_answer(question, prompt, model=completion_model):
-    completion = client.chat.completions.create(
+    indices, scores = search_store(index_lib, None, question_vector, n_results)
+    return _scored_chunks(index_lib, indices, scores)
+
+# Same as get_vectors, for several question vectors scored in one pass
+# (e.g. the parts of a multi-part question). Returns one result list per question.
+def get_vectors_batch(question_vectors, index_lib, n_results):
+    indices, scores = top_k(index_lib['vectors'], question_vectors, n_results)
+    return [_scored_chunks(index_lib, row_indices, row_scores)
+            for row_indices, row_scores in zip(indices, scores)]
+
+# Like get_vectors, but uses the file's IVF index (utils/ann_index.py) for large corpora.
+# With the question text, vector and BM25 keyword rankings are fused (utils/bm25.py).
+def search_vectors(question_vector, index_lib, n_results, embedding_file=None, question_text=None):
+    if question_text and embedding_file:
+        indices, scores = hybrid_search(index_lib, embedding_file, question_vector, question_text, n_results)
+    else:
+        indices, scores = search_store(index_lib, embedding_file, question_vector, n_results)
+    return _scored_chunks(index_lib, indices, scores)
+
+# model: None for the model of the call site's tier (server/config.py)
+def rag_answer(question, prompt, model=None):
+    completion = chat_completion(
+        "rag_answer",
         model=model,
         messages=[
             {"role": "system", 
@@ -62,22 +112,45 @@ def sql_rag_call(question, embeddings, n_results):
     index_lib = load_embeddings(embeddings)
 
     # Retrieve the best vectors
-    scored_vectors = get_vectors(question_vector, index_lib, n_results)
+    scored_vectors = search_vectors(question_vector, index_lib, n_results, embeddings, question)
     relevant_name = "\n".join([vector['name'] for vector in scored_vectors])
     relevant_description = "\n".join([vector['content'] for vector in scored_vectors])
 
     return relevant_name, relevant_description
 
 MAX_HISTORY = 10  # or whatever fits your model/context window
-
-def answer_from_knowledge(user_message, embedding_file, conversation_history=None, n_results=3):
+# The chunks and history that go into the prompt are also limited in tokens (utils/context_packer.py)
+
+# Without an embedding_file, all knowledge topics are searched at once (utils/knowledge_index.py),
+# optionally restricted to some topics.
+# Answers to near-identical questions are served from the semantic answer cache (utils/answer_cache.py).
+# With stream=True, the answer is returned as a generator of text pieces (LLM tokens).
+def answer_from_knowledge(user_message, embedding_file=None, conversation_history=None, n_results=3, topics=None,
+                          use_cache=True, stream=False):
     print("Getting embedding...")
     question_vector = get_embedding(user_message)
-    print("Loading embeddings...")
-    index_lib = load_embeddings(embedding_file)
+
+    history = conversation_history[-MAX_HISTORY:] if conversation_history else []
+    source_files = [embedding_file] if embedding_file else list(knowledge_topics().values())
+    scope = answer_scope(embedding_file or "all_topics", history, {"topics": sorted(topics or []), "n_results": n_results},
+                         {"embedding": embedding_model, "completion": model_for("answer_from_knowledge")[0]})
+    fingerprint = knowledge_fingerprint(source_files)
+    if use_cache:
+        cached_answer = lookup_answer(question_vector, scope, fingerprint)
+        if cached_answer is not None:
+            return iter([cached_answer]) if stream else cached_answer
+
     print("Getting vectors...")
-    scored_vectors = get_vectors(question_vector, index_lib, n_results)
-    context = "\n\n".join([vector['content'] for vector in scored_vectors])
+    # More candidates than needed are retrieved, the packer keeps the best non-redundant ones
+    n_candidates = n_results * MMR_CANDIDATE_FACTOR
+    if embedding_file:
+        index_lib = load_embeddings(embedding_file)
+        scored_vectors = search_vectors(question_vector, index_lib, n_candidates, embedding_file, user_message)
+    else:
+        index_lib = load_knowledge_index()
+        scored_vectors = search_knowledge(question_vector, n_candidates, topics, user_message)
+    candidate_vectors = index_lib['vectors'][[vector['index'] for vector in scored_vectors]]
+    context, history = pack_context(question_vector, scored_vectors, candidate_vectors, history, n_results)
 
     prompt = (
         "You are an expert assistant. Using ONLY the information below and the conversation so far, "
@@ -87,17 +160,32 @@ def answer_from_knowledge(user_message, embedding_file, conversation_history=Non
     )
 
     messages = [{"role": "system", "content": prompt}]
-    if conversation_history:
-        messages.extend(conversation_history[-MAX_HISTORY:])
+    messages.extend(history)
     messages.append({"role": "user", "content": user_message})
 
     print("Calling LLM...")
-    response = client.chat.completions.create(
-        model=completion_model,
+    if stream:
+        return _stream_and_cache(
+            stream_chat_completion("answer_from_knowledge", messages=messages, temperature=0.4, max_tokens=256),
+            user_message, question_vector, scope, fingerprint, use_cache
+        )
+    response = chat_completion(
+        "answer_from_knowledge",
         messages=messages,
         temperature=0.4,
         max_tokens=256,
     )
     print("LLM response received.")
-    return response.choices[0].message.content.strip()
-
+    answer = response.choices[0].message.content.strip()
+    if use_cache:
+        store_answer(user_message, question_vector, answer, scope, fingerprint)
+    return answer
+
+
+def _stream_and_cache(pieces, user_message, question_vector, scope, fingerprint, use_cache):
+    answer = []
+    for piece in pieces:
+        answer.append(piece)
+        yield piece
+    if use_cache:
+        store_answer(user_message, question_vector, "".join(answer).strip(), scope, fingerprint)
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from openai.types.chat import ChatCompletion
+
+# Cache for the responses of deterministic LLM calls (classifiers and routers at temperature 0),
+# so the same input doesn't need another round trip to the LLM. Call sites opt in with
+# chat_completion(..., cache=True) in utils/llm_transport.py.
+# Entries are keyed by a hash of the model, the messages and the sampling parameters, so a
+# changed prompt or model never returns an old response. They expire after RESPONSE_TTL_SECONDS.
+# Recent entries live in memory (LRU); all entries are also kept in a SQLite file on disk.
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "cache", "response_cache.db")
+RESPONSE_TTL_SECONDS = 7 * 24 * 3600
+MAX_MEMORY_ENTRIES = 1024
+MAX_DISK_ENTRIES = 20000
+
+# key -> (created, response)
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+_db_ready = False
+
+
+def response_key(model, messages, params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True,
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        conn.commit()
+        _db_ready = True
+    return conn
+
+
+def _remember(key, created, response):
+    _memory_cache[key] = (created, response)
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > MAX_MEMORY_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+def get_cached_response(key):
+    """Returns the cached chat completion for this key, or None if there is none or it expired."""
+    now = time.time()
+    with _lock:
+        entry = _memory_cache.get(key)
+        if entry is not None:
+            if now - entry[0] < RESPONSE_TTL_SECONDS:
+                _memory_cache.move_to_end(key)
+                return entry[1]
+            del _memory_cache[key]
+
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= RESPONSE_TTL_SECONDS:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+        finally:
+            conn.close()
+
+        response = ChatCompletion.model_validate_json(row[0])
+        _remember(key, row[1], response)
+        return response
+
+
+def store_response(key, model, response):
+    """Saves a chat completion in memory and on disk, dropping expired and least recently used entries."""
+    now = time.time()
+    with _lock:
+        _remember(key, now, response)
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response.model_dump_json(), now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - RESPONSE_TTL_SECONDS,))
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > MAX_DISK_ENTRIES:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (count - MAX_DISK_ENTRIES,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def clear_response_cache():
+    with _lock:
+        _memory_cache.clear()
+        conn = _connect()
+        try:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,58 @@
+import json
+from flask import Response, request, stream_with_context
+
+# Server-sent events (SSE) for the chat endpoints.
+# A streaming request sends {"stream": true} in its JSON body (or "Accept: text/event-stream").
+# The answer is then sent as it is generated, one event per piece of text:
+#   data: {"token": "..."}
+# followed by one final event with the full answer (and any other fields of the normal response):
+#   data: {"done": true, "response": "...", ...}
+# or, if something fails halfway:
+#   data: {"error": "..."}
+
+
+def wants_stream(data):
+    """True if the client asked for a streamed (SSE) response."""
+    accept = request.headers.get("Accept", "")
+    return bool((data or {}).get("stream")) or "text/event-stream" in accept
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def sse_response(answer, on_complete=None):
+    """
+    Streams an answer as server-sent events.
+
+    Args:
+        answer: The answer, either a string or an iterable of text pieces (e.g. LLM tokens).
+        on_complete (callable): Called with the full answer text once it's complete. It may return
+                                a dict of extra fields for the final event (e.g. the conversation history).
+
+    Returns:
+        flask.Response: A text/event-stream response.
+    """
+    def events():
+        pieces = []
+        try:
+            for piece in ([answer] if isinstance(answer, str) else answer):
+                if piece:
+                    pieces.append(piece)
+                    yield sse_event({"token": piece})
+            full_answer = "".join(pieces).strip()
+            extra = (on_complete(full_answer) if on_complete else None) or {}
+            yield sse_event(dict({"done": True, "response": full_answer}, **extra))
+        except Exception as e:
+            print("Streaming error:", e)
+            yield sse_event({"error": str(e)})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def iter_sse_events(response):
+    """Client side: yields the JSON payloads of an SSE response opened with requests (stream=True)."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield json.loads(line[len("data:"):].strip())
@@ -0,0 +1,209 @@
+import re
+import json
+from utils.llm_transport import stream_chat_completion
+
+# Structured (JSON) output for the LLM calls that ask for a single JSON object.
+# The answer is streamed into an incremental scanner, and generation is stopped as soon as the
+# top-level object is closed, so the commentary models like to add afterwards is never generated.
+# The object is then parsed (with a few repairs of common LLM mistakes: comments copied from the
+# prompt examples, trailing commas, invalid escapes) and validated against the call's schema.
+# If that fails, the model is asked once more with the error, before giving up.
+
+# Times the model is asked again after an invalid answer
+JSON_REPAIRS = 1
+
+VALID_ESCAPE = re.compile(r'\\([^bfnrtu"\\/])')
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+TYPES = {
+    "object": (dict,), "array": (list,), "string": (str,), "boolean": (bool,),
+    "number": (int, float), "integer": (int,), "null": (type(None),),
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model gave no valid JSON object. `raw` holds its last answer."""
+
+    def __init__(self, message, raw):
+        super().__init__(message)
+        self.raw = raw
+
+
+class JsonObjectScanner:
+    """
+    Follows streamed text and tells when the first top-level JSON object is complete.
+    Text before the object (e.g. a ```json fence) is skipped, and braces inside strings
+    or in # comments don't count.
+    """
+
+    def __init__(self):
+        self.raw = []
+        self.object = []
+        self.depth = 0
+        self.in_string = False
+        self.in_comment = False
+        self.escaped = False
+        self.complete = False
+
+    @property
+    def text(self):
+        return "".join(self.object)
+
+    def feed(self, piece):
+        """Adds a piece of the answer. Returns True once the object is complete."""
+        self.raw.append(piece)
+        for char in piece:
+            if self.complete:
+                break
+            if not self.object:
+                if char != "{":
+                    continue
+            self.object.append(char)
+            if self.in_comment:
+                self.in_comment = char != "\n"
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "#":
+                self.in_comment = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                self.complete = self.depth == 0
+        return self.complete
+
+
+def _strip_comments(text):
+    # Removes '#' and '//' comments outside strings (the prompt examples have some)
+    result, in_string, escaped, i = [], False, False, 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "#" or text.startswith("//", i):
+            while i < len(text) and text[i] != "\n":
+                i += 1
+            continue
+        result.append(char)
+        i += 1
+    return "".join(result)
+
+
+def parse_json_object(text):
+    """Parses a JSON object, repairing comments, trailing commas and invalid escapes if needed."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    repaired = TRAILING_COMMA.sub(r"\1", _strip_comments(text))
+    repaired = VALID_ESCAPE.sub(r"\1", repaired.replace("\\ n", "\\n"))
+    return json.loads(repaired)
+
+
+def validate_json(value, schema, path="$"):
+    """
+    Checks a value against a schema (a subset of JSON Schema: type, enum, required, properties,
+    items, minItems, anyOf). Returns the list of errors, empty if the value is valid.
+    """
+    errors = []
+    if "anyOf" in schema:
+        options = [validate_json(value, option, path) for option in schema["anyOf"]]
+        if all(options):
+            errors.append(f"{path} matches none of the allowed forms ({'; '.join(options[0])})")
+    types = schema.get("type")
+    if types:
+        types = [types] if isinstance(types, str) else types
+        python_types = tuple(t for name in types for t in TYPES[name])
+        if not isinstance(value, python_types) or (isinstance(value, bool) and bool not in python_types):
+            return errors + [f"{path} should be {' or '.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path} should be one of {schema['enum']}")
+    if isinstance(value, dict):
+        errors.extend(f"{path}.{key} is missing" for key in schema.get("required", []) if key not in value)
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_json(value[key], property_schema, f"{path}.{key}"))
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path} should have at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(validate_json(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def check_json_answer(text, schema=None):
+    """
+    Extracts, parses and validates the JSON object of a complete answer (for non-streamed answers).
+
+    Returns:
+        tuple: (parsed object or None, error message or None)
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if not scanner.complete:
+        return None, "the answer has no complete JSON object"
+    try:
+        value = parse_json_object(scanner.text)
+    except json.JSONDecodeError as e:
+        return None, f"the JSON is invalid ({e})"
+    errors = validate_json(value, schema) if schema else []
+    if errors:
+        return None, "; ".join(errors)
+    return value, None
+
+
+def json_completion(call_site, messages, schema=None, repairs=JSON_REPAIRS, **params):
+    """
+    Chat completion that returns one JSON object, stopping generation once the object is complete.
+
+    Args:
+        call_site (str): Name of the calling function, used for the metrics.
+        messages (list): Chat messages asking for a JSON object.
+        schema (dict): Schema the object must match (see validate_json), or None to accept any object.
+        repairs (int): Times the model is asked again, with the error, after an invalid answer.
+        **params: Other arguments of stream_chat_completion (temperature, timeout, ...).
+
+    Returns:
+        The parsed object.
+
+    Raises:
+        StructuredOutputError: If no valid object came after the repairs.
+    """
+    messages = list(messages)
+    for attempt in range(repairs + 1):
+        scanner = JsonObjectScanner()
+        pieces = stream_chat_completion(call_site, messages, **params)
+        try:
+            for piece in pieces:
+                if scanner.feed(piece):
+                    break
+        finally:
+            # Closing the stream stops the generation on the server
+            pieces.close()
+
+        raw = "".join(scanner.raw)
+        if scanner.complete:
+            print(f"LLM call '{call_site}': JSON object complete after {len(raw)} characters, generation stopped.")
+        value, error = check_json_answer(raw, schema)
+        if error is None:
+            return value
+        print(f"LLM call '{call_site}': invalid JSON answer ({error}).")
+        messages += [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": f"Your answer was not valid: {error}. Return only the corrected JSON object."},
+        ]
+    raise StructuredOutputError(f"No valid JSON from '{call_site}' after {repairs + 1} attempts: {error}", raw)
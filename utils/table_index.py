@@ -0,0 +1,167 @@
+import os
+import re
+import numpy as np
+from server.config import client, embedding_model
+from sql_calls import get_dB_schema
+from utils.rag_utils import get_embedding, load_embeddings
+from utils.vector_store import store_paths, load_store, save_store_arrays
+from utils.embedding_builder import embed_in_batches
+
+# Table and column retrieval for NL -> SQL.
+# Table descriptions (knowledge/table_descriptions.json) and one vector per database column
+# are loaded once per process. A question gets ranked tables, each with its most relevant
+# columns, so the SQL prompt only needs the schema of the tables and columns that matter.
+
+TABLE_DESCRIPTIONS_FILE = "knowledge/table_descriptions.json"
+
+# Extra score when a table or column name is written in the question
+TABLE_NAME_BONUS = 1.0
+COLUMN_NAME_BONUS = 0.5
+# How much the best matching column counts towards its table's score
+COLUMN_WEIGHT = 0.5
+# A second table is only included when its score is this close to the best one
+TABLE_MARGIN = 0.1
+# Tables with more columns than this only get their most relevant columns in the prompt
+MAX_FULL_COLUMNS = 25
+
+_loaded_indexes = {}
+
+
+def _column_descriptions(descriptions):
+    # Table descriptions list their columns as "column_name: what it holds" lines, before the
+    # "Example rows:" block (whose "column: value, column: value" lines are not descriptions)
+    column_descriptions = {}
+    for table, content in descriptions.items():
+        for line in content.splitlines():
+            if re.match(r"\s*example", line, re.IGNORECASE):
+                break
+            match = re.match(r"\s*-?\s*([\w /]+?)\s*:\s*(.+)", line)
+            if match and match.group(1).strip().lower() != "columns":
+                column_descriptions.setdefault((table, match.group(1).strip().lower()), match.group(2).strip())
+    return column_descriptions
+
+
+def _column_texts(db_schema, descriptions):
+    column_descriptions = _column_descriptions(descriptions)
+    names, texts, tables = [], [], []
+    for table, columns in db_schema.items():
+        for column in columns:
+            description = column_descriptions.get((table, column.lower()), column.replace("_", " "))
+            names.append(column)
+            texts.append(f"Table {table}, column {column}: {description}")
+            tables.append(table)
+    return names, texts, tables
+
+
+def _columns_file(db_path):
+    db_name = os.path.splitext(os.path.basename(db_path))[0]
+    return f"knowledge/{db_name}_columns.json"
+
+
+def load_table_index(db_path):
+    """
+    Loads the table descriptions and the column vectors of a database, again when the database
+    or the descriptions file changed. Column vectors are embedded the first time, and again
+    whenever the schema or the embedding model changes.
+    """
+    mtimes = (os.path.getmtime(db_path), os.path.getmtime(TABLE_DESCRIPTIONS_FILE))
+    cached = _loaded_indexes.get(db_path)
+    if cached is not None and cached["mtime"] == mtimes:
+        return cached["index"]
+
+    db_schema = get_dB_schema(db_path)
+    tables = load_embeddings(TABLE_DESCRIPTIONS_FILE)
+    # Description names start with the table name
+    descriptions = {name.split()[0]: content for name, content in zip(tables['names'], tables['contents'])}
+
+    names, texts, column_tables = _column_texts(db_schema, descriptions)
+    columns_file = _columns_file(db_path)
+    matrix_path, _ = store_paths(columns_file)
+    columns = load_store(columns_file) if os.path.exists(matrix_path) else None
+    if columns is None or columns['contents'] != texts or columns['model'] != embedding_model:
+        print(f"Embedding {len(texts)} columns of {db_path}...")
+        vectors = embed_in_batches(texts, client, embedding_model)
+        save_store_arrays(np.asarray(vectors, dtype=np.float32), names, texts, column_tables, columns_file,
+                          embedding_model)
+        columns = load_store(columns_file)
+
+    index = {
+        "schema": db_schema,
+        "tables": tables,
+        "descriptions": descriptions,
+        "columns": columns,
+    }
+    _loaded_indexes[db_path] = {"mtime": mtimes, "index": index}
+    return index
+
+
+def _mentioned(name, text):
+    return re.search(rf"(?<![\w]){re.escape(name.lower())}(?![\w])", text) is not None
+
+
+def retrieve_tables(question, db_path, n_tables=2, n_columns=8):
+    """
+    Ranks the tables of a database for a question, with their most relevant columns.
+
+    Returns:
+        list: [{'table', 'score', 'description', 'columns': [(column, score), ...]}, ...] best first.
+              Only tables that are in the database schema are returned.
+    """
+    index = load_table_index(db_path)
+    question_vector = np.asarray(get_embedding(question), dtype=np.float32)
+    clean_question = re.sub(r"[\"']", "", question.lower())
+
+    columns = index['columns']
+    column_scores = np.asarray(columns['vectors'] @ question_vector, dtype=np.float32)
+    for i, column in enumerate(columns['names']):
+        if _mentioned(column, clean_question):
+            column_scores[i] += COLUMN_NAME_BONUS
+
+    description_scores = dict(zip(index['descriptions'],
+                                  np.asarray(index['tables']['vectors'] @ question_vector).tolist()))
+
+    ranked = []
+    for table in index['schema']:
+        rows = [i for i, tag in enumerate(columns['tags']) if tag == table]
+        table_column_scores = sorted(((columns['names'][i], float(column_scores[i])) for i in rows),
+                                     key=lambda item: item[1], reverse=True)
+        score = description_scores.get(table, 0.0)
+        if table_column_scores:
+            score += COLUMN_WEIGHT * table_column_scores[0][1]
+        if _mentioned(table, clean_question):
+            score += TABLE_NAME_BONUS
+        ranked.append({
+            "table": table,
+            "score": score,
+            "description": index['descriptions'].get(table, ""),
+            "columns": table_column_scores[:n_columns],
+        })
+
+    ranked.sort(key=lambda item: item['score'], reverse=True)
+    return ranked[:n_tables]
+
+
+def select_schema(ranked_tables, db_schema):
+    """
+    Builds the filtered schema for the SQL prompt from retrieve_tables results: the best table,
+    plus the next ones if their score is within TABLE_MARGIN. Wide tables keep their first
+    (key) column and their most relevant columns only.
+
+    Returns:
+        tuple: (filtered_schema dict, table descriptions string)
+    """
+    if not ranked_tables:
+        return {}, ""
+    best_score = ranked_tables[0]['score']
+    filtered_schema, descriptions = {}, []
+    for entry in ranked_tables:
+        if entry['score'] < best_score - TABLE_MARGIN:
+            break
+        all_columns = db_schema[entry['table']]
+        if len(all_columns) > MAX_FULL_COLUMNS:
+            keep = {all_columns[0]} | {column for column, _ in entry['columns']}
+            filtered_schema[entry['table']] = [column for column in all_columns if column in keep]
+        else:
+            filtered_schema[entry['table']] = all_columns
+        descriptions.append(f"{entry['table']}: {entry['description']}")
+    return filtered_schema, "\n".join(descriptions)
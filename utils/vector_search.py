@@ -0,0 +1,89 @@
+import numpy as np
+
+# Exact similarity search over an embedding matrix.
+# All chunks are scored with one matrix product, and only the best k are sorted.
+
+
+def top_k(matrix, query_vectors, k):
+    """
+    Scores every row of `matrix` against one or more query vectors.
+
+    Args:
+        matrix (np.ndarray): (n_chunks, dim) embedding matrix (a memmap works too).
+        query_vectors (array-like): one vector (dim,) or a batch (n_queries, dim).
+        k (int): number of results per query.
+
+    Returns:
+        tuple: (indices, scores), each (n_queries, k) and sorted best first.
+               For a single query vector, both are 1-D arrays of length k.
+    """
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    single = queries.ndim == 1
+    if single:
+        queries = queries[np.newaxis, :]
+
+    n_chunks = matrix.shape[0]
+    k = min(k, n_chunks)
+    if k <= 0:
+        empty_indices = np.zeros((queries.shape[0], 0), dtype=np.int64)
+        empty_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+        return (empty_indices[0], empty_scores[0]) if single else (empty_indices, empty_scores)
+
+    scores = queries @ np.asarray(matrix, dtype=np.float32).T
+
+    # argpartition puts the k best in front (unordered), then only those k are sorted
+    if k < n_chunks:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n_chunks), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    indices = np.take_along_axis(candidates, order, axis=1)
+    best_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    if single:
+        return indices[0], best_scores[0]
+    return indices, best_scores
+
+
+# How many candidates per result are taken from the quantized scores before exact rescoring
+RESCORE_FACTOR = 4
+# Rows of the quantized matrix converted to float32 at once while scoring. Small batches are
+# converted into one reused buffer that stays in the CPU cache (no float32 copy of the matrix).
+SCORE_BATCH_SIZE = 256
+
+
+def top_k_quantized(quantized, vectors, query_vector, k, rescore_factor=RESCORE_FACTOR):
+    """
+    Top-k search on a quantized matrix, followed by an exact float32 rescoring of the shortlist.
+
+    Args:
+        quantized (dict): {'codes', 'scales'} as created by vector_store.quantize.
+        vectors (np.ndarray): the float32 matrix (memmap), only the shortlisted rows are read.
+        query_vector (array-like): one query vector (dim,).
+        k (int): number of results.
+        rescore_factor (int): shortlist size as a multiple of k.
+
+    Returns:
+        tuple: (indices, scores) sorted best first, with exact float32 scores.
+    """
+    query = np.asarray(query_vector, dtype=np.float32)
+    codes, scales = quantized['codes'], quantized['scales']
+
+    approx_scores = np.empty(codes.shape[0], dtype=np.float32)
+    buffer = np.empty((min(SCORE_BATCH_SIZE, codes.shape[0]), codes.shape[1]), dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_BATCH_SIZE):
+        batch = codes[start:start + SCORE_BATCH_SIZE]
+        np.copyto(buffer[:len(batch)], batch, casting='unsafe')
+        np.dot(buffer[:len(batch)], query, out=approx_scores[start:start + len(batch)])
+    if scales is not None:
+        approx_scores *= scales
+
+    n_shortlist = min(k * rescore_factor, codes.shape[0])
+    if n_shortlist < codes.shape[0]:
+        shortlist = np.argpartition(-approx_scores, n_shortlist - 1)[:n_shortlist]
+    else:
+        shortlist = np.arange(codes.shape[0])
+    shortlist.sort()  # sequential reads from the memory-mapped matrix
+    local_indices, scores = top_k(vectors[shortlist], query, k)
+    return shortlist[local_indices], scores
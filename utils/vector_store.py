@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import glob
+import numpy as np
+
+# Binary vector store for the knowledge embeddings.
+# Each "knowledge/<name>.json" file gets a float32 matrix "knowledge/store/<name>.npy"
+# (opened with memory mapping, so the OS page cache is shared between server processes)
+# and a compact sidecar "knowledge/store/<name>.json" holding the names and contents.
+# An optional quantized copy of the matrix ("<name>.int8.npy" + per-vector scales, or "<name>.float16.npy")
+# is memory mapped too and searched first; the float32 matrix is then only read to rescore the shortlist.
+
+STORE_DIR_NAME = "store"
+
+# "int8" (4x smaller), "float16" (2x smaller) or None to search the float32 matrix directly.
+# Off by default: int8 scoring is about as fast as the exact float32 search (numpy has no int8
+# matrix product), it only pays off when the float32 pages don't fit in the page cache.
+QUANTIZATION = None
+# Rows converted at once when quantizing (keeps memory bounded for large stores)
+QUANTIZE_BATCH_SIZE = 16384
+
+# Loaded stores, keyed by the .npy path. Reused as long as the file on disk doesn't change.
+_loaded_stores = {}
+
+
+def store_paths(embedding_file):
+    """Returns the (matrix_path, metadata_path) pair used for a knowledge JSON file."""
+    folder, filename = os.path.split(embedding_file)
+    base = os.path.splitext(filename)[0]
+    store_dir = os.path.join(folder, STORE_DIR_NAME)
+    return os.path.join(store_dir, f"{base}.npy"), os.path.join(store_dir, f"{base}.json")
+
+
+def quantized_paths(embedding_file, mode=None):
+    """Returns the (codes_path, scales_path) of the quantized copy (QUANTIZATION by default). scales_path is None for float16."""
+    mode = mode or QUANTIZATION
+    matrix_path, _ = store_paths(embedding_file)
+    base = os.path.splitext(matrix_path)[0]
+    if mode == "int8":
+        return f"{base}.int8.npy", f"{base}.int8_scales.npy"
+    return f"{base}.{mode}.npy", None
+
+
+def quantize(vectors, mode=None):
+    """
+    Quantizes a float32 matrix (mode: QUANTIZATION by default).
+
+    Returns:
+        tuple: (codes, scales). For int8, row i is approximately codes[i] * scales[i];
+               for float16, scales is None.
+    """
+    mode = mode or QUANTIZATION
+    if mode == "float16":
+        return np.asarray(vectors, dtype=np.float16), None
+    if mode != "int8":
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(vectors.shape[0], dtype=np.float32)
+    for start in range(0, vectors.shape[0], QUANTIZE_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + QUANTIZE_BATCH_SIZE], dtype=np.float32)
+        batch_scales = np.abs(batch).max(axis=1) / 127.0
+        batch_scales[batch_scales == 0] = 1.0
+        codes[start:start + len(batch)] = np.round(batch / batch_scales[:, np.newaxis]).astype(np.int8)
+        scales[start:start + len(batch)] = batch_scales
+    return codes, scales
+
+
+def _write_quantized(vectors, embedding_file):
+    """Writes the quantized copy to temporary files and returns the (tmp_path, final_path) pairs."""
+    codes, scales = quantize(vectors)
+    codes_path, scales_path = quantized_paths(embedding_file)
+    written = []
+    for array, path in ((codes, codes_path), (scales, scales_path)):
+        if path is None:
+            continue
+        with open(path + ".tmp", 'wb') as outfile:
+            np.save(outfile, array)
+        written.append((path + ".tmp", path))
+    return written
+
+
+def _load_quantized(embedding_file):
+    """Opens the quantized copy (memory mapped), (re)creating it if it's missing or outdated."""
+    if QUANTIZATION is None:
+        return None
+    matrix_path, _ = store_paths(embedding_file)
+    codes_path, scales_path = quantized_paths(embedding_file)
+    needed = [path for path in (codes_path, scales_path) if path is not None]
+    if any(not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(matrix_path) for path in needed):
+        print(f"Quantizing {matrix_path} ({QUANTIZATION})...")
+        for tmp_path, path in _write_quantized(np.load(matrix_path, mmap_mode='r'), embedding_file):
+            os.replace(tmp_path, path)
+    return {
+        "mode": QUANTIZATION,
+        "codes": np.load(codes_path, mmap_mode='r'),
+        "scales": np.load(scales_path, mmap_mode='r') if scales_path else None,
+    }
+
+
+def store_is_fresh(embedding_file):
+    """True if the binary store exists and is not older than its JSON source."""
+    matrix_path, meta_path = store_paths(embedding_file)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        return False
+    if not os.path.exists(embedding_file):
+        return True
+    return os.path.getmtime(matrix_path) >= os.path.getmtime(embedding_file)
+
+
+def save_store(embeddings, embedding_file):
+    """
+    Writes a list of {'name', 'content', 'vector'} dicts as a binary store.
+
+    Args:
+        embeddings (list): Chunks in the same format as the knowledge JSON files.
+            An optional 'tag' per chunk (e.g. its topic) is kept as well.
+        embedding_file (str): The JSON path the store belongs to.
+
+    Returns:
+        str: The path of the written .npy matrix.
+    """
+    if embeddings:
+        vectors = np.asarray([chunk['vector'] for chunk in embeddings], dtype=np.float32)
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    return save_store_arrays(
+        vectors,
+        [chunk.get('name', '') for chunk in embeddings],
+        [chunk['content'] for chunk in embeddings],
+        [chunk.get('tag', '') for chunk in embeddings],
+        embedding_file
+    )
+
+
+def save_store_arrays(vectors, names, contents, tags, embedding_file, model=None):
+    """
+    Same as save_store, for a ready-made (n, dim) matrix and per-chunk metadata lists.
+    `model` (the embedding model of the vectors) is kept in the metadata when given.
+    """
+    matrix_path, meta_path = store_paths(embedding_file)
+    os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    metadata = {
+        "names": list(names),
+        "contents": list(contents),
+        "tags": list(tags),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+    }
+    if model:
+        metadata["model"] = model
+
+    # Write to temporary files first so a running server never maps a half-written store.
+    # The float32 matrix is written first, so the quantized copy is never older than it.
+    tmp_matrix_path = matrix_path + ".tmp"
+    with open(tmp_matrix_path, 'wb') as outfile:
+        np.save(outfile, vectors)
+    quantized_files = _write_quantized(vectors, embedding_file) if QUANTIZATION and vectors.size else []
+    with open(meta_path + ".tmp", 'w', encoding='utf-8') as outfile:
+        json.dump(metadata, outfile, ensure_ascii=False, separators=(',', ':'))
+    for tmp_path, path in quantized_files:
+        os.replace(tmp_path, path)
+    os.replace(meta_path + ".tmp", meta_path)
+    os.replace(tmp_matrix_path, matrix_path)
+
+    _loaded_stores.pop(matrix_path, None)
+    return matrix_path
+
+
+def load_store(embedding_file):
+    """
+    Opens the binary store of a knowledge file.
+
+    Returns:
+        dict: {'names': list, 'contents': list, 'tags': list, 'model': str or None,
+               'vectors': read-only float32 memmap (n, dim),
+               'quantized': {'mode', 'codes', 'scales'} or None}
+    """
+    matrix_path, meta_path = store_paths(embedding_file)
+    mtime = os.path.getmtime(matrix_path)
+
+    cached = _loaded_stores.get(matrix_path)
+    if cached is not None and cached['mtime'] == mtime:
+        return cached['store']
+
+    with open(meta_path, 'r', encoding='utf-8') as infile:
+        metadata = json.load(infile)
+    store = {
+        "names": metadata["names"],
+        "contents": metadata["contents"],
+        "tags": metadata.get("tags", [''] * len(metadata["names"])),
+        "model": metadata.get("model"),
+        "vectors": np.load(matrix_path, mmap_mode='r'),
+    }
+    store["quantized"] = _load_quantized(embedding_file) if store["vectors"].size else None
+    _loaded_stores[matrix_path] = {"mtime": mtime, "store": store}
+    return store
+
+
+def convert_json_to_store(embedding_file):
+    """Converts one knowledge JSON file (list of chunks with vectors) into a binary store."""
+    with open(embedding_file, 'r', encoding='utf8') as infile:
+        embeddings = json.load(infile)
+    return save_store(embeddings, embedding_file)
+
+
+# Converts every embedding file in the knowledge folder (or the files given as arguments).
+# Usage: python utils/vector_store.py [knowledge/file.json ...]
+if __name__ == "__main__":
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join("knowledge", "*.json")))
+    for embedding_file in files:
+        matrix_path = convert_json_to_store(embedding_file)
+        print(f"Converted {embedding_file} -> {matrix_path}")